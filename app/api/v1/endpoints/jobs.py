@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import Optional, Any
+from typing import List, Optional, Any
 
 from app.db.session import get_db
 from app.crud import crud_job
 from app.schemas import job as job_schema
+from app.services import embedding_index
 
 router = APIRouter()
 
@@ -39,6 +40,24 @@ def read_jobs(
     return result
 
 
+@router.get("/jobs/similar", response_model=List[job_schema.SimilarJob])
+def read_similar_jobs(
+    *,
+    db: Session = Depends(get_db),
+    job_id: int = Query(..., description="参照职位 ID"),
+    limit: int = Query(10, ge=1, le=100, description="返回数量")
+) -> Any:
+    """
+    基于职位向量的余弦相似度，返回与指定职位最相似的有效职位。
+    """
+    if not crud_job.get(db, id=job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    ranked = embedding_index.similar_jobs(db, job_id=job_id, k=limit)
+    scores = dict(ranked)
+    jobs = crud_job.get_by_ids(db, ids=[i for i, _ in ranked])
+    return [{"score": scores[job.id], "job": job} for job in jobs]
+
+
 @router.get("/jobs/{job_id}", response_model=job_schema.Job)
 def read_job(
     *, 
@@ -50,6 +69,5 @@ def read_job(
     """
     job = crud_job.get(db, id=job_id)
     if not job:
-        from fastapi import HTTPException
         raise HTTPException(status_code=404, detail="Job not found")
     return job
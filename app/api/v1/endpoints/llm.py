@@ -0,0 +1,62 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.crud import crud_llm_usage
+from app.db.session import get_db
+from app.schemas.llm_usage import LLMUsageReport, LLMUsageRun, LLMUsageSummary
+from app.services.llm_cache import CachedLLMClient
+from app.services.llm_client import get_llm_client
+from app.services.llm_metrics import UsageStats, process_usage, usage_by_profile
+from app.services.llm_router import RoutingLLMClient
+
+router = APIRouter()
+
+
+def _find_layer(client, cls):
+    """沿包装链 (.inner) 查找指定类型的客户端层。"""
+    while client is not None:
+        if isinstance(client, cls):
+            return client
+        client = getattr(client, "inner", None)
+    return None
+
+
+@router.get("/llm/usage", response_model=LLMUsageReport, summary="LLM 调用统计")
+def get_llm_usage(db: Session = Depends(get_db)):
+    """
+    返回本进程的实时调用统计（含缓存与路由状态），以及数据库中所有已记录运行
+    （包括 worker 进程中的匹配任务）的合计与按画像的合计。
+    """
+    try:
+        client = get_llm_client()
+    except ValueError:
+        client = None
+    cache = _find_layer(client, CachedLLMClient)
+    routing = _find_layer(client, RoutingLLMClient)
+    by_profile = usage_by_profile(crud_llm_usage.iter_runs(db, profiles_only=True))
+    return {
+        "process": process_usage.summary(),
+        "recorded": UsageStats.from_records(crud_llm_usage.iter_runs(db)).summary(),
+        "by_profile": [
+            {"user_profile_id": profile_id, "usage": usage.summary()}
+            for profile_id, usage in sorted(by_profile.items())
+        ],
+        "cache": cache.cache.summary() if cache else None,
+        "router": routing.summary() if routing else None,
+    }
+
+
+@router.get("/llm/usage/runs", response_model=List[LLMUsageRun], summary="最近运行的 LLM 调用统计")
+def get_llm_usage_runs(
+    profile_id: Optional[int] = Query(None, description="只返回该画像的运行"),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    return crud_llm_usage.get_runs(db, user_profile_id=profile_id, limit=limit)
+
+
+@router.get("/profiles/{profile_id}/llm-usage", response_model=LLMUsageSummary, summary="画像的 LLM 调用合计")
+def get_profile_llm_usage(profile_id: int, db: Session = Depends(get_db)):
+    return UsageStats.from_records(crud_llm_usage.iter_runs(db, user_profile_id=profile_id)).summary()
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-from app.db.session import get_db
-from app.crud import crud_user_profile, crud_job_match
+from typing import List, Optional
+import asyncio
+import json
+from app.db.session import get_db, SessionLocal
+from app.core.config import settings
+from app.crud import crud_job, crud_user_profile, crud_job_match, crud_match_task
+from app.schemas.job import SimilarJob
 from app.schemas.job_match import JobMatch
+from app.schemas.match_task import MatchTask
 from app.services.matching_service import MatchingService
+from app.services import embedding_index
 import logging
 
 router = APIRouter()
@@ -23,14 +30,35 @@ def get_recommendations(profile_id: int, db: Session = Depends(get_db)):
     return recommendations
 
 
+@router.get("/profiles/{profile_id}/similar-jobs", response_model=List[SimilarJob])
+def get_similar_jobs_for_profile(
+    profile_id: int,
+    limit: int = Query(20, ge=1, le=200, description="返回数量"),
+    db: Session = Depends(get_db)
+):
+    """
+    Retrieves the active jobs closest to the profile's skills and experience
+    in the local embedding index. No LLM calls are made.
+    """
+    profile = crud_user_profile.get(db, id=profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="User profile not found")
+
+    ranked = embedding_index.jobs_for_profile(db, profile_data=profile.structured_profile, k=limit)
+    scores = dict(ranked)
+    jobs = crud_job.get_by_ids(db, ids=[i for i, _ in ranked])
+    return [{"score": scores[job.id], "job": job} for job in jobs]
+
+
 @router.post("/profiles/{profile_id}/match", status_code=202)
 def trigger_matching(
     profile_id: int, 
-    background_tasks: BackgroundTasks,
+    top_k: Optional[int] = Query(None, ge=0, description="本地预排序后送入 LLM 打分的职位数量，0 表示全部"),
     db: Session = Depends(get_db)
 ):
     """
-    Triggers an asynchronous job matching task for a user profile.
+    Enqueues a job matching task for a user profile; it is executed by the
+    matching workers (`python -m app.worker`).
     """
     logging.info(f"Received request to trigger matching for profile_id: {profile_id}")
     
@@ -38,10 +66,83 @@ def trigger_matching(
     if not profile:
         raise HTTPException(status_code=404, detail="User profile not found")
     
-    # 使用后台任务运行匹配服务
-    matching_service = MatchingService(db)
-    background_tasks.add_task(matching_service.run_matching_for_profile, profile_id)
+    task = crud_match_task.enqueue(
+        db,
+        task_type=crud_match_task.TASK_TYPE_PROFILE,
+        payload={"profile_id": profile_id, "top_k": top_k},
+        max_attempts=settings.MATCHING_TASK_MAX_ATTEMPTS
+    )
     
-    logging.info(f"Matching task for profile {profile_id} has been added to background tasks.")
+    logging.info(f"Matching task {task.id} for profile {profile_id} has been enqueued.")
     
-    return {"message": "Job matching task has been triggered."}
+    return {"message": "Job matching task has been triggered.", "task_id": task.id}
+
+
+@router.get("/matching/tasks/{task_id}", response_model=MatchTask)
+def get_matching_task(task_id: int, db: Session = Depends(get_db)):
+    """
+    Returns the status of a queued matching task.
+    """
+    task = crud_match_task.get(db, id=task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Matching task not found")
+    return task
+
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/profiles/{profile_id}/match/stream")
+async def stream_matching(
+    profile_id: int,
+    top_k: Optional[int] = Query(None, ge=0, description="本地预排序后送入 LLM 打分的职位数量，0 表示全部"),
+    db: Session = Depends(get_db)
+):
+    """
+    Runs job matching for a user profile and streams it over Server-Sent Events:
+    a `match` event per scored job, `progress` events (done, total, failed,
+    cached, eta_seconds) and a final `done` (or `failed`) event.
+    The LLM calls run on the event loop; database access and BM25 pre-ranking
+    run in worker threads so other requests are not blocked.
+    """
+    profile = await asyncio.to_thread(crud_user_profile.get, db, id=profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="User profile not found")
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_matching():
+        # 流式响应的生命周期比请求依赖更长，使用独立的数据库会话；
+        # 会话在线程中提交后不使已加载的对象过期，事件循环中读取职位字段时不会触发查询
+        run_db = SessionLocal(expire_on_commit=False)
+        try:
+            service = MatchingService(
+                run_db, on_event=lambda event, data: queue.put_nowait((event, data)), offload_blocking=True
+            )
+            stats = await service.arun_matching_for_profile(profile_id, top_k=top_k)
+            queue.put_nowait(("done", {**service.progress, **(stats or {})}))
+        except Exception as e:
+            logging.error(f"Streaming match for profile {profile_id} failed: {e}")
+            queue.put_nowait(("failed", {"detail": str(e)}))
+        finally:
+            run_db.close()
+            queue.put_nowait(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run_matching())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                yield _format_sse(*item)
+        finally:
+            # 客户端断开时停止匹配
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
\ No newline at end of file
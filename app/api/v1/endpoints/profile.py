@@ -1,60 +1,207 @@
-import io
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+import asyncio
+import json
+import logging
+import uuid
+from typing import Dict
+
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-import docx
-import pypdf
 
-from app.db.session import get_db
-from app.services.llm_client import get_llm_client, LLMClient
-from app.crud import crud_user_profile
+from app.db.session import get_db, SessionLocal
+from app.services.llm_client import get_llm_client, LLMClient, is_json_object, parse_json_response
+from app.services.llm_cache import cache_only_valid, no_cache
+from app.services import resume_parser
+from app.services.llm_metrics import UsageStats, log_usage, track_llm_usage
+from app.crud import crud_user_profile, crud_llm_usage
 from app.schemas import user_profile as user_profile_schema
 
 router = APIRouter()
 
+# 相同内容的简历同时上传时（例如前端重试），只让一个请求调用 LLM，其余请求等待后复用结果
+_analysis_locks: Dict[str, asyncio.Lock] = {}
+
 @router.post("/profile/upload", response_model=user_profile_schema.UserProfile, summary="上传简历文件进行分析")
 async def upload_resume(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    llm_client: LLMClient = Depends(get_llm_client)
+    llm_client: LLMClient = Depends(get_llm_client),
+    refresh: bool = Query(False, description="忽略已有的分析结果，重新调用 LLM")
 ):
     """
     上传简历文件（PDF 或 DOCX），提取文本内容，
     使用 LLM 进行分析，并将原始文本和分析结果存入数据库。
+    文件内容或归一化后的文本与已有画像相同时直接返回已有画像，不再调用 LLM。
     """
-    content = ""
+    if file.content_type not in resume_parser.SUPPORTED_CONTENT_TYPES:
+        raise HTTPException(status_code=400, detail="不支持的文件类型。请上传 PDF 或 DOCX 文件。")
+
     try:
         file_bytes = await file.read()
-        if file.content_type == "application/pdf":
-            with io.BytesIO(file_bytes) as pdf_file:
-                reader = pypdf.PdfReader(pdf_file)
-                for page in reader.pages:
-                    content += page.extract_text() or ""
-        elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            with io.BytesIO(file_bytes) as doc_file:
-                doc = docx.Document(doc_file)
-                for para in doc.paragraphs:
-                    content += para.text + "\n"
-        else:
-            raise HTTPException(status_code=400, detail="不支持的文件类型。请上传 PDF 或 DOCX 文件。")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"文件读取或解析失败: {e}")
 
-        if not content.strip():
-            raise HTTPException(status_code=400, detail="无法从文件中提取任何文本内容。")
+    file_hash = resume_parser.file_fingerprint(file_bytes)
+    if not refresh:
+        # 同一个文件：无需解析
+        existing = crud_user_profile.get_by_file_hash(db, file_hash=file_hash)
+        if existing:
+            return existing
 
+    try:
+        content = resume_parser.extract_text(file_bytes, file.content_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件读取或解析失败: {e}")
 
+    if not content.strip():
+        raise HTTPException(status_code=400, detail="无法从文件中提取任何文本内容。")
+
+    content_hash = resume_parser.content_fingerprint(content)
+    lock = _analysis_locks.setdefault(content_hash, asyncio.Lock())
     try:
-        # 调用 LLM 分析
-        structured_data = await llm_client.analyze(content)
+        async with lock:
+            if not refresh:
+                # 不同文件、相同文本（例如重新导出的简历）
+                existing = crud_user_profile.get_by_content_hash(db, content_hash=content_hash)
+                if existing:
+                    return existing
+
+            try:
+                # 调用 LLM 分析
+                with track_llm_usage() as usage:
+                    if refresh:
+                        with no_cache():
+                            structured_data = await llm_client.analyze(content)
+                    else:
+                        structured_data = await llm_client.analyze(content)
 
-        # 创建数据库条目
-        profile_in = user_profile_schema.UserProfileCreate(
-            raw_content=content,
-            structured_profile=structured_data
+                # 创建数据库条目
+                profile_in = user_profile_schema.UserProfileCreate(
+                    raw_content=content,
+                    structured_profile=structured_data
+                )
+                created = crud_user_profile.create_user_profile(
+                    db, obj_in=profile_in, file_hash=file_hash, content_hash=content_hash
+                )
+                _record_analysis_usage(db, usage, created.id)
+                return created
+
+            except Exception as e:
+                # 这里的异常可能来自 LLM API 调用或数据库操作
+                raise HTTPException(status_code=500, detail=f"处理文件或调用LLM时出错: {e}")
+    finally:
+        if not lock.locked() and _analysis_locks.get(content_hash) is lock:
+            _analysis_locks.pop(content_hash, None)
+
+
+def _record_analysis_usage(db: Session, usage: UsageStats, profile_id: int):
+    """记录一次简历分析的 LLM 调用统计，失败不影响上传结果。"""
+    if not usage.calls:
+        return
+    run_id = f"resume-{uuid.uuid4().hex}"
+    log_usage("llm_run_usage", usage, run_id=run_id, purpose=crud_llm_usage.PURPOSE_RESUME_ANALYSIS, profile_id=profile_id)
+    try:
+        crud_llm_usage.create(
+            db, run_id=run_id, purpose=crud_llm_usage.PURPOSE_RESUME_ANALYSIS, usage=usage.to_record(), user_profile_id=profile_id
         )
-        created_profile = crud_user_profile.create_user_profile(db, obj_in=profile_in)
-        return created_profile
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Failed to save LLM usage for profile {profile_id}: {e}")
+
+
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
+@router.post("/profile/upload/stream", summary="上传简历文件并流式返回分析过程")
+async def upload_resume_stream(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    llm_client: LLMClient = Depends(get_llm_client),
+    refresh: bool = Query(False, description="忽略已有的分析结果，重新调用 LLM")
+):
+    """
+    与 /profile/upload 相同，但通过 Server-Sent Events 返回：LLM 生成过程中
+    逐段发送 `chunk` 事件 ({"text": ...})，生成结束后校验 JSON 并保存画像，
+    发送 `profile` 事件；出错时发送 `failed` 事件。
+    已分析过的简历直接发送 `profile` 事件 ({"reused": true, ...})。
+    """
+    if file.content_type not in resume_parser.SUPPORTED_CONTENT_TYPES:
+        raise HTTPException(status_code=400, detail="不支持的文件类型。请上传 PDF 或 DOCX 文件。")
+
+    try:
+        file_bytes = await file.read()
+        file_hash = resume_parser.file_fingerprint(file_bytes)
+        existing = None if refresh else crud_user_profile.get_by_file_hash(db, file_hash=file_hash)
+        content = "" if existing else resume_parser.extract_text(file_bytes, file.content_type)
     except Exception as e:
-        # 这里的异常可能来自 LLM API 调用或数据库操作
-        raise HTTPException(status_code=500, detail=f"处理文件或调用LLM时出错: {e}")
+        raise HTTPException(status_code=500, detail=f"文件读取或解析失败: {e}")
+
+    if not existing:
+        if not content.strip():
+            raise HTTPException(status_code=400, detail="无法从文件中提取任何文本内容。")
+        content_hash = resume_parser.content_fingerprint(content)
+        if not refresh:
+            existing = crud_user_profile.get_by_content_hash(db, content_hash=content_hash)
+
+    if existing:
+        profile_data = user_profile_schema.UserProfile.model_validate(existing, from_attributes=True).model_dump()
+
+        async def reused_stream():
+            yield _format_sse("profile", {"reused": True, **profile_data})
+
+        return _sse_response(reused_stream())
+
+    async def event_stream():
+        parts = []
+        try:
+            # 无法解析的结果不缓存，下次分析重新请求
+            with track_llm_usage() as usage, cache_only_valid(is_json_object):
+                if refresh:
+                    with no_cache():
+                        async for chunk in llm_client.analyze_stream(content):
+                            parts.append(chunk)
+                            yield _format_sse("chunk", {"text": chunk})
+                else:
+                    async for chunk in llm_client.analyze_stream(content):
+                        parts.append(chunk)
+                        yield _format_sse("chunk", {"text": chunk})
+
+            # 完整文本拼接后再校验 JSON
+            structured_data = parse_json_response("".join(parts))
+            if not isinstance(structured_data, dict):
+                raise ValueError("LLM 返回的不是 JSON 对象")
+        except Exception as e:
+            logging.error(f"Streaming resume analysis failed: {e}")
+            yield _format_sse("failed", {"detail": f"处理文件或调用LLM时出错: {e}"})
+            return
+
+        # 流式响应的生命周期比请求依赖更长，使用独立的数据库会话
+        run_db = SessionLocal()
+        try:
+            profile_in = user_profile_schema.UserProfileCreate(
+                raw_content=content,
+                structured_profile=structured_data
+            )
+            created = crud_user_profile.create_user_profile(
+                run_db, obj_in=profile_in, file_hash=file_hash, content_hash=content_hash
+            )
+            profile_data = user_profile_schema.UserProfile.model_validate(created, from_attributes=True).model_dump()
+            _record_analysis_usage(run_db, usage, created.id)
+        except Exception as e:
+            logging.error(f"Saving streamed resume analysis failed: {e}")
+            yield _format_sse("failed", {"detail": f"保存画像时出错: {e}"})
+            return
+        finally:
+            run_db.close()
+        yield _format_sse("profile", {"reused": False, **profile_data})
+
+    return _sse_response(event_stream())
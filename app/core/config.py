@@ -17,6 +17,94 @@ class Settings(BaseSettings):
     LLM_MODEL_NAME: str = os.getenv("LLM_MODEL_NAME", "gemini-1.5-pro-latest")
     LLM_API_KEY: str = os.getenv("LLM_API_KEY")
     LLM_API_BASE_URL: str | None = os.getenv("LLM_API_BASE_URL")
+    # 每个 LLM 服务商允许同时进行的请求数上限
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+    # LLM HTTP 连接池：所有请求共享一个连接池，复用 TCP/TLS 连接
+    LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 20))
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", 10))
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 60)) # 空闲连接保留秒数
+    LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+    LLM_HTTP_TIMEOUT: float = float(os.getenv("LLM_HTTP_TIMEOUT", 120)) # 单次请求超时秒数
+    # LLM 限流与重试：令牌桶 (0 表示不限)、指数退避、AIMD 并发下限与熔断器
+    LLM_RATE_LIMIT_RPM: float = float(os.getenv("LLM_RATE_LIMIT_RPM", 0)) # 每分钟请求数上限
+    LLM_RATE_LIMIT_TPM: float = float(os.getenv("LLM_RATE_LIMIT_TPM", 0)) # 每分钟提示词 token 数上限 (估算值)
+    LLM_RETRY_MAX_ATTEMPTS: int = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", 4)) # 含首次请求的最大尝试次数
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", 1)) # 首次重试的最大等待秒数，之后倍增
+    LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", 60))
+    LLM_MIN_CONCURRENCY: int = int(os.getenv("LLM_MIN_CONCURRENCY", 1)) # 限流时并发数下调的下限
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", 5)) # 连续失败多少次后熔断，0 表示关闭
+    LLM_CIRCUIT_RECOVERY_SECONDS: float = float(os.getenv("LLM_CIRCUIT_RECOVERY_SECONDS", 30)) # 熔断后多久放行探测请求
+    # LLM 响应缓存：相同提示词直接返回已缓存的响应 (0 表示不限制)
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 50000))
+    LLM_CACHE_MAX_MB: float = float(os.getenv("LLM_CACHE_MAX_MB", 200))
+    LLM_CACHE_MAX_AGE_DAYS: float = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", 30))
+    # 多后端路由：JSON 数组，每项可指定 name/provider/model/api_key/base_url/weight/max_concurrency，
+    # 为空时只使用上面的单一服务商。开启对冲后，超过后端 p95 延迟的请求会向另一个后端重复发送
+    LLM_BACKENDS: str = os.getenv("LLM_BACKENDS", "")
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20)) # 后端积累多少个延迟样本后才开始对冲
+    # 每百万 token 的价格，用于估算每次匹配与每个画像的 LLM 成本，0 表示不估算
+    LLM_PRICE_INPUT_PER_1M: float = float(os.getenv("LLM_PRICE_INPUT_PER_1M", 0))
+    LLM_PRICE_OUTPUT_PER_1M: float = float(os.getenv("LLM_PRICE_OUTPUT_PER_1M", 0))
+    # 本地模拟服务商 (LLM_PROVIDER=fake)：延迟中位数与离散程度、503 错误率、随机 429 比例，
+    # 以及每 N 次调用中最后 M 次返回 429 (模拟突发限流)
+    FAKE_LLM_LATENCY_MS: float = float(os.getenv("FAKE_LLM_LATENCY_MS", 800))
+    FAKE_LLM_LATENCY_SIGMA: float = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", 0.5))
+    FAKE_LLM_ERROR_RATE: float = float(os.getenv("FAKE_LLM_ERROR_RATE", 0))
+    FAKE_LLM_RATE_LIMIT_RATE: float = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", 0))
+    FAKE_LLM_429_BURST_EVERY: int = int(os.getenv("FAKE_LLM_429_BURST_EVERY", 0))
+    FAKE_LLM_429_BURST_LENGTH: int = int(os.getenv("FAKE_LLM_429_BURST_LENGTH", 0))
+
+    # Matching settings
+    # 本地预排序后送入 LLM 打分的职位数量，0 表示不做预排序
+    MATCHING_PRERANK_TOP_K: int = int(os.getenv("MATCHING_PRERANK_TOP_K", 200))
+    # 每次 LLM 请求打分的职位数，1 表示逐个职位打分
+    MATCHING_BATCH_SIZE: int = int(os.getenv("MATCHING_BATCH_SIZE", 1))
+    # 批量提示词的字符上限，应根据模型上下文长度调整
+    MATCHING_BATCH_MAX_PROMPT_CHARS: int = int(os.getenv("MATCHING_BATCH_MAX_PROMPT_CHARS", 60000))
+    # 匹配结果攒够多少条后批量写入数据库
+    MATCHING_WRITE_BATCH_SIZE: int = int(os.getenv("MATCHING_WRITE_BATCH_SIZE", 100))
+    # 提示词各部分的 token 预算，超出时截断
+    PROMPT_PROFILE_TOKEN_BUDGET: int = int(os.getenv("PROMPT_PROFILE_TOKEN_BUDGET", 1500))
+    PROMPT_JOB_RESPONSIBILITIES_TOKEN_BUDGET: int = int(os.getenv("PROMPT_JOB_RESPONSIBILITIES_TOKEN_BUDGET", 600))
+    PROMPT_JOB_REQUIREMENTS_TOKEN_BUDGET: int = int(os.getenv("PROMPT_JOB_REQUIREMENTS_TOKEN_BUDGET", 600))
+
+    # Embedding settings
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "hashing") # 职位向量化方式，hashing 为完全离线实现
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", 512))
+    EMBEDDING_INDEX_DIR: str = os.getenv("EMBEDDING_INDEX_DIR", "data/embeddings") # 向量矩阵文件所在目录
+
+    # Matching worker settings
+    MATCHING_WORKERS: int = int(os.getenv("MATCHING_WORKERS", 2)) # worker 进程数
+    MATCHING_TASK_LEASE_SECONDS: int = int(os.getenv("MATCHING_TASK_LEASE_SECONDS", 300)) # 任务租约时长
+    MATCHING_TASK_MAX_ATTEMPTS: int = int(os.getenv("MATCHING_TASK_MAX_ATTEMPTS", 3)) # 最大尝试次数
+    MATCHING_TASK_RETRY_DELAY_SECONDS: int = int(os.getenv("MATCHING_TASK_RETRY_DELAY_SECONDS", 30)) # 首次重试延迟，之后按次数倍增
+    MATCHING_WORKER_POLL_SECONDS: float = float(os.getenv("MATCHING_WORKER_POLL_SECONDS", 2)) # 队列为空时的轮询间隔
+
+    # Scraper Configuration
+    SCRAPER_DETAIL_CONCURRENCY: int = int(os.getenv("SCRAPER_DETAIL_CONCURRENCY", 4)) # 并发抓取详情页的页面数
+    SCRAPER_REQUESTS_PER_SECOND: float = float(os.getenv("SCRAPER_REQUESTS_PER_SECOND", 2)) # 对同一域名的请求速率上限，0 表示不限速
+    SCRAPER_SNAPSHOT_PAGE_SIZE: int = int(os.getenv("SCRAPER_SNAPSHOT_PAGE_SIZE", 100)) # 列表接口每页条数，服务端限制更小时按实际返回条数
+    SCRAPER_SNAPSHOT_CONCURRENCY: int = int(os.getenv("SCRAPER_SNAPSHOT_CONCURRENCY", 4)) # 并发请求的列表页数
+    SCRAPER_SNAPSHOT_MAX_ATTEMPTS: int = int(os.getenv("SCRAPER_SNAPSHOT_MAX_ATTEMPTS", 3)) # 单个列表页的最大尝试次数
+    SCRAPER_WRITE_BATCH_SIZE: int = int(os.getenv("SCRAPER_WRITE_BATCH_SIZE", 200)) # 职位批量写入并提交的条数
+    # 浏览器请求拦截：启用拦截的爬虫不加载下列资源类型与域名 (逗号分隔)，允许列表优先于禁止列表
+    SCRAPER_BLOCK_RESOURCES: bool = os.getenv("SCRAPER_BLOCK_RESOURCES", "true").lower() in ("1", "true", "yes")
+    SCRAPER_BLOCKED_RESOURCE_TYPES: str = os.getenv("SCRAPER_BLOCKED_RESOURCE_TYPES", "image,media,font,stylesheet")
+    SCRAPER_ALLOWED_RESOURCE_TYPES: str = os.getenv("SCRAPER_ALLOWED_RESOURCE_TYPES", "")
+    SCRAPER_BLOCKED_DOMAINS: str = os.getenv(
+        "SCRAPER_BLOCKED_DOMAINS", "google-analytics.com,googletagmanager.com,hm.baidu.com,cnzz.com,growingio.com"
+    )
+    SCRAPER_ALLOWED_DOMAINS: str = os.getenv("SCRAPER_ALLOWED_DOMAINS", "")
+    SCRAPER_SELECTOR_TIMEOUT: int = int(os.getenv("SCRAPER_SELECTOR_TIMEOUT", 15000)) # 等待详情页字段出现的毫秒数
+    # 应用启动时创建的浏览器池，爬虫从中借用浏览器上下文，不必每次启动 Chromium
+    SCRAPER_BROWSER_POOL_ENABLED: bool = os.getenv("SCRAPER_BROWSER_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+    SCRAPER_BROWSER_POOL_SIZE: int = int(os.getenv("SCRAPER_BROWSER_POOL_SIZE", 1)) # 池中的浏览器数
+    SCRAPER_BROWSER_MAX_PAGES: int = int(os.getenv("SCRAPER_BROWSER_MAX_PAGES", 500)) # 浏览器打开多少个页面后重启，0 表示不限
+    SCRAPER_BROWSER_MAX_MEMORY_MB: float = float(os.getenv("SCRAPER_BROWSER_MAX_MEMORY_MB", 2048)) # 浏览器进程总内存上限，0 表示不检查
+    SCRAPER_BROWSER_HEALTH_CHECK_SECONDS: float = float(os.getenv("SCRAPER_BROWSER_HEALTH_CHECK_SECONDS", 60)) # 健康检查间隔，0 表示关闭
 
     class Config:
         env_file = ".env"
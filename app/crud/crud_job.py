@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, asc, func
+from sqlalchemy import desc, asc, func, insert, update
 from app.models.job import Job
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Set
 
 def get(db: Session, *, id: int) -> Optional[Job]:
     """
@@ -9,6 +9,48 @@ def get(db: Session, *, id: int) -> Optional[Job]:
     """
     return db.query(Job).filter(Job.id == id).first()
 
+def get_by_ids(db: Session, *, ids: List[int]) -> List[Job]:
+    """
+    按给定 ID 顺序获取职位，不存在的 ID 会被忽略。
+    """
+    if not ids:
+        return []
+    jobs_by_id = {job.id: job for job in db.query(Job).filter(Job.id.in_(ids)).all()}
+    return [jobs_by_id[i] for i in ids if i in jobs_by_id]
+
+def get_existing_urls(db: Session, *, urls: Iterable[str]) -> Set[str]:
+    """
+    返回给定 URL 中已存在于数据库的部分（一次查询）。
+    """
+    urls = list(urls)
+    if not urls:
+        return set()
+    return {url for (url,) in db.query(Job.url).filter(Job.url.in_(urls))}
+
+def bulk_write(db: Session, *, inserts: List[Dict[str, Any]], updates: List[Dict[str, Any]]) -> None:
+    """
+    写入一批职位并提交：inserts 为新职位的列值，使用多行 INSERT；
+    updates 为带主键 id 的已有职位列值（各行的列可以不同），按主键批量 UPDATE。
+    """
+    if inserts:
+        db.execute(insert(Job), inserts)
+    # 按主键批量更新要求同一次执行的行具有相同的列，按列分组执行
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in updates:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for rows in groups.values():
+        db.execute(update(Job), rows)
+    db.commit()
+
+def get_all(db: Session, *, is_active: Optional[bool] = None) -> List[Job]:
+    """
+    获取全部职位（不分页），供匹配等需要完整语料的流程使用。
+    """
+    query = db.query(Job)
+    if is_active is not None:
+        query = query.filter(Job.is_active == is_active)
+    return query.order_by(Job.id).all()
+
 def get_multi(
     db: Session, 
     *, 
@@ -1,19 +1,137 @@
 from sqlalchemy.orm import Session, joinedload
-from typing import List
+from sqlalchemy.sql import func
+from typing import Dict, Iterable, List, Optional
+import weakref
+from app.db.migrations import job_match_schema_problems
 from app.models.job_match import JobMatch
 from app.schemas.job_match import JobMatchCreate
 
+# 冲突时（同一画像与职位已有结果）需要覆盖的列
+UPSERT_COLUMNS = (
+    "match_score", "match_summary", "improvement_suggestions",
+    "profile_fingerprint", "job_fingerprint", "is_stale",
+)
+
+def _to_row(obj_in: JobMatchCreate) -> Dict:
+    return {
+        "user_profile_id": obj_in.user_profile_id,
+        "job_id": obj_in.job_id,
+        "match_score": obj_in.match_score,
+        "match_summary": obj_in.match_summary,
+        "improvement_suggestions": obj_in.improvement_suggestions,
+        "profile_fingerprint": obj_in.profile_fingerprint,
+        "job_fingerprint": obj_in.job_fingerprint,
+        "is_stale": False,
+    }
+
+# 已确认表结构为最新的数据库引擎，每个引擎只检查一次
+_checked_engines = weakref.WeakSet()
+
+def _check_schema(db: Session):
+    """
+    旧版本创建的 job_matches 表缺少新列或唯一约束时明确报错：没有唯一约束时
+    MySQL 的 ON DUPLICATE KEY UPDATE 不会报错，而是静默地插入重复结果。
+    """
+    engine = db.get_bind().engine
+    if engine in _checked_engines:
+        return
+    problems = job_match_schema_problems(db.connection())
+    if problems:
+        raise RuntimeError(f"job_matches 表结构已过期（{'；'.join(problems)}），请先运行 python migrate_db.py")
+    _checked_engines.add(engine)
+
+def _upsert_statement(dialect_name: str, rows: List[Dict]):
+    """生成方言相关的多行 upsert 语句，不支持的方言返回 None。"""
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(JobMatch).values(rows)
+        update = {col: stmt.inserted[col] for col in UPSERT_COLUMNS}
+        update["created_at"] = func.now()
+        return stmt.on_duplicate_key_update(update)
+    if dialect_name in ("sqlite", "postgresql"):
+        if dialect_name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(JobMatch).values(rows)
+        update = {col: stmt.excluded[col] for col in UPSERT_COLUMNS}
+        update["created_at"] = func.now()
+        return stmt.on_conflict_do_update(index_elements=["user_profile_id", "job_id"], set_=update)
+    return None
+
+def bulk_upsert(db: Session, *, objs_in: Iterable[JobMatchCreate], chunk_size: int = 500) -> int:
+    """
+    批量写入匹配结果：按 (user_profile_id, job_id) 插入或覆盖，
+    每个分块一条多行语句，全部写完后提交一次。返回写入的行数。
+    """
+    # 同一批中相同的画像与职位只保留最后一个结果
+    rows = list({(r["user_profile_id"], r["job_id"]): r for r in map(_to_row, objs_in)}.values())
+    if not rows:
+        return 0
+
+    _check_schema(db)
+    dialect_name = db.get_bind().dialect.name
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        stmt = _upsert_statement(dialect_name, chunk)
+        if stmt is not None:
+            db.execute(stmt)
+            continue
+        # 其他数据库：逐行查询后更新或插入
+        for row in chunk:
+            existing = db.query(JobMatch).filter(
+                JobMatch.user_profile_id == row["user_profile_id"], JobMatch.job_id == row["job_id"]
+            ).first()
+            if existing:
+                for col in UPSERT_COLUMNS:
+                    setattr(existing, col, row[col])
+            else:
+                db.add(JobMatch(**row))
+    db.commit()
+    return len(rows)
+
 def create(db: Session, *, obj_in: JobMatchCreate) -> JobMatch:
-    db_obj = JobMatch(
-        user_profile_id=obj_in.user_profile_id,
-        job_id=obj_in.job_id,
-        match_score=obj_in.match_score,
-        match_summary=obj_in.match_summary
-    )
-    db.add(db_obj)
+    bulk_upsert(db, objs_in=[obj_in])
+    return db.query(JobMatch).filter(
+        JobMatch.user_profile_id == obj_in.user_profile_id, JobMatch.job_id == obj_in.job_id
+    ).first()
+
+def get_by_profile_id(db: Session, *, profile_id: int, include_stale: bool = False) -> List[JobMatch]:
+    query = db.query(JobMatch).options(joinedload(JobMatch.job, innerjoin=True)).filter(JobMatch.user_profile_id == profile_id)
+    if not include_stale:
+        query = query.filter(JobMatch.is_stale == False)
+    return query.all()
+
+def mark_stale(db: Session, *, job_ids: Iterable[int], is_stale: bool = True, profile_id: Optional[int] = None) -> int:
+    """
+    将指定职位的匹配结果标记为过期（或恢复为有效），返回受影响的行数。
+    """
+    job_ids = list(job_ids)
+    if not job_ids:
+        return 0
+    query = db.query(JobMatch).filter(JobMatch.job_id.in_(job_ids), JobMatch.is_stale != is_stale)
+    if profile_id is not None:
+        query = query.filter(JobMatch.user_profile_id == profile_id)
+    count = query.update({'is_stale': is_stale}, synchronize_session=False)
     db.commit()
-    db.refresh(db_obj)
-    return db_obj
+    return count
+
 
-def get_by_profile_id(db: Session, *, profile_id: int) -> List[JobMatch]:
-    return db.query(JobMatch).options(joinedload(JobMatch.job, innerjoin=True)).filter(JobMatch.user_profile_id == profile_id).all()
+def get_cached(db: Session, *, profile_fingerprint: str, job_fingerprints: Iterable[str]) -> Dict[str, JobMatch]:
+    """
+    按内容指纹查找已有的匹配结果，返回 job_fingerprint -> 最新的 JobMatch。
+    """
+    job_fingerprints = list(set(job_fingerprints))
+    if not job_fingerprints:
+        return {}
+    rows = (
+        db.query(JobMatch)
+        .filter(
+            JobMatch.profile_fingerprint == profile_fingerprint,
+            JobMatch.job_fingerprint.in_(job_fingerprints)
+        )
+        .order_by(JobMatch.id)
+        .all()
+    )
+    # 按 id 升序遍历，后写入的结果覆盖旧结果
+    return {row.job_fingerprint: row for row in rows}
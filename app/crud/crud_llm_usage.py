@@ -0,0 +1,42 @@
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.models.llm_usage import LLMUsage
+
+PURPOSE_MATCHING = "matching"
+PURPOSE_RESUME_ANALYSIS = "resume_analysis"
+
+def create(
+    db: Session, *, run_id: str, purpose: str, usage: Dict[str, Any],
+    user_profile_id: Optional[int] = None, wall_seconds: Optional[float] = None
+) -> LLMUsage:
+    """
+    保存一次运行的 LLM 调用汇总。usage 为各统计列的值 (见 llm_metrics.UsageStats.to_record)。
+    """
+    db_obj = LLMUsage(
+        run_id=run_id,
+        purpose=purpose,
+        user_profile_id=user_profile_id,
+        wall_seconds=wall_seconds,
+        **usage,
+    )
+    db.add(db_obj)
+    db.commit()
+    db.refresh(db_obj)
+    return db_obj
+
+def get_runs(db: Session, *, user_profile_id: Optional[int] = None, limit: int = 50) -> List[LLMUsage]:
+    """最近的运行记录，按时间倒序。"""
+    query = db.query(LLMUsage)
+    if user_profile_id is not None:
+        query = query.filter(LLMUsage.user_profile_id == user_profile_id)
+    return query.order_by(LLMUsage.id.desc()).limit(limit).all()
+
+def iter_runs(db: Session, *, user_profile_id: Optional[int] = None, profiles_only: bool = False) -> Iterator[LLMUsage]:
+    """分批遍历所有（或某个画像的）运行记录，profiles_only 时不含未关联画像的记录。"""
+    query = db.query(LLMUsage)
+    if user_profile_id is not None:
+        query = query.filter(LLMUsage.user_profile_id == user_profile_id)
+    elif profiles_only:
+        query = query.filter(LLMUsage.user_profile_id.isnot(None))
+    return iter(query.yield_per(500))
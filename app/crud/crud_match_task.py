@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session
+from typing import Any, Dict, Optional
+
+from app.models.match_task import MatchTask
+
+TASK_TYPE_PROFILE = "profile"
+TASK_TYPE_INCREMENTAL = "incremental"
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+def _leasable(now: datetime):
+    # 等待中且已到可执行时间的任务，或租约已过期（worker 崩溃）且还有尝试次数的运行中任务
+    return or_(
+        and_(MatchTask.status == "pending", MatchTask.available_at <= now),
+        and_(
+            MatchTask.status == "running", MatchTask.leased_until < now,
+            MatchTask.attempts < MatchTask.max_attempts,
+        ),
+    )
+
+def fail_exhausted_leases(db: Session) -> int:
+    """
+    将租约已过期且尝试次数用完的运行中任务标记为 failed（例如每次执行都会让 worker 崩溃的任务），
+    避免被无限次重新领取。返回受影响的任务数。
+    """
+    updated = (
+        db.query(MatchTask)
+        .filter(
+            MatchTask.status == "running", MatchTask.leased_until < _now(),
+            MatchTask.attempts >= MatchTask.max_attempts,
+        )
+        .update({
+            "status": "failed",
+            "leased_until": None,
+            "last_error": "Lease expired on the last attempt (worker crashed or timed out).",
+        }, synchronize_session=False)
+    )
+    db.commit()
+    return updated
+
+def get(db: Session, *, id: int) -> Optional[MatchTask]:
+    return db.query(MatchTask).filter(MatchTask.id == id).first()
+
+def enqueue(db: Session, *, task_type: str, payload: Dict[str, Any], max_attempts: int = 3) -> MatchTask:
+    """
+    将一个匹配任务加入队列。
+    """
+    db_obj = MatchTask(
+        task_type=task_type,
+        payload=payload,
+        status="pending",
+        attempts=0,
+        max_attempts=max_attempts,
+        available_at=_now()
+    )
+    db.add(db_obj)
+    db.commit()
+    db.refresh(db_obj)
+    return db_obj
+
+def lease(db: Session, *, worker_id: str, lease_seconds: int) -> Optional[MatchTask]:
+    """
+    领取一个可执行的任务并加上租约。
+    通过带条件的 UPDATE 实现抢占，多个 worker 进程同时领取时只有一个会成功。
+    """
+    fail_exhausted_leases(db)
+    now = _now()
+    candidates = (
+        db.query(MatchTask.id)
+        .filter(_leasable(now))
+        .order_by(MatchTask.available_at, MatchTask.id)
+        .limit(5)
+        .all()
+    )
+    for (task_id,) in candidates:
+        updated = (
+            db.query(MatchTask)
+            .filter(MatchTask.id == task_id, _leasable(now))
+            .update({
+                "status": "running",
+                "lease_owner": worker_id,
+                "leased_until": now + timedelta(seconds=lease_seconds),
+                "attempts": MatchTask.attempts + 1,
+            }, synchronize_session=False)
+        )
+        db.commit()
+        if updated == 1:
+            return get(db, id=task_id)
+    return None
+
+def heartbeat(db: Session, *, task_id: int, worker_id: str, lease_seconds: int) -> bool:
+    """
+    延长租约；返回 False 表示租约已被其他 worker 接管。
+    """
+    updated = (
+        db.query(MatchTask)
+        .filter(MatchTask.id == task_id, MatchTask.lease_owner == worker_id, MatchTask.status == "running")
+        .update({"leased_until": _now() + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    )
+    db.commit()
+    return updated == 1
+
+def complete(db: Session, *, task_id: int, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+    updated = (
+        db.query(MatchTask)
+        .filter(MatchTask.id == task_id, MatchTask.lease_owner == worker_id)
+        .update({
+            "status": "success",
+            "leased_until": None,
+            "result": result,
+            "last_error": None,
+        }, synchronize_session=False)
+    )
+    db.commit()
+    return updated == 1
+
+def fail(db: Session, *, task_id: int, worker_id: str, error: str, retry_delay_seconds: int) -> Optional[str]:
+    """
+    记录一次失败。未达到最大尝试次数时重新排队（延迟 retry_delay_seconds 秒），
+    否则标记为 failed。返回任务的新状态。
+    """
+    task = get(db, id=task_id)
+    if not task or task.lease_owner != worker_id:
+        return None
+    if task.attempts < task.max_attempts:
+        task.status = "pending"
+        task.available_at = _now() + timedelta(seconds=retry_delay_seconds)
+    else:
+        task.status = "failed"
+    task.leased_until = None
+    task.last_error = error
+    db.commit()
+    return task.status
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from app.models.user_profile import UserProfile
 from app.schemas.user_profile import UserProfileCreate # This schema doesn't exist yet, I'll create it.
@@ -7,14 +7,29 @@ from app.schemas.user_profile import UserProfileCreate # This schema doesn't exi
 def get(db: Session, id: Any) -> Optional[UserProfile]:
     return db.query(UserProfile).filter(UserProfile.id == id).first()
 
-def create_user_profile(db: Session, *, obj_in: UserProfileCreate) -> UserProfile:
+def get_all(db: Session) -> List[UserProfile]:
+    return db.query(UserProfile).order_by(UserProfile.id).all()
+
+def get_by_file_hash(db: Session, *, file_hash: str) -> Optional[UserProfile]:
+    """按上传文件的哈希查找最新的画像。"""
+    return db.query(UserProfile).filter(UserProfile.file_hash == file_hash).order_by(UserProfile.id.desc()).first()
+
+def get_by_content_hash(db: Session, *, content_hash: str) -> Optional[UserProfile]:
+    """按归一化简历文本的哈希查找最新的画像。"""
+    return db.query(UserProfile).filter(UserProfile.content_hash == content_hash).order_by(UserProfile.id.desc()).first()
+
+def create_user_profile(
+    db: Session, *, obj_in: UserProfileCreate, file_hash: Optional[str] = None, content_hash: Optional[str] = None
+) -> UserProfile:
     """
     创建一个新的用户画像条目。
     """
     db_obj = UserProfile(
         # user_id=obj_in.user_id, # We might not have a user context yet
         raw_content=obj_in.raw_content,
-        structured_profile=obj_in.structured_profile
+        structured_profile=obj_in.structured_profile,
+        file_hash=file_hash,
+        content_hash=content_hash
     )
     db.add(db_obj)
     db.commit()
@@ -0,0 +1,84 @@
+"""
+已有数据库的表结构升级。Base.metadata.create_all 只创建不存在的表，
+不会为已有的表添加新列、索引或唯一约束，这些变更在这里补齐。
+"""
+from typing import List
+
+from sqlalchemy import inspect, text
+
+JOB_MATCHES_TABLE = "job_matches"
+JOB_MATCH_UNIQUE_KEY = "uq_job_match_profile_job"
+JOB_MATCH_KEY_COLUMNS = ("user_profile_id", "job_id")
+
+# 匹配缓存与过期标记新增的列
+JOB_MATCH_NEW_COLUMNS = {
+    "profile_fingerprint": "VARCHAR(64) NULL",
+    "job_fingerprint": "VARCHAR(64) NULL",
+    "is_stale": "BOOLEAN NOT NULL DEFAULT FALSE",
+}
+JOB_MATCH_INDEXED_COLUMNS = ("profile_fingerprint", "job_fingerprint")
+
+
+def _has_unique_key(inspector) -> bool:
+    key = set(JOB_MATCH_KEY_COLUMNS)
+    for constraint in inspector.get_unique_constraints(JOB_MATCHES_TABLE):
+        if set(constraint["column_names"]) == key:
+            return True
+    return any(index["unique"] and set(index["column_names"]) == key for index in inspector.get_indexes(JOB_MATCHES_TABLE))
+
+
+def job_match_schema_problems(bind) -> List[str]:
+    """
+    检查 job_matches 表是否与当前模型一致，返回缺少的列与唯一约束；表不存在时返回空列表
+    （由 create_all 创建）。bind 可以是 Engine 或 Connection。
+    """
+    inspector = inspect(bind)
+    if not inspector.has_table(JOB_MATCHES_TABLE):
+        return []
+    columns = {column["name"] for column in inspector.get_columns(JOB_MATCHES_TABLE)}
+    problems = [f"缺少列 {name}" for name in JOB_MATCH_NEW_COLUMNS if name not in columns]
+    if not _has_unique_key(inspector):
+        problems.append(f"缺少唯一约束 {JOB_MATCH_UNIQUE_KEY} ({', '.join(JOB_MATCH_KEY_COLUMNS)})")
+    return problems
+
+
+def migrate_job_matches(engine) -> List[str]:
+    """
+    将旧版本创建的 job_matches 表升级到当前结构，可重复执行：
+    1. 添加缺少的 profile_fingerprint / job_fingerprint / is_stale 列及指纹索引；
+    2. 同一画像与职位有多条结果时只保留 id 最大（最新）的一条；
+    3. 在 (user_profile_id, job_id) 上创建唯一索引，批量 upsert 依赖它判断冲突。
+    返回执行过的步骤说明。
+    """
+    steps = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        if not inspector.has_table(JOB_MATCHES_TABLE):
+            return steps
+
+        columns = {column["name"] for column in inspector.get_columns(JOB_MATCHES_TABLE)}
+        for name, ddl in JOB_MATCH_NEW_COLUMNS.items():
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE {JOB_MATCHES_TABLE} ADD COLUMN {name} {ddl}"))
+                steps.append(f"添加列 {name}")
+
+        indexes = {index["name"] for index in inspector.get_indexes(JOB_MATCHES_TABLE)}
+        for name in JOB_MATCH_INDEXED_COLUMNS:
+            index_name = f"ix_{JOB_MATCHES_TABLE}_{name}"
+            if index_name not in indexes:
+                conn.execute(text(f"CREATE INDEX {index_name} ON {JOB_MATCHES_TABLE} ({name})"))
+                steps.append(f"创建索引 {index_name}")
+
+        if not _has_unique_key(inspector):
+            # MySQL 不允许在子查询中直接引用被删除的表，多包一层派生表
+            removed = conn.execute(text(
+                f"DELETE FROM {JOB_MATCHES_TABLE} WHERE id NOT IN ("
+                f" SELECT id FROM (SELECT MAX(id) AS id FROM {JOB_MATCHES_TABLE}"
+                f" GROUP BY user_profile_id, job_id) AS latest)"
+            )).rowcount
+            steps.append(f"删除 {removed} 条重复的匹配结果")
+            conn.execute(text(
+                f"CREATE UNIQUE INDEX {JOB_MATCH_UNIQUE_KEY} ON {JOB_MATCHES_TABLE} ({', '.join(JOB_MATCH_KEY_COLUMNS)})"
+            ))
+            steps.append(f"创建唯一索引 {JOB_MATCH_UNIQUE_KEY}")
+    return steps
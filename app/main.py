@@ -1,13 +1,54 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.db.base_class import create_all_tables
 from app.db.session import engine
-from app.api.v1.endpoints import scraper, jobs, profile, matching
+from app.api.v1.endpoints import scraper, jobs, profile, matching, llm
+from app.scraper.browser_pool import start_browser_pool, close_browser_pool
+from app.services import scrape_events, embedding_index
+from app.services.llm_client import get_llm_client, close_llm_client
+from app.services.matching_service import on_scrape_delta
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 注意：在生产环境中，数据库迁移可能需要更稳健的工具，如 Alembic
+    create_all_tables(engine)
+    # 爬虫产生的增量职位只对这些职位做增量匹配
+    scrape_events.subscribe(on_scrape_delta)
+    # 爬取完成后立即为新增/变化的职位计算向量
+    scrape_events.subscribe(embedding_index.on_scrape_delta)
+    # 启动时在后台线程中补齐职位向量索引，查询时不再扫描职位表
+    index_sync = asyncio.create_task(asyncio.to_thread(embedding_index.sync_from_database))
+    # 预先创建共享的 LLM 客户端及其连接池
+    try:
+        await get_llm_client().start()
+    except ValueError as e:
+        logging.warning(f"LLM 客户端未初始化: {e}")
+    # 预先启动浏览器池，触发爬取时直接借用已运行的浏览器
+    try:
+        await start_browser_pool()
+    except Exception as e:
+        logging.warning(f"浏览器池未启动，爬虫将单独启动浏览器: {e}")
+
+    yield
+
+    try:
+        await index_sync
+    except Exception as e:
+        logging.warning(f"职位向量索引同步失败: {e}")
+    await close_browser_pool()
+    await close_llm_client()
+    scrape_events.unsubscribe(embedding_index.on_scrape_delta)
+    scrape_events.unsubscribe(on_scrape_delta)
 
 app = FastAPI(
     title="FindJobs AI Assistant",
     description="An AI-powered assistant to help you find the right job.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # 配置 CORS
@@ -25,15 +66,11 @@ app.add_middleware(
     allow_headers=["*"], # 允许所有头部
 )
 
-@app.on_event("startup")
-async def startup_event():
-    # 注意：在生产环境中，数据库迁移可能需要更稳健的工具，如 Alembic
-    create_all_tables(engine)
-
 app.include_router(scraper.router, prefix="/api/v1", tags=["Scraper"])
 app.include_router(jobs.router, prefix="/api/v1", tags=["Jobs"])
 app.include_router(profile.router, prefix="/api/v1", tags=["Profile"])
 app.include_router(matching.router, prefix="/api/v1", tags=["Matching"])
+app.include_router(llm.router, prefix="/api/v1", tags=["LLM"])
 
 
 @app.get("/")
@@ -2,4 +2,5 @@ from .job import Job
 from .user import User
 from .user_profile import UserProfile
 from .job_match import JobMatch
-
+from .match_task import MatchTask
+from .llm_usage import LLMUsage
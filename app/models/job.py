@@ -27,6 +27,8 @@ class Job(Base):
     job_requirements = Column(Text) # 职位要求
     contact_info = Column(String(512), nullable=True) # 联系方式
     is_active = Column(Boolean, default=True, nullable=False) # 职位是否有效
+    listing_fingerprint = Column(String(64), nullable=True) # 列表接口数据的哈希，变化时才重新获取详情页
+    detail_fingerprint = Column(String(64), nullable=True) # 职位内容（不含更新时间）的哈希，变化时才写入并通知下游
 
     def __repr__(self):
         return f"<Job(title='{self.title}', company='{self.company}')>"
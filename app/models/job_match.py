@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, Float, Text, DateTime
+from sqlalchemy import Column, Integer, ForeignKey, Float, Text, DateTime, String, Boolean, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -9,6 +9,8 @@ from app.models.user_profile import UserProfile
 
 class JobMatch(Base):
     __tablename__ = "job_matches"
+    # 每个画像与职位只保留一条当前的匹配结果
+    __table_args__ = (UniqueConstraint("user_profile_id", "job_id", name="uq_job_match_profile_job"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_profile_id = Column(Integer, ForeignKey("user_profiles.id"), nullable=False)
@@ -16,6 +18,9 @@ class JobMatch(Base):
     match_score = Column(Float, nullable=False)
     match_summary = Column(Text, nullable=False)
     improvement_suggestions = Column(Text, nullable=True)
+    profile_fingerprint = Column(String(64), index=True, nullable=True) # 画像内容哈希，用于匹配缓存
+    job_fingerprint = Column(String(64), index=True, nullable=True) # 职位内容哈希，用于匹配缓存
+    is_stale = Column(Boolean, default=False, nullable=False) # 职位已下线，结果不再有效
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user_profile = relationship("UserProfile")
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, func
+
+from app.db.base_class import Base
+
+
+class LLMUsage(Base):
+    """
+    一次运行中 LLM 调用的汇总（一次画像匹配或一次简历分析），
+    用于按运行和按画像统计 LLM 耗时、token 与成本。
+    """
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String(64), index=True, nullable=False) # 同一次运行（例如一个匹配任务）的多条记录共享
+    purpose = Column(String(50), nullable=False) # matching: 职位匹配; resume_analysis: 简历分析
+    user_profile_id = Column(Integer, index=True, nullable=True)
+    calls = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    retries = Column(Integer, nullable=False, default=0)
+    prompt_chars = Column(Integer, nullable=False, default=0)
+    response_chars = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    llm_seconds = Column(Float, nullable=False, default=0.0) # 各次调用耗时之和（并发调用会重叠）
+    wall_seconds = Column(Float, nullable=True) # 整次运行的耗时，与 llm_seconds 对比可看出 LLM 以外的开销
+    max_latency = Column(Float, nullable=False, default=0.0)
+    latency_histogram = Column(JSON, nullable=True) # 按 llm_metrics.LATENCY_BUCKETS 分桶的调用次数
+    estimated_cost = Column(Float, nullable=False, default=0.0)
+    created_at = Column(DateTime, server_default=func.now())
+
+    def __repr__(self):
+        return f"<LLMUsage(run_id='{self.run_id}', purpose='{self.purpose}', calls={self.calls})>"
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, func
+
+from app.db.base_class import Base
+
+
+class MatchTask(Base):
+    """
+    持久化的匹配任务队列。
+    worker 通过租约 (lease) 领取任务，租约过期的任务会被其他 worker 重新领取。
+    """
+    __tablename__ = "match_tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task_type = Column(String(50), nullable=False) # profile: 单个画像全量匹配; incremental: 爬虫增量匹配
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), index=True, nullable=False, default="pending") # pending, running, success, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    available_at = Column(DateTime, index=True, nullable=False) # 最早可被领取的时间 (UTC)，用于重试退避
+    lease_owner = Column(String(100), nullable=True)
+    leased_until = Column(DateTime, nullable=True) # 租约到期时间 (UTC)
+    last_error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<MatchTask(id={self.id}, type='{self.task_type}', status='{self.status}')>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, JSON, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey, func
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 
@@ -9,6 +9,8 @@ class UserProfile(Base):
     user_id = Column(Integer, ForeignKey('users.id'))
     raw_content = Column(Text, nullable=False)
     structured_profile = Column(JSON, nullable=True)
+    file_hash = Column(String(64), index=True, nullable=True) # 上传文件内容的哈希，用于去重
+    content_hash = Column(String(64), index=True, nullable=True) # 归一化简历文本的哈希，用于去重
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
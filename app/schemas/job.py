@@ -31,3 +31,9 @@ class JobPage(BaseModel):
     items: List[Job]
     available_locations: List[str]
     available_categories: List[str]
+
+
+# 语义检索结果：相似度分数及对应职位
+class SimilarJob(BaseModel):
+    score: float
+    job: Job
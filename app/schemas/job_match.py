@@ -13,7 +13,8 @@ class JobMatchBase(BaseModel):
 
 # Properties to receive on item creation
 class JobMatchCreate(JobMatchBase):
-    pass
+    profile_fingerprint: Optional[str] = None
+    job_fingerprint: Optional[str] = None
 
 # Properties to receive on item update
 class JobMatchUpdate(JobMatchBase):
@@ -22,6 +23,7 @@ class JobMatchUpdate(JobMatchBase):
 # Properties shared by models stored in DB
 class JobMatchInDBBase(JobMatchBase):
     id: int
+    is_stale: bool = False
     created_at: datetime
 
     class Config:
@@ -0,0 +1,56 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+# 一组 LLM 调用的汇总，字段见 llm_metrics.UsageStats.summary
+class LLMUsageSummary(BaseModel):
+    calls: int
+    succeeded: int
+    failed: int
+    cache_hits: int
+    retries: int
+    prompt_chars: int
+    response_chars: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    llm_seconds: float
+    p50_latency_ms: Optional[float] = None
+    p95_latency_ms: Optional[float] = None
+    max_latency_ms: float
+    latency_histogram: Dict[str, int]
+    estimated_cost: float
+
+# 一次运行（一次画像匹配或一次简历分析）的持久化汇总
+class LLMUsageRun(BaseModel):
+    id: int
+    run_id: str
+    purpose: str
+    user_profile_id: Optional[int] = None
+    calls: int
+    succeeded: int
+    failed: int
+    cache_hits: int
+    retries: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    llm_seconds: float
+    wall_seconds: Optional[float] = None
+    estimated_cost: float
+    created_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+class ProfileLLMUsage(BaseModel):
+    user_profile_id: int
+    usage: LLMUsageSummary
+
+# GET /llm/usage 的响应：本进程的实时统计与所有已记录运行的合计
+class LLMUsageReport(BaseModel):
+    process: LLMUsageSummary
+    recorded: LLMUsageSummary
+    by_profile: List[ProfileLLMUsage]
+    cache: Optional[Dict[str, Any]] = None
+    router: Optional[Dict[str, Any]] = None
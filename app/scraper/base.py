@@ -1,8 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import List
-from playwright.async_api import Browser, Page, BrowserContext, async_playwright
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+from playwright.async_api import Browser, Page, BrowserContext, Route, async_playwright
 from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.crud import crud_job
 from app.models import Job
+from app.scraper.browser_pool import BrowserLease, get_browser_pool
+from app.scraper.rate_limiter import DomainRateLimiter
+from app.scraper.resources import ResourcePolicy, TrafficMeter
 import asyncio
 
 class BaseScraper(ABC):
@@ -10,9 +15,18 @@ class BaseScraper(ABC):
     所有招聘网站爬虫的抽象基类。
     定义了爬虫的基本结构和通用方法。
     """
+    # 子类设为 True 时按 resource_policy 拦截不需要的资源 (图片、字体、统计脚本等)
+    block_resources: bool = False
+
     def __init__(self, db: Session):
         self.db = db
         self.site_name = self.__class__.__name__.replace("Scraper", "").lower() # 自动获取站点名称
+        # 按域名限速，代替每次请求之间的固定 sleep，并发抓取时同样生效
+        self.rate_limiter = DomainRateLimiter.from_settings()
+        self.page_concurrency = settings.SCRAPER_DETAIL_CONCURRENCY
+        self.resource_policy = ResourcePolicy.from_settings()
+        self.traffic = TrafficMeter()
+        self._playwright = None # 未使用浏览器池时自行启动的 Playwright 驱动
 
     @abstractmethod
     async def scrape(self) -> List[Job]:
@@ -30,29 +44,124 @@ class BaseScraper(ABC):
     async def _extract_job_details(self, page: Page, url: str) -> Job:
         return None
 
-    async def _initialize_browser(self) -> Browser:
+    async def _goto(self, page: Page, url: str, **kwargs):
+        """经过限速后打开页面。"""
+        await self.rate_limiter.acquire(url)
+        self.traffic.pages += 1
+        return await page.goto(url, **kwargs)
+
+    async def _prepare_context(self, target: BrowserContext | Page):
+        """
+        为新建的浏览器上下文或页面统计流量；爬虫启用拦截且配置未关闭时，
+        通过路由拦截中止策略不允许的请求。
+        """
+        self.traffic.attach(target)
+        if self.block_resources and settings.SCRAPER_BLOCK_RESOURCES:
+            await target.route("**/*", self._route_request)
+
+    async def _route_request(self, route: Route):
+        request = route.request
+        if self.resource_policy.should_block(request.resource_type, request.url):
+            self.traffic.blocked += 1
+            await route.abort()
+        else:
+            # 交给先注册的路由处理 (没有时正常发出请求)
+            await route.fallback()
+
+    async def _run_page_workers(
+        self, browser: Browser, items: Iterable[Any],
+        handler: Callable[[Page, Any], Awaitable[None]], concurrency: Optional[int] = None
+    ):
         """
-        初始化并启动 Playwright 浏览器。
+        用一组可复用的页面并发处理 items：启动 concurrency 个工作协程，每个协程持有
+        一个浏览器上下文和页面，从共享队列中依次领取下一项并调用 handler(page, item)。
+        单项出错不影响其他项；页面被关闭（例如崩溃）时重新创建。
         """
-        pw = await async_playwright().start()
-        browser = await pw.chromium.launch(headless=True) # 生产环境通常设置为 True
-        return browser
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+        if queue.empty():
+            return
+        concurrency = max(1, min(concurrency or self.page_concurrency, queue.qsize()))
 
-    async def _close_browser(self, browser: Browser):
+        async def worker():
+            context = await browser.new_context(java_script_enabled=True)
+            try:
+                await self._prepare_context(context)
+                page = await context.new_page()
+                while True:
+                    try:
+                        item = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    try:
+                        await handler(page, item)
+                    except Exception as e:
+                        print(f"Page worker failed on {item}: {e}")
+                    if page.is_closed():
+                        page = await context.new_page()
+            finally:
+                await context.close()
+
+        # 一个工作协程失败 (例如无法创建页面) 时取消其余协程并等待它们关闭上下文，再抛出异常
+        tasks = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    async def _initialize_browser(self) -> Browser | BrowserLease:
+        """
+        获取浏览器。应用启动了浏览器池时从池中借用 (只创建上下文，不启动 Chromium)，
+        否则单独启动 Playwright 驱动与浏览器。
         """
-        关闭 Playwright 浏览器。
+        pool = get_browser_pool()
+        if pool is not None:
+            return pool.lease()
+        self._playwright = await async_playwright().start()
+        try:
+            return await self._playwright.chromium.launch(headless=True) # 生产环境通常设置为 True
+        except Exception:
+            await self._close_playwright()
+            raise
+
+    async def _close_browser(self, browser: Browser | BrowserLease):
+        """
+        关闭浏览器：借用的浏览器只关闭本次创建的上下文并归还，自行启动的浏览器连同 Playwright 驱动一起停止。
         """
-        await browser.close()
+        try:
+            await browser.close()
+        finally:
+            await self._close_playwright()
+
+    async def _close_playwright(self):
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
 
     async def _save_jobs(self, jobs: List[Job]):
         """
         将爬取到的职位列表保存到数据库。
         """
-        for job in jobs:
-            # 检查职位是否已存在（通过URL判断）
-            existing_job = self.db.query(Job).filter(Job.url == job.url).first()
-            if not existing_job:
-                self.db.add(job)
-        self.db.commit()
-        print(f"Saved {len(jobs)} new jobs to DB from {self.site_name}.")
+        saved, seen_urls = 0, set()
+        chunk_size = max(1, settings.SCRAPER_WRITE_BATCH_SIZE)
+        for start in range(0, len(jobs), chunk_size):
+            chunk = jobs[start:start + chunk_size]
+            # 每个分块一次查询已存在的 URL，只插入新职位，并逐块提交
+            existing_urls = crud_job.get_existing_urls(self.db, urls=[job.url for job in chunk])
+            new_jobs = []
+            for job in chunk:
+                if job.url in existing_urls or job.url in seen_urls:
+                    continue
+                seen_urls.add(job.url)
+                new_jobs.append(job)
+            self.db.add_all(new_jobs)
+            self.db.commit()
+            saved += len(new_jobs)
+        print(f"Saved {saved} new jobs to DB from {self.site_name}.")
 
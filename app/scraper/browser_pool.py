@@ -0,0 +1,309 @@
+import asyncio
+import os
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from playwright.async_api import Browser, BrowserContext, Page, async_playwright
+
+from app.core.config import settings
+
+
+def browser_memory_mb() -> Optional[float]:
+    """
+    本进程所有子孙进程 (Playwright 驱动与各浏览器进程) 的常驻内存之和 (MB)。
+    通过 /proc 读取，非 Linux 系统返回 None，此时不按内存回收浏览器。
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    children: Dict[int, List[int]] = defaultdict(list)
+    rss_kb: Dict[int, float] = {}
+    page_kb = os.sysconf("SC_PAGE_SIZE") / 1024
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能包含空格，从最后一个右括号之后开始按字段切分
+        fields = stat[stat.rfind(")") + 2:].split()
+        pid = int(entry)
+        children[int(fields[1])].append(pid)
+        rss_kb[pid] = int(fields[21]) * page_kb
+    total, stack = 0.0, list(children[os.getpid()])
+    while stack:
+        pid = stack.pop()
+        total += rss_kb.get(pid, 0)
+        stack.extend(children[pid])
+    return total / 1024
+
+
+class _PooledBrowser:
+    """池中的一个浏览器及其使用情况。"""
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.contexts: Set[BrowserContext] = set()
+        self.pages = 0 # 本浏览器打开过的页面 (主文档导航) 数
+        self.retire_reason: Optional[str] = None # 设置后不再分配新的上下文，空闲时重启
+
+    @property
+    def retiring(self) -> bool:
+        return self.retire_reason is not None
+
+    def count_navigation(self, request: Any):
+        try:
+            if request.is_navigation_request() and request.resource_type == "document":
+                self.pages += 1
+        except Exception:
+            pass
+
+
+class BrowserLease:
+    """
+    从浏览器池借出的句柄。与 Browser 一样可以 new_context() / new_page()，
+    上下文分配在池中负载最低的浏览器上；close() 只关闭通过本句柄创建的上下文，浏览器保持运行。
+    """
+
+    def __init__(self, pool: "BrowserPool"):
+        self._pool = pool
+        self._contexts: Set[BrowserContext] = set()
+
+    async def new_context(self, **kwargs) -> BrowserContext:
+        context = await self._pool.new_context(**kwargs)
+        self._contexts.add(context)
+        return context
+
+    async def new_page(self, **kwargs) -> Page:
+        # 与 Browser.new_page 相同，每个页面使用独立的上下文，在句柄关闭时一并关闭
+        context = await self.new_context(**kwargs)
+        return await context.new_page()
+
+    async def close(self):
+        contexts, self._contexts = self._contexts, set()
+        for context in contexts:
+            await self._pool.release(context)
+
+
+class BrowserPool:
+    """
+    应用范围内长期运行的浏览器池，避免每次爬取都启动 Playwright 驱动与 Chromium。
+    - 爬虫通过 lease() 借用浏览器，在其上创建上下文，用完关闭上下文后归还。
+    - 浏览器打开的页面数达到 max_pages，或浏览器进程总内存超过 max_memory_mb 时，
+      不再分配新的上下文，等已有上下文全部关闭后重启。
+    - 后台定期做健康检查：连接已断开或无法创建上下文的浏览器会被重新启动。
+    """
+
+    HEALTH_CHECK_TIMEOUT = 10.0 # 健康检查中创建上下文的超时秒数
+
+    def __init__(
+        self, size: int = 1, max_pages: int = 0, max_memory_mb: float = 0,
+        health_check_interval: float = 0,
+        launcher: Optional[Callable[[], Awaitable[Browser]]] = None,
+        memory_probe: Callable[[], Optional[float]] = browser_memory_mb,
+    ):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        self.health_check_interval = health_check_interval
+        self._launcher = launcher
+        self._memory_probe = memory_probe
+        self._playwright = None
+        self._slots: List[_PooledBrowser] = []
+        self._owners: Dict[BrowserContext, _PooledBrowser] = {}
+        self._lock = asyncio.Lock()
+        self._health_task: Optional[asyncio.Task] = None
+        self.recycled = 0
+
+    @classmethod
+    def from_settings(cls, **kwargs) -> "BrowserPool":
+        options = dict(
+            size=settings.SCRAPER_BROWSER_POOL_SIZE,
+            max_pages=settings.SCRAPER_BROWSER_MAX_PAGES,
+            max_memory_mb=settings.SCRAPER_BROWSER_MAX_MEMORY_MB,
+            health_check_interval=settings.SCRAPER_BROWSER_HEALTH_CHECK_SECONDS,
+        )
+        options.update(kwargs)
+        return cls(**options)
+
+    async def start(self):
+        """启动 Playwright 驱动 (未指定 launcher 时) 与 size 个浏览器。启动失败时释放已启动的资源。"""
+        try:
+            if self._launcher is None:
+                self._playwright = await async_playwright().start()
+                self._launcher = lambda: self._playwright.chromium.launch(headless=True)
+            for _ in range(self.size):
+                self._slots.append(_PooledBrowser(await self._launcher()))
+        except Exception:
+            await self.close()
+            raise
+        if self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+        print(f"Browser pool started with {len(self._slots)} browsers.")
+
+    async def close(self):
+        """停止健康检查，关闭所有浏览器与 Playwright 驱动。"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        slots, self._slots = self._slots, []
+        self._owners.clear()
+        for slot in slots:
+            await self._close_quietly(slot.browser)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def lease(self) -> BrowserLease:
+        return BrowserLease(self)
+
+    async def new_context(self, **kwargs) -> BrowserContext:
+        async with self._lock:
+            slot = await self._acquire_slot()
+            context = await slot.browser.new_context(**kwargs)
+            slot.contexts.add(context)
+            self._owners[context] = slot
+        context.on("request", slot.count_navigation)
+        return context
+
+    async def release(self, context: BrowserContext):
+        """关闭上下文；所在浏览器待回收且已空闲时重启。"""
+        try:
+            await context.close()
+        except Exception as e:
+            print(f"Failed to close browser context: {e}")
+        slot = self._owners.pop(context, None)
+        if slot is None:
+            return
+        slot.contexts.discard(context)
+        if self.max_pages and slot.pages >= self.max_pages and not slot.retiring:
+            slot.retire_reason = "page limit"
+        if slot.retiring and not slot.contexts:
+            await self._recycle_unlocked(slot, slot.retire_reason, lambda: slot.retiring and not slot.contexts)
+
+    async def check_health(self):
+        """
+        按内存标记待回收的浏览器，重启空闲的待回收浏览器与无响应的浏览器。
+        探测与重启都不持有池的锁，只在替换浏览器时短暂加锁，不阻塞其他爬虫创建上下文。
+        """
+        memory = self._memory_probe() if self.max_memory_mb else None
+        if memory is not None and memory > self.max_memory_mb and self._slots:
+            # 无法区分各浏览器的内存，回收打开页面最多的那个
+            busiest = max(self._slots, key=lambda slot: slot.pages)
+            if not busiest.retiring:
+                print(f"Browser processes use {memory:.0f} MB (limit {self.max_memory_mb:.0f} MB), retiring a browser.")
+                busiest.retire_reason = "memory"
+        for slot in list(self._slots):
+            if slot.retiring and not slot.contexts:
+                await self._recycle_unlocked(slot, slot.retire_reason, lambda: slot.retiring and not slot.contexts)
+            elif not await self._is_healthy(slot):
+                # 探测期间被分配了上下文说明浏览器仍可用，不再重启
+                await self._recycle_unlocked(slot, "failed health check", lambda: not slot.contexts)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"contexts": len(slot.contexts), "pages": slot.pages, "retiring": slot.retiring,
+             "connected": slot.browser.is_connected()}
+            for slot in self._slots
+        ]
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"Browser pool health check failed: {e}")
+
+    async def _acquire_slot(self) -> _PooledBrowser:
+        """选出分配新上下文的浏览器 (调用方持有锁)：先重启可以重启的，再取上下文最少的可用浏览器。"""
+        for slot in self._slots:
+            if not slot.browser.is_connected():
+                await self._recycle(slot, "disconnected")
+            elif self.max_pages and slot.pages >= self.max_pages and not slot.contexts:
+                await self._recycle(slot, "page limit")
+            elif self.max_pages and slot.pages >= self.max_pages:
+                slot.retire_reason = "page limit"
+        usable = [slot for slot in self._slots if not slot.retiring] or self._slots
+        if not usable:
+            raise RuntimeError("Browser pool is not started.")
+        return min(usable, key=lambda slot: len(slot.contexts))
+
+    async def _is_healthy(self, slot: _PooledBrowser) -> bool:
+        if not slot.browser.is_connected():
+            return False
+        if slot.contexts:
+            # 正在使用的浏览器不做额外探测
+            return True
+        try:
+            context = await asyncio.wait_for(slot.browser.new_context(), self.HEALTH_CHECK_TIMEOUT)
+            await context.close()
+            return True
+        except Exception:
+            return False
+
+    async def _recycle(self, slot: _PooledBrowser, reason: str):
+        """关闭旧浏览器并在原位置启动新浏览器 (调用方持有锁)。"""
+        await self._close_quietly(slot.browser)
+        self._replace(slot, await self._launcher(), reason)
+
+    async def _recycle_unlocked(self, slot: _PooledBrowser, reason: str, still_needed: Callable[[], bool]):
+        """
+        不持有锁时重启浏览器：先启动新浏览器，加锁后确认仍需重启 (still_needed) 且未被其他协程替换，
+        再替换并关闭旧浏览器；否则关闭新启动的浏览器。
+        """
+        old_browser = slot.browser
+        new_browser = await self._launcher()
+        async with self._lock:
+            replace = slot in self._slots and slot.browser is old_browser and still_needed()
+            if replace:
+                self._replace(slot, new_browser, reason)
+        await self._close_quietly(old_browser if replace else new_browser)
+
+    def _replace(self, slot: _PooledBrowser, browser: Browser, reason: str):
+        print(f"Recycling browser after {slot.pages} pages ({reason}).")
+        for context in slot.contexts:
+            self._owners.pop(context, None)
+        slot.browser = browser
+        slot.contexts = set()
+        slot.pages = 0
+        slot.retire_reason = None
+        self.recycled += 1
+
+    @staticmethod
+    async def _close_quietly(browser: Browser):
+        try:
+            await browser.close()
+        except Exception as e:
+            print(f"Failed to close browser: {e}")
+
+
+_pool: Optional[BrowserPool] = None
+
+
+def get_browser_pool() -> Optional[BrowserPool]:
+    """返回应用启动的浏览器池；未启动 (例如命令行或测试中直接运行爬虫) 时返回 None。"""
+    return _pool
+
+
+async def start_browser_pool() -> Optional[BrowserPool]:
+    """创建并启动共享的浏览器池 (应用启动时调用)，配置关闭时不启动。"""
+    global _pool
+    if _pool is None and settings.SCRAPER_BROWSER_POOL_ENABLED:
+        pool = BrowserPool.from_settings()
+        await pool.start()
+        _pool = pool
+    return _pool
+
+
+async def close_browser_pool():
+    """关闭共享的浏览器池 (应用关闭时调用)。"""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
@@ -1,159 +1,374 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from playwright.async_api import Page, Browser
 from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.crud import crud_job
 from app.models import Job
 from app.scraper.base import BaseScraper
+from app.services import scrape_events
 import asyncio
-import random
+import hashlib
 import re
 import json
 
+# 详情页中各字段所在的元素
+DETAIL_FIELD_XPATHS = {
+    "job_responsibilities": "//div[span[contains(text(), '职责描述')]]/following-sibling::div[1]",
+    "job_requirements": "//div[span[contains(text(), '任职要求')]]/following-sibling::div[1]",
+    "detailed_location": "//div[span[contains(text(), '工作地点')]]/following-sibling::div[1]",
+}
+CONTACT_XPATH = "//p[i[contains(@class, 'icon-user-line')]]"
+
+
+def details_complete(details: Optional[Dict[str, Any]]) -> bool:
+    """详情是否完整：DETAIL_FIELD_XPATHS 中的字段都已提取。部分提取的详情不能覆盖已有内容。"""
+    return bool(details) and all(details.get(field) is not None for field in DETAIL_FIELD_XPATHS)
+
+
+# 不属于职位内容的列（更新时间、状态与指纹本身），不参与内容指纹
+DETAIL_CONTENT_EXCLUDED = ("published_at", "is_active", "listing_fingerprint", "detail_fingerprint")
+
+
+def _fingerprint(data: Dict[str, Any]) -> str:
+    normalized = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def listing_fingerprint(item: Dict[str, Any]) -> str:
+    """列表接口返回的整条数据的指纹，任何字段（包括更新时间）变化都会触发重新获取详情。"""
+    return _fingerprint(item)
+
+
+def detail_fingerprint(row: Dict[str, Any]) -> str:
+    """职位内容（列表中的职位字段与详情字段，不含更新时间）的指纹，变化时才写入并通知下游。"""
+    return _fingerprint({key: value for key, value in row.items() if key not in DETAIL_CONTENT_EXCLUDED})
+
+
 class HaierScraper(BaseScraper):
     BASE_URL = "https://maker.haier.net/client/job/index"
+    SEARCH_URL = "https://maker.haier.net/client/job/searchdata.html"
+    SNAPSHOT_RETRY_DELAY = 1.0 # 列表页首次重试前的等待秒数，之后倍增
+    # 列表接口与详情字段都不依赖图片、样式和统计脚本
+    block_resources = True
 
     def __init__(self, db: Session):
         super().__init__(db)
         self.site_name = "haier"
+        self.last_delta: Dict[str, Any] = {}
+        self.snapshot_page_size = settings.SCRAPER_SNAPSHOT_PAGE_SIZE
+        self.snapshot_concurrency = settings.SCRAPER_SNAPSHOT_CONCURRENCY
+        self.snapshot_max_attempts = max(1, settings.SCRAPER_SNAPSHOT_MAX_ATTEMPTS)
+        self.write_batch_size = max(1, settings.SCRAPER_WRITE_BATCH_SIZE)
+        self.selector_timeout = settings.SCRAPER_SELECTOR_TIMEOUT
+        self._db_jobs_map: Dict[str, Any] = {}
+        self._pending_inserts: List[Dict[str, Any]] = []
+        self._pending_updates: List[Dict[str, Any]] = []
+        # 重新获取详情后内容指纹确实变化的职位
+        self._changed_job_ids: List[str] = []
+        # 重新获取详情时发现已下线、内容未变化 (或详情获取失败) 而重新上线的职位
+        self._reactivated_job_ids: List[str] = []
 
     async def scrape(self) -> List[Job]:
         print("Starting incremental scrape for Haier...")
         browser = await self._initialize_browser()
         
-        online_jobs_map = await self._get_online_snapshot(browser)
+        online_jobs_map, snapshot_complete = await self._get_online_snapshot(browser)
         if not online_jobs_map:
             print("Could not fetch online job list. Aborting.")
             await self._close_browser(browser)
             return []
 
         print("Comparing online snapshot with database...")
-        db_jobs_map = {job.source_job_id: job for job in self.db.query(Job).filter(Job.source_site == self.site_name).all()}
-        
-        new_job_ids, updated_job_ids = [], []
+        self._backfill_detail_fingerprints()
+        # 只加载比较所需的列，不持有完整的 ORM 对象，写入时也直接按主键更新
+        db_jobs_map = {
+            row.source_job_id: row
+            for row in self.db.query(
+                Job.id, Job.source_job_id, Job.is_active, Job.listing_fingerprint, Job.detail_fingerprint
+            ).filter(Job.source_site == self.site_name)
+        }
+        self._db_jobs_map = db_jobs_map
+        self._changed_job_ids = []
+        self._reactivated_job_ids = []
+
+        new_job_ids, relisted_job_ids, reactivated_job_ids = [], [], []
         online_job_ids, db_job_ids = set(online_jobs_map.keys()), set(db_jobs_map.keys())
 
         for job_id, online_job_data in online_jobs_map.items():
-            if job_id not in db_job_ids:
+            db_job = db_jobs_map.get(job_id)
+            if db_job is None:
                 new_job_ids.append(job_id)
-            else:
-                db_job = db_jobs_map[job_id]
-                if online_job_data.get('update_time') > db_job.published_at:
-                    updated_job_ids.append(job_id)
-        
-        jobs_to_deactivate_ids = db_job_ids - online_job_ids
+            elif db_job.listing_fingerprint != listing_fingerprint(online_job_data):
+                # 列表数据有变化（包括更新时间），需要重新获取详情后再判断内容是否真的变化
+                relisted_job_ids.append(job_id)
+            elif not db_job.is_active:
+                reactivated_job_ids.append(job_id)
 
-        print(f"Found {len(new_job_ids)} new jobs, {len(updated_job_ids)} updated jobs, and {len(jobs_to_deactivate_ids)} jobs to deactivate.")
+        # 快照不完整时缺失的职位可能仍在线，不能据此批量下线
+        if snapshot_complete:
+            jobs_to_deactivate_ids = {job_id for job_id in db_job_ids - online_job_ids if db_jobs_map[job_id].is_active}
+        else:
+            jobs_to_deactivate_ids = set()
+            print("Skipping deactivation because the online snapshot is incomplete.")
 
-        jobs_to_process_ids = new_job_ids + updated_job_ids
+        print(
+            f"Found {len(new_job_ids)} new jobs, {len(relisted_job_ids)} jobs with changed listings, "
+            f"{len(reactivated_job_ids)} jobs back online, and {len(jobs_to_deactivate_ids)} jobs to deactivate."
+        )
+
+        if reactivated_job_ids:
+            self.db.query(Job).filter(
+                Job.source_site == self.site_name, Job.source_job_id.in_(reactivated_job_ids)
+            ).update({'is_active': True}, synchronize_session=False)
+
+        jobs_to_process_ids = new_job_ids + relisted_job_ids
         if jobs_to_process_ids:
-            print(f"Scraping details for {len(jobs_to_process_ids)} jobs...")
-            for i, job_id in enumerate(jobs_to_process_ids):
+            print(f"Scraping details for {len(jobs_to_process_ids)} jobs with {self.page_concurrency} pages...")
+            processed = 0
+
+            async def process(page: Page, job_id: str):
+                nonlocal processed
                 job_item = online_jobs_map[job_id]
-                print(f"Processing job {i+1}/{len(jobs_to_process_ids)}: {job_item.get('job_name')}")
-                details = await self._scrape_job_details(browser, job_id)
+                details = await self._scrape_job_details(page, job_id)
+                # 写入会话是同步调用，各工作协程之间不会交错
                 self._upsert_job(job_item, details)
-                await asyncio.sleep(random.uniform(0.5, 1.5))
+                processed += 1
+                print(f"Processed job {processed}/{len(jobs_to_process_ids)}: {job_item.get('job_name')}")
+
+            await self._run_page_workers(browser, jobs_to_process_ids, process)
 
         if jobs_to_deactivate_ids:
             print(f"Deactivating {len(jobs_to_deactivate_ids)} jobs...")
-            self.db.query(Job).filter(Job.source_job_id.in_(jobs_to_deactivate_ids)).update({'is_active': False}, synchronize_session=False)
+            self.db.query(Job).filter(
+                Job.source_site == self.site_name, Job.source_job_id.in_(jobs_to_deactivate_ids)
+            ).update({'is_active': False}, synchronize_session=False)
 
+        self._flush_jobs()
         self.db.commit()
-        print("Incremental scrape finished and database is updated.")
+        print(
+            f"Incremental scrape finished and database is updated: {len(self._changed_job_ids)} of "
+            f"{len(relisted_job_ids)} re-fetched jobs had changed content."
+        )
         await self._close_browser(browser)
+        print(
+            f"Browser traffic: {self.traffic.pages} pages, {self.traffic.bytes / 1024:.1f} KB "
+            f"({self.traffic.bytes_per_page() / 1024:.1f} KB/page), {self.traffic.blocked} requests blocked."
+        )
+
+        # 只有内容确实变化的职位（以及重新上线的职位）通知下游；重新上线的职位同时单独列出
+        reactivated_job_ids = reactivated_job_ids + self._reactivated_job_ids
+        updated_job_ids = self._changed_job_ids + reactivated_job_ids
+        self.last_delta = self._build_delta(new_job_ids, updated_job_ids, jobs_to_deactivate_ids, reactivated_job_ids)
+        if not scrape_events.is_empty(self.last_delta):
+            await scrape_events.publish(self.last_delta)
         return []
 
-    async def _get_online_snapshot(self, browser: Browser) -> Dict[str, Dict]:
+    def _build_delta(self, new_ids, updated_ids, deactivated_ids, reactivated_ids=()) -> Dict[str, Any]:
+        """
+        将来源网站的职位 ID 转换为数据库主键，生成供下游（如增量匹配）使用的 delta。
+        """
+        source_ids = set(new_ids) | set(updated_ids) | set(deactivated_ids) | set(reactivated_ids)
+        id_map = {}
+        if source_ids:
+            rows = self.db.query(Job.id, Job.source_job_id).filter(
+                Job.source_site == self.site_name, Job.source_job_id.in_(source_ids)
+            ).all()
+            id_map = {source_job_id: job_id for job_id, source_job_id in rows}
+        return {
+            "site_name": self.site_name,
+            "new_job_ids": [id_map[i] for i in new_ids if i in id_map],
+            "updated_job_ids": [id_map[i] for i in updated_ids if i in id_map],
+            "deactivated_job_ids": [id_map[i] for i in deactivated_ids if i in id_map],
+            "reactivated_job_ids": [id_map[i] for i in reactivated_ids if i in id_map],
+        }
+
+    async def _fetch_json(self, page: Page, url: str) -> Dict[str, Any]:
+        """在页面中用 fetch 请求列表接口（带站点 cookie），HTTP 错误作为异常抛出。"""
+        await self.rate_limiter.acquire(url)
+        return await page.evaluate(
+            "url => fetch(url).then(r => { if (!r.ok) throw new Error('HTTP ' + r.status); return r.json(); })",
+            url
+        )
+
+    async def _fetch_snapshot_page(self, page: Page, page_no: int, page_size: int) -> Dict[str, Any]:
+        """请求一页列表数据，失败时指数退避重试，全部失败则抛出最后一次的异常。"""
+        url = f"{self.SEARCH_URL}?page={page_no}&pagesize={page_size}"
+        for attempt in range(1, self.snapshot_max_attempts + 1):
+            try:
+                data = (await self._fetch_json(page, url)).get("data")
+                if not isinstance(data, dict) or not isinstance(data.get("list"), list):
+                    raise ValueError(f"unexpected response for page {page_no}")
+                return data
+            except Exception as e:
+                if attempt >= self.snapshot_max_attempts:
+                    raise
+                print(f"Snapshot page {page_no} failed ({e}), retrying ({attempt}/{self.snapshot_max_attempts - 1})...")
+                await asyncio.sleep(self.SNAPSHOT_RETRY_DELAY * 2 ** (attempt - 1))
+
+    async def _get_online_snapshot(self, browser: Browser) -> Tuple[Dict[str, Dict], bool]:
+        """
+        获取线上职位列表快照，返回 (职位 ID -> 列表数据, 快照是否完整)。
+        先请求第一页得到总数与服务端实际接受的每页条数，其余页按有限并发请求，
+        失败的页会重试；仍有页失败或条数少于总数时快照标记为不完整。
+        """
         print("Fetching online job snapshot using page.evaluate(fetch)...")
         snapshot_map = {}
+        complete = False
         page = await browser.new_page()
-        total_jobs = 0
 
         try:
-            await page.goto(self.BASE_URL, wait_until="networkidle")
-
-            api_url_page1 = "https://maker.haier.net/client/job/searchdata.html?page=1&pagesize=10"
-            json_data = await page.evaluate(f"fetch('{api_url_page1}').then(response => response.json())")
-            
-            if json_data.get("data"):
-                total_jobs = json_data["data"].get("count", 0)
-                if json_data["data"].get("list"):
-                    for item in json_data["data"]["list"]:
-                        snapshot_map[item['id']] = item
-
-            if total_jobs > 0:
-                total_pages = (total_jobs + 9) // 10
-                print(f"Snapshot: Total jobs={total_jobs}, Total pages={total_pages}")
-                for i in range(2, total_pages + 1):
-                    api_url = f"https://maker.haier.net/client/job/searchdata.html?page={i}&pagesize=10"
-                    page_data = await page.evaluate(f"fetch('{api_url}').then(response => response.json())")
-                    if page_data.get("data") and page_data["data"].get("list"):
-                        for item in page_data["data"]["list"]:
-                            snapshot_map[item['id']] = item
+            await self._prepare_context(page)
+            # 只需要同源页面来调用列表接口，不必等页面资源加载完
+            await self._goto(page, self.BASE_URL, wait_until="domcontentloaded")
+
+            first = await self._fetch_snapshot_page(page, 1, self.snapshot_page_size)
+            total_jobs = int(first.get("count") or 0)
+            for item in first["list"]:
+                snapshot_map[item['id']] = item
+
+            # 服务端可能限制每页条数，按第一页实际返回的条数计算页数
+            page_size = self.snapshot_page_size
+            if 0 < len(first["list"]) < min(page_size, total_jobs):
+                page_size = len(first["list"])
+            total_pages = (total_jobs + page_size - 1) // page_size if total_jobs else 1
+            print(f"Snapshot: Total jobs={total_jobs}, Total pages={total_pages}, Page size={page_size}")
+
+            semaphore = asyncio.Semaphore(self.snapshot_concurrency)
+
+            async def fetch(page_no: int):
+                async with semaphore:
+                    return await self._fetch_snapshot_page(page, page_no, page_size)
+
+            results = await asyncio.gather(*(fetch(i) for i in range(2, total_pages + 1)), return_exceptions=True)
+            failed_pages = []
+            for page_no, result in zip(range(2, total_pages + 1), results):
+                if isinstance(result, Exception):
+                    failed_pages.append(page_no)
+                    continue
+                for item in result["list"]:
+                    snapshot_map[item['id']] = item
+
+            if failed_pages:
+                print(f"Snapshot is incomplete: pages {failed_pages} failed after {self.snapshot_max_attempts} attempts.")
+            elif len(snapshot_map) < total_jobs:
+                # 翻页过程中列表有变动时可能出现，宁可不下线也不误下线
+                print(f"Snapshot is incomplete: got {len(snapshot_map)} of {total_jobs} jobs.")
+            else:
+                complete = True
         except Exception as e:
             print(f"Error fetching online snapshot: {e}")
         finally:
             await page.close()
-        
-        print(f"Snapshot created with {len(snapshot_map)} jobs.")
-        return snapshot_map
+
+        print(f"Snapshot created with {len(snapshot_map)} jobs (complete={complete}).")
+        return snapshot_map, complete
+
+    def _job_row(self, item: Dict, details: Dict) -> Dict[str, Any]:
+        """列表数据与详情字段对应的职位列值（新增与更新共用）。"""
+        return {
+            "title": item.get("job_name"),
+            "location": item.get("location"),
+            "description": item.get("func_desc"),
+            "published_at": item.get("update_time"),
+            "department_info": item.get("xwinfo"),
+            "salary_info": item.get("salary_label"),
+            "experience_required": item.get("work_experience_label"),
+            "education_required": item.get("education_required_label"),
+            "job_responsibilities": details.get("job_responsibilities"),
+            "job_requirements": details.get("job_requirements"),
+            "detailed_location": details.get("detailed_location"),
+            "contact_info": details.get("contact_info"),
+            "is_active": True,
+        }
+
+    def _backfill_detail_fingerprints(self):
+        """
+        为加入指纹之前写入的职位根据已保存的内容计算内容指纹。这些职位没有列表指纹，
+        会重新获取一次详情，但只有内容确实变化的才记为变化并通知下游。
+        """
+        columns = [key for key in self._job_row({}, {}) if key not in DETAIL_CONTENT_EXCLUDED]
+        rows = self.db.query(Job.id, *(getattr(Job, column) for column in columns)).filter(
+            Job.source_site == self.site_name, Job.detail_fingerprint.is_(None)
+        ).all()
+        if not rows:
+            return
+        crud_job.bulk_write(self.db, inserts=[], updates=[
+            {"id": row.id, "detail_fingerprint": detail_fingerprint({column: getattr(row, column) for column in columns})}
+            for row in rows
+        ])
+        print(f"Backfilled content fingerprints for {len(rows)} existing jobs.")
 
     def _upsert_job(self, item: Dict, details: Dict):
+        """
+        将职位加入待写入的批次，攒够 write_batch_size 条后写入并提交一次。
+        只有全部详情字段都提取到时才视为获取成功 (见 details_complete)。
+        新职位直接插入；已有职位只有内容指纹变化时才更新全部字段并记为变化，
+        否则只记录新的列表指纹，下次列表不变时不再获取详情。
+        详情获取失败时不覆盖已有内容，也不记录列表指纹，下次爬取会重试。
+        已下线的职位再次出现在列表中时重新上线 (详情获取失败时也按列表数据上线)，记为重新上线。
+        """
         job_id = item.get("id")
-        existing_job = self.db.query(Job).filter(Job.source_job_id == job_id).first()
-
-        if existing_job:
-            existing_job.title = item.get("job_name")
-            existing_job.location = item.get("location")
-            existing_job.description = item.get("func_desc")
-            existing_job.published_at = item.get("update_time")
-            existing_job.department_info = item.get("xwinfo")
-            existing_job.salary_info = item.get("salary_label")
-            existing_job.experience_required = item.get("work_experience_label")
-            existing_job.education_required = item.get("education_required_label")
-            existing_job.job_responsibilities = details.get("job_responsibilities")
-            existing_job.job_requirements = details.get("job_requirements")
-            existing_job.detailed_location = details.get("detailed_location")
-            existing_job.contact_info = details.get("contact_info")
-            existing_job.is_active = True
+        complete = details_complete(details)
+        if not complete:
+            details = {}
+        row = self._job_row(item, details)
+        row["detail_fingerprint"] = detail_fingerprint(row)
+        row["listing_fingerprint"] = listing_fingerprint(item) if complete else None
+        existing = self._db_jobs_map.get(job_id)
+        if existing is None:
+            self._pending_inserts.append({
+                **row,
+                "company": "海尔集团",
+                "url": self._detail_url(job_id),
+                "source_site": self.site_name,
+                "source_job_id": job_id,
+            })
+        elif not complete:
+            if existing.is_active:
+                return
+            self._pending_updates.append({"id": existing.id, "is_active": True})
+            self._reactivated_job_ids.append(job_id)
+        elif row["detail_fingerprint"] == existing.detail_fingerprint:
+            self._pending_updates.append({
+                "id": existing.id,
+                "listing_fingerprint": row["listing_fingerprint"],
+                "published_at": row["published_at"],
+                "is_active": True,
+            })
+            if not existing.is_active:
+                self._reactivated_job_ids.append(job_id)
         else:
-            new_job = Job(
-                title=item.get("job_name"),
-                company="海尔集团",
-                location=item.get("location"),
-                description=item.get("func_desc"),
-                url=f"https://maker.haier.net/client/job/detail?id={job_id}",
-                source_site=self.site_name,
-                source_job_id=job_id,
-                published_at=item.get("update_time"),
-                department_info=item.get("xwinfo"),
-                salary_info=item.get("salary_label"),
-                experience_required=item.get("work_experience_label"),
-                education_required=item.get("education_required_label"),
-                job_responsibilities=details.get("job_responsibilities"),
-                job_requirements=details.get("job_requirements"),
-                detailed_location=details.get("detailed_location"),
-                contact_info=details.get("contact_info"),
-                is_active=True
-            )
-            self.db.add(new_job)
-
-    async def _scrape_job_details(self, browser: Browser, job_id: str) -> Dict[str, str]:
+            self._pending_updates.append({"id": existing.id, **row})
+            self._changed_job_ids.append(job_id)
+        if len(self._pending_inserts) + len(self._pending_updates) >= self.write_batch_size:
+            self._flush_jobs()
+
+    def _flush_jobs(self):
+        """写入并提交当前批次，进程中断时最多丢失一个批次。"""
+        if not self._pending_inserts and not self._pending_updates:
+            return
+        inserts, updates = self._pending_inserts, self._pending_updates
+        self._pending_inserts, self._pending_updates = [], []
+        crud_job.bulk_write(self.db, inserts=inserts, updates=updates)
+        print(f"Saved a batch of {len(inserts)} new and {len(updates)} updated jobs.")
+
+    def _detail_url(self, job_id: str) -> str:
+        return f"https://maker.haier.net/client/job/detail?id={job_id}"
+
+    async def _scrape_job_details(self, page: Page, job_id: str) -> Dict[str, str]:
+        """在工作协程复用的页面中打开详情页并提取字段。"""
         details = {}
-        context = None
-        page = None
-        url = f"https://maker.haier.net/client/job/detail?id={job_id}"
+        url = self._detail_url(job_id)
         try:
-            context = await browser.new_context(java_script_enabled=True)
-            page = await context.new_page()
-            await page.goto(url, wait_until="networkidle", timeout=30000)
-            await page.wait_for_timeout(1000)
-
-            details["job_responsibilities"] = (await page.locator("//div[span[contains(text(), '职责描述')]]/following-sibling::div[1]").text_content(timeout=5000)).strip()
-            details["job_requirements"] = (await page.locator("//div[span[contains(text(), '任职要求')]]/following-sibling::div[1]").text_content(timeout=5000)).strip()
-            details["detailed_location"] = (await page.locator("//div[span[contains(text(), '工作地点')]]/following-sibling::div[1]").text_content(timeout=5000)).strip()
-            
+            # 等第一个字段渲染出来即可提取，不等待 networkidle
+            await self._goto(page, url, wait_until="domcontentloaded", timeout=30000)
+            await page.wait_for_selector(DETAIL_FIELD_XPATHS["job_responsibilities"], timeout=self.selector_timeout)
+
+            for field, xpath in DETAIL_FIELD_XPATHS.items():
+                details[field] = (await page.locator(xpath).text_content(timeout=5000)).strip()
+
             try:
-                contact_email_raw = await page.locator("//p[i[contains(@class, 'icon-user-line')]]").text_content(timeout=100)
+                contact_email_raw = await page.locator(CONTACT_XPATH).text_content(timeout=100)
                 if contact_email_raw:
                     details["contact_info"] = re.sub(r'\s+', ' ', contact_email_raw).strip()
             except Exception:
@@ -161,7 +376,6 @@ class HaierScraper(BaseScraper):
 
         except Exception as e:
             print(f"Could not scrape details from {url}: {e}")
-        finally:
-            if page: await page.close()
-            if context: await context.close()
+            # 只提取到部分字段时整体视为失败，不覆盖已有内容，下次爬取重试
+            return {}
         return details
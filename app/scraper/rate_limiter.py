@@ -0,0 +1,46 @@
+import asyncio
+import random
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+from app.core.config import settings
+
+
+class DomainRateLimiter:
+    """
+    按域名限速：同一域名的相邻两次请求至少间隔 1 / rate 秒 (加少量随机抖动)，
+    不同域名互不影响。并发的抓取协程各自调用 acquire，按到达顺序依次放行。
+    """
+
+    def __init__(self, requests_per_second: float, jitter: float = 0.2, clock=time.monotonic):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.jitter = jitter
+        self._clock = clock
+        self._next_slot: Dict[str, float] = {}
+        self._random = random.Random()
+
+    @classmethod
+    def from_settings(cls) -> "DomainRateLimiter":
+        return cls(settings.SCRAPER_REQUESTS_PER_SECOND)
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def reserve(self, url: str) -> float:
+        """为该域名预留下一个请求时间，返回需要等待的秒数。"""
+        if not self.enabled:
+            return 0.0
+        domain = urlsplit(url).hostname or url
+        now = self._clock()
+        slot = max(now, self._next_slot.get(domain, now))
+        spacing = self.interval * (1 + self._random.uniform(-self.jitter, self.jitter))
+        self._next_slot[domain] = slot + spacing
+        return slot - now
+
+    async def acquire(self, url: str):
+        # 预留在 await 之前同步完成，并发调用不会拿到同一个时间点
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,83 @@
+from typing import Any, Dict, Iterable
+from urllib.parse import urlsplit
+
+from app.core.config import settings
+
+
+def _split(value: str) -> frozenset:
+    return frozenset(part.strip().lower() for part in value.split(",") if part.strip())
+
+
+def _matches_domain(host: str, domains: Iterable[str]) -> bool:
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+class ResourcePolicy:
+    """
+    浏览器请求的拦截策略：按资源类型 (Playwright 的 resource_type) 和域名决定是否放行。
+    判断顺序：允许的域名总是放行，其次拦截禁止的域名，然后允许的资源类型放行，最后拦截禁止的资源类型。
+    域名匹配包含其子域名。
+    """
+
+    def __init__(
+        self, blocked_types: Iterable[str] = (), allowed_types: Iterable[str] = (),
+        blocked_domains: Iterable[str] = (), allowed_domains: Iterable[str] = (),
+    ):
+        self.blocked_types = frozenset(blocked_types)
+        self.allowed_types = frozenset(allowed_types)
+        self.blocked_domains = frozenset(blocked_domains)
+        self.allowed_domains = frozenset(allowed_domains)
+
+    @classmethod
+    def from_settings(cls) -> "ResourcePolicy":
+        return cls(
+            blocked_types=_split(settings.SCRAPER_BLOCKED_RESOURCE_TYPES),
+            allowed_types=_split(settings.SCRAPER_ALLOWED_RESOURCE_TYPES),
+            blocked_domains=_split(settings.SCRAPER_BLOCKED_DOMAINS),
+            allowed_domains=_split(settings.SCRAPER_ALLOWED_DOMAINS),
+        )
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        host = (urlsplit(url).hostname or "").lower()
+        if _matches_domain(host, self.allowed_domains):
+            return False
+        if _matches_domain(host, self.blocked_domains):
+            return True
+        if resource_type in self.allowed_types:
+            return False
+        return resource_type in self.blocked_types
+
+
+class TrafficMeter:
+    """统计浏览器打开的页面数、完成的请求数与传输字节数 (响应头 + 响应体)，以及被拦截的请求数。"""
+
+    def __init__(self):
+        self.pages = 0
+        self.requests = 0
+        self.blocked = 0
+        self.bytes = 0
+
+    def attach(self, target: Any):
+        """监听浏览器上下文或页面上完成的请求。"""
+        target.on("requestfinished", self._on_request_finished)
+
+    async def _on_request_finished(self, request: Any):
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            # 页面已关闭等情况下拿不到大小，不影响抓取
+            return
+        self.requests += 1
+        self.bytes += max(0, sizes.get("responseHeadersSize", 0)) + max(0, sizes.get("responseBodySize", 0))
+
+    def bytes_per_page(self) -> float:
+        return self.bytes / self.pages if self.pages else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "requests": self.requests,
+            "blocked": self.blocked,
+            "bytes": self.bytes,
+            "bytes_per_page": round(self.bytes_per_page()),
+        }
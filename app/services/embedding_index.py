@@ -0,0 +1,324 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud import crud_job
+from app.db.session import SessionLocal
+from app.services.job_ranker import job_document_text, profile_query_text, tokenize
+
+
+class Embedder(ABC):
+    """文本向量化的抽象基类，返回 L2 归一化后的 float32 向量。"""
+
+    name: str = "base"
+    dim: int = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """返回形状为 (len(texts), dim) 的 float32 矩阵。"""
+        pass
+
+
+class HashingEmbedder(Embedder):
+    """
+    完全离线的特征哈希向量化：词元经 crc32 哈希到固定维度（带符号以抵消冲突），
+    词频取对数后归一化。不需要训练，也不需要网络访问。
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token, tf in Counter(tokenize(text)).items():
+                h = zlib.crc32(token.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                matrix[row, h % self.dim] += sign * (1.0 + math.log(tf))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+def get_embedder() -> Embedder:
+    """
+    向量化器工厂函数，根据 EMBEDDING_PROVIDER 配置返回实例。
+    """
+    provider = settings.EMBEDDING_PROVIDER.lower()
+    if provider == "hashing":
+        return HashingEmbedder(dim=settings.EMBEDDING_DIM)
+    raise ValueError(f"不支持的 EMBEDDING_PROVIDER: {settings.EMBEDDING_PROVIDER}")
+
+
+def embedding_fingerprint(job) -> str:
+    return hashlib.sha256(job_document_text(job).encode("utf-8")).hexdigest()
+
+
+class _IndexSnapshot:
+    """
+    某一时刻完整的索引内容，创建后不再修改。更新索引时整体替换快照，
+    读者只需取一次引用，就能得到相互一致的 job_id、指纹、向量与行号。
+    """
+
+    __slots__ = ("job_ids", "fingerprints", "vectors", "row_of", "meta_mtime", "vectors_file")
+
+    def __init__(
+        self,
+        job_ids: List[int],
+        fingerprints: List[str],
+        vectors: np.ndarray,
+        meta_mtime: Optional[float] = None,
+        vectors_file: Optional[str] = None,
+    ):
+        self.job_ids = job_ids
+        self.fingerprints = fingerprints
+        self.vectors = vectors
+        self.row_of: Dict[int, int] = {job_id: row for row, job_id in enumerate(job_ids)}
+        self.meta_mtime = meta_mtime
+        self.vectors_file = vectors_file
+
+
+class JobEmbeddingStore:
+    """
+    职位向量存储：所有向量保存在一个连续的 float32 矩阵文件中，以 memmap 方式只读加载；
+    元数据 (job_id、内容指纹、向量化器以及对应的矩阵文件名) 保存在旁边的 JSON 文件中。
+    每次保存写入一个新名字的矩阵文件，再原子替换元数据文件，元数据总是指向与之匹配的矩阵。
+    职位内容不变时向量只计算一次。
+    """
+
+    VECTORS_FILE = "job_vectors.f32" # 旧版本元数据未记录矩阵文件名时使用
+    META_FILE = "job_vectors.json"
+
+    def __init__(self, directory: str, embedder: Embedder):
+        self.directory = directory
+        self.embedder = embedder
+        # 加载与同步在锁内进行，并以一次赋值替换快照；检索不加锁，只读取当前快照
+        self._lock = threading.Lock()
+        self._snapshot = self._load() or self._empty_snapshot()
+
+    @property
+    def job_ids(self) -> List[int]:
+        return self._snapshot.job_ids
+
+    @property
+    def fingerprints(self) -> List[str]:
+        return self._snapshot.fingerprints
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._snapshot.vectors
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, self.META_FILE)
+
+    def _empty_snapshot(self) -> _IndexSnapshot:
+        return _IndexSnapshot([], [], np.zeros((0, self.embedder.dim), dtype=np.float32))
+
+    def _load(self) -> Optional[_IndexSnapshot]:
+        """从磁盘读取索引；文件不存在或与当前向量化器不匹配时返回 None。"""
+        try:
+            mtime = os.path.getmtime(self._meta_path)
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("embedder") != self.embedder.name or meta.get("dim") != self.embedder.dim:
+            logging.info("Embedding index on disk was built by a different embedder, rebuilding.")
+            return None
+
+        job_ids = meta.get("job_ids", [])
+        fingerprints = meta.get("fingerprints", [])
+        vectors_file = meta.get("vectors_file", self.VECTORS_FILE)
+        vectors_path = os.path.join(self.directory, vectors_file)
+        expected_size = len(job_ids) * self.embedder.dim * np.dtype(np.float32).itemsize
+        try:
+            size = os.path.getsize(vectors_path) if job_ids else 0
+        except OSError:
+            size = -1
+        if len(fingerprints) != len(job_ids) or size != expected_size:
+            logging.warning("Embedding index metadata does not match its vectors file, rebuilding.")
+            return None
+        if job_ids:
+            vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(len(job_ids), self.embedder.dim))
+        else:
+            vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        return _IndexSnapshot(job_ids, fingerprints, vectors, meta_mtime=mtime, vectors_file=vectors_file)
+
+    def reload_if_changed(self):
+        # 其他进程（例如 worker）更新了索引文件时重新加载
+        with self._lock:
+            self._reload_if_changed()
+
+    def _reload_if_changed(self):
+        # 调用方需持有 self._lock
+        try:
+            mtime = os.path.getmtime(self._meta_path)
+        except OSError:
+            return
+        if mtime != self._snapshot.meta_mtime:
+            snapshot = self._load()
+            if snapshot is not None:
+                self._snapshot = snapshot
+
+    def _save(self, job_ids: List[int], fingerprints: List[str], vectors: np.ndarray):
+        """
+        矩阵写入带版本号的新文件，之后原子替换元数据文件：中途崩溃时元数据仍指向旧矩阵，
+        读者不会看到写了一半或不匹配的索引。调用方需持有 self._lock。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        previous_file = self._snapshot.vectors_file
+        vectors_file = f"job_vectors.{time.time_ns()}.f32"
+        vectors.tofile(os.path.join(self.directory, vectors_file))
+        tmp_meta = self._meta_path + ".tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({
+                "embedder": self.embedder.name,
+                "dim": self.embedder.dim,
+                "vectors_file": vectors_file,
+                "job_ids": job_ids,
+                "fingerprints": fingerprints,
+            }, f)
+        os.replace(tmp_meta, self._meta_path)
+        self._snapshot = self._load() or self._empty_snapshot()
+        if previous_file and previous_file != vectors_file:
+            try:
+                # 已映射旧文件的读者 (包括仍持有旧快照的检索和其他进程) 在 Linux 上仍可继续读取
+                os.remove(os.path.join(self.directory, previous_file))
+            except OSError:
+                pass
+
+    def sync(self, jobs: Iterable) -> int:
+        """
+        使索引与给定的职位集合一致：只为新增或内容变化的职位计算向量，
+        不在集合中的职位被移除。返回新计算的向量数。
+        """
+        jobs = sorted(jobs, key=lambda j: j.id)
+        with self._lock:
+            self._reload_if_changed()
+            current = self._snapshot
+            fingerprints = [embedding_fingerprint(job) for job in jobs]
+            if [job.id for job in jobs] == current.job_ids and fingerprints == current.fingerprints:
+                return 0
+
+            reuse_rows, to_embed = [], []
+            for pos, (job, fp) in enumerate(zip(jobs, fingerprints)):
+                row = current.row_of.get(job.id)
+                if row is not None and current.fingerprints[row] == fp:
+                    reuse_rows.append((pos, row))
+                else:
+                    to_embed.append(pos)
+
+            vectors = np.zeros((len(jobs), self.embedder.dim), dtype=np.float32)
+            if reuse_rows:
+                positions, rows = zip(*reuse_rows)
+                vectors[list(positions)] = current.vectors[list(rows)]
+            if to_embed:
+                vectors[to_embed] = self.embedder.embed([job_document_text(jobs[pos]) for pos in to_embed])
+
+            self._save([job.id for job in jobs], fingerprints, vectors)
+            logging.info(f"Embedding index synced: {len(to_embed)} embedded, {len(reuse_rows)} reused.")
+            return len(to_embed)
+
+    def vector_for(self, job_id: int) -> Optional[np.ndarray]:
+        snapshot = self._snapshot
+        row = snapshot.row_of.get(job_id)
+        return None if row is None else np.asarray(snapshot.vectors[row])
+
+    def search(self, query: np.ndarray, k: int, exclude_ids: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """
+        余弦相似度 top-K 检索（向量已归一化，点积即余弦），返回 [(job_id, score)]。
+        """
+        snapshot = self._snapshot
+        if not snapshot.job_ids or k <= 0:
+            return []
+        scores = np.asarray(snapshot.vectors @ query.astype(np.float32), dtype=np.float32)
+        for job_id in exclude_ids:
+            row = snapshot.row_of.get(job_id)
+            if row is not None:
+                scores[row] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(snapshot.job_ids[row], float(scores[row])) for row in top if np.isfinite(scores[row])]
+
+    def search_text(self, text: str, k: int) -> List[Tuple[int, float]]:
+        return self.search(self.embedder.embed([text])[0], k)
+
+
+_store: Optional[JobEmbeddingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> JobEmbeddingStore:
+    """进程内共享的职位向量存储。"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobEmbeddingStore(settings.EMBEDDING_INDEX_DIR, get_embedder())
+        return _store
+
+
+def sync_active_jobs(db: Session) -> JobEmbeddingStore:
+    """更新索引，使其覆盖当前所有有效职位（需要加载全部职位，只在启动和爬取完成后调用）。"""
+    store = get_embedding_store()
+    store.sync(crud_job.get_all(db, is_active=True))
+    return store
+
+
+def _store_for_query(db: Session) -> JobEmbeddingStore:
+    """
+    查询使用的索引：只检查索引文件是否被其他进程更新，不扫描职位表；
+    仅在索引从未建立时同步一次。索引由启动与爬虫 delta 保持最新。
+    """
+    store = get_embedding_store()
+    store.reload_if_changed()
+    if not store.job_ids:
+        sync_active_jobs(db)
+    return store
+
+
+def similar_jobs(db: Session, *, job_id: int, k: int) -> List[Tuple[int, float]]:
+    store = _store_for_query(db)
+    vector = store.vector_for(job_id)
+    if vector is None:
+        job = crud_job.get(db, id=job_id)
+        if job is None:
+            return []
+        vector = store.embedder.embed([job_document_text(job)])[0]
+    return store.search(vector, k, exclude_ids=[job_id])
+
+
+def jobs_for_profile(db: Session, *, profile_data: Optional[dict], k: int) -> List[Tuple[int, float]]:
+    store = _store_for_query(db)
+    return store.search_text(profile_query_text(profile_data), k)
+
+
+def sync_from_database():
+    """使用独立的数据库会话同步索引（启动时与爬取完成后在线程中调用）。"""
+    db = SessionLocal()
+    try:
+        sync_active_jobs(db)
+    finally:
+        db.close()
+
+
+async def on_scrape_delta(delta: dict):
+    """爬虫 delta 订阅者：爬取完成后为新增/变化的职位计算向量，在线程中执行，不阻塞爬虫的事件循环。"""
+    await asyncio.to_thread(sync_from_database)
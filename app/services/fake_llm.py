@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.llm_client import LLMClient
+from app.services.llm_metrics import record_usage_metadata
+from app.services.prompt_compactor import estimate_tokens
+
+# 批量匹配提示词中每行一个职位 JSON，见 MatchingService._build_batch_prompt
+_JOB_LINE_RE = re.compile(r'^\{"job_id":\s*(\d+)', re.MULTILINE)
+
+
+def _stable_score(text: str) -> int:
+    """同一提示词总是得到相同的分数，便于对比多次基准测试。"""
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16) % 10 + 1
+
+
+class FakeLLMClient(LLMClient):
+    """
+    本地模拟的 LLM 服务商，不发出网络请求，用于压测和开发 (LLM_PROVIDER=fake)。
+    可配置延迟分布 (对数正态，按中位数与 sigma)、随机错误率、随机 429，
+    以及每 N 次调用出现一段连续的 429 (模拟配额突发耗尽)。
+    错误以 httpx.HTTPStatusError 抛出，与真实服务商一致，会经过同样的重试与熔断逻辑。
+    """
+
+    def __init__(
+        self,
+        *,
+        latency_ms: float = 0,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0,
+        rate_limit_rate: float = 0,
+        burst_every: int = 0,
+        burst_length: int = 0,
+        retry_after: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "FakeLLMClient":
+        return cls(
+            latency_ms=settings.FAKE_LLM_LATENCY_MS,
+            latency_sigma=settings.FAKE_LLM_LATENCY_SIGMA,
+            error_rate=settings.FAKE_LLM_ERROR_RATE,
+            rate_limit_rate=settings.FAKE_LLM_RATE_LIMIT_RATE,
+            burst_every=settings.FAKE_LLM_429_BURST_EVERY,
+            burst_length=settings.FAKE_LLM_429_BURST_LENGTH,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        )
+
+    def _latency_seconds(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        return self._random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+    def _error_status(self, call: int) -> Optional[int]:
+        if self.burst_every > 0 and self.burst_length > 0:
+            if (call - 1) % self.burst_every >= self.burst_every - self.burst_length:
+                return 429
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 503
+        return None
+
+    def _raise_status(self, status: int):
+        request = httpx.Request("POST", "http://fake-llm.local/v1/models/fake:generateContent")
+        headers = {"Retry-After": str(self.retry_after)} if status == 429 and self.retry_after is not None else {}
+        response = httpx.Response(status, headers=headers, request=request)
+        raise httpx.HTTPStatusError(f"Fake LLM returned {status}", request=request, response=response)
+
+    def respond(self, prompt: str) -> str:
+        """根据提示词类型生成符合格式的响应。"""
+        job_ids: List[int] = [int(job_id) for job_id in _JOB_LINE_RE.findall(prompt)]
+        if job_ids:
+            return json.dumps([
+                {
+                    "job_id": job_id,
+                    "score": _stable_score(f"{job_id}\x1f{prompt}"),
+                    "summary": "模拟评估：满足部分关键要求。",
+                    "improvement_suggestions": "模拟建议：补充相关项目经验。",
+                }
+                for job_id in job_ids
+            ], ensure_ascii=False)
+        if "简历文本如下" in prompt:
+            data: Dict[str, Any] = {
+                "name": "模拟用户", "phone": None, "email": None,
+                "skills": ["Python"], "work_experience": [], "education": [],
+            }
+            return json.dumps(data, ensure_ascii=False)
+        return json.dumps({
+            "score": _stable_score(prompt),
+            "summary": "模拟评估：满足部分关键要求。",
+            "improvement_suggestions": "模拟建议：补充相关项目经验。",
+        }, ensure_ascii=False)
+
+    def _next_call(self):
+        with self._lock:
+            self.calls += 1
+            return self._latency_seconds(), self._error_status(self.calls)
+
+    async def generate(self, prompt: str) -> str:
+        latency, status = self._next_call()
+        if latency:
+            await asyncio.sleep(latency)
+        if status is not None:
+            self._raise_status(status)
+        text = self.respond(prompt)
+        self._record_usage(prompt, text)
+        return text
+
+    @staticmethod
+    def _record_usage(prompt: str, text: str):
+        """按估算的 token 数返回用量，与真实服务商的 usageMetadata 格式一致。"""
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        record_usage_metadata({
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": prompt_tokens + completion_tokens,
+        })
+
+    async def generate_stream(self, prompt: str, chunk_chars: int = 16) -> AsyncIterator[str]:
+        """首个片段在约 1/5 的延迟后到达，其余片段均匀分布在剩余时间内。"""
+        latency, status = self._next_call()
+        if latency:
+            await asyncio.sleep(latency / 5)
+        if status is not None:
+            self._raise_status(status)
+        text = self.respond(prompt)
+        self._record_usage(prompt, text)
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        for index, chunk in enumerate(chunks):
+            if index and latency:
+                await asyncio.sleep(latency * 4 / 5 / max(len(chunks) - 1, 1))
+            yield chunk
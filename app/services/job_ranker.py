@@ -0,0 +1,131 @@
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 英文/数字词元，以及连续的中日韩字符
+_LATIN_RE = re.compile(r"[a-z0-9][a-z0-9+#.\-]*")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
+
+# 画像中用于预排序的字段
+PROFILE_QUERY_KEYS = ("skills", "work_experience")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    中英文混合分词：英文按单词切分（保留 c++、c#、node.js 这类写法），
+    中文使用字符二元组，不依赖额外的分词库。
+    """
+    if not text:
+        return []
+    text = text.lower()
+    tokens = [t.rstrip(".-") for t in _LATIN_RE.findall(text)]
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return [t for t in tokens if t]
+
+
+def _flatten_text(value: Any) -> Iterable[str]:
+    if value is None:
+        return
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _flatten_text(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _flatten_text(v)
+    else:
+        yield str(value)
+
+
+def profile_query_text(profile_data: Optional[dict]) -> str:
+    """提取画像中的技能与工作经验文本；两者都没有时退回到整个画像。"""
+    profile_data = profile_data or {}
+    parts = [profile_data.get(key) for key in PROFILE_QUERY_KEYS if profile_data.get(key)]
+    return " ".join(_flatten_text(parts or profile_data))
+
+
+def job_document_text(job) -> str:
+    # 标题重复一次以提高其权重
+    fields = [
+        job.title, job.title,
+        job.job_responsibilities, job.job_requirements,
+        job.description,
+    ]
+    return " ".join(f for f in fields if f)
+
+
+class BM25Index:
+    """基于倒排表的 BM25 索引，文档为职位，查询为画像文本。"""
+
+    def __init__(self, doc_ids: List[int], documents: List[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.doc_ids = doc_ids
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = [len(doc) for doc in documents]
+        self.avg_doc_length = (sum(self.doc_lengths) / len(documents)) if documents else 0.0
+
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for idx, doc in enumerate(documents):
+            for term, tf in Counter(doc).items():
+                self.postings[term].append((idx, tf))
+
+        n = len(documents)
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    @classmethod
+    def from_jobs(cls, jobs) -> "BM25Index":
+        return cls([job.id for job in jobs], [tokenize(job_document_text(job)) for job in jobs])
+
+    def score(self, query_tokens: Iterable[str]) -> Dict[int, float]:
+        """返回 doc 下标 -> BM25 分数，只包含至少命中一个词的文档。"""
+        scores: Dict[int, float] = defaultdict(float)
+        avgdl = self.avg_doc_length or 1.0
+        for term in set(query_tokens):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for idx, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[idx] / avgdl)
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def top_k(self, query_text: str, k: int) -> List[Tuple[int, float]]:
+        """返回得分最高的 k 个 (job_id, score)，按分数降序。"""
+        scores = self.score(tokenize(query_text))
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(self.doc_ids[idx], score) for idx, score in ranked]
+
+
+# 索引按职位语料的指纹缓存，语料不变时在不同画像之间复用
+_index_cache: Dict[str, BM25Index] = {}
+_index_lock = threading.Lock()
+
+
+def corpus_signature(jobs, job_fingerprints: Dict[int, str]) -> str:
+    digest = hashlib.sha256()
+    for job in sorted(jobs, key=lambda j: j.id):
+        digest.update(f"{job.id}:{job_fingerprints[job.id]};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_job_index(jobs, job_fingerprints: Dict[int, str]) -> BM25Index:
+    """获取（必要时构建）当前职位语料的 BM25 索引。"""
+    signature = corpus_signature(jobs, job_fingerprints)
+    with _index_lock:
+        index = _index_cache.get(signature)
+        if index is None:
+            index = BM25Index.from_jobs(jobs)
+            # 只保留最新语料的索引
+            _index_cache.clear()
+            _index_cache[signature] = index
+        return index
@@ -0,0 +1,273 @@
+import contextlib
+import contextvars
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.services.llm_client import LLMClient
+from app.services.llm_metrics import record_cache_hit
+
+# 为 False 时当前上下文中的 LLM 调用跳过缓存（既不读也不写）
+_cache_enabled: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_enabled", default=True)
+
+
+@contextlib.contextmanager
+def no_cache():
+    """在 with 块内的 LLM 调用不使用响应缓存，例如用户要求重新分析时。"""
+    token = _cache_enabled.set(False)
+    try:
+        yield
+    finally:
+        _cache_enabled.reset(token)
+
+
+# 当前上下文中响应的校验函数：未通过校验的响应不写入缓存，已缓存的此类响应视为未命中并删除
+_response_validator: contextvars.ContextVar[Optional[Callable[[str], bool]]] = contextvars.ContextVar(
+    "llm_response_validator", default=None
+)
+
+
+@contextlib.contextmanager
+def cache_only_valid(validator: Callable[[str], bool]):
+    """
+    with 块内的 LLM 调用只缓存 validator(response) 为真的响应，
+    避免无法解析的响应被缓存后在有效期内一直返回给调用方。
+    """
+    token = _response_validator.set(validator)
+    try:
+        yield
+    finally:
+        _response_validator.reset(token)
+
+
+def _is_valid(response: str) -> bool:
+    validator = _response_validator.get()
+    if validator is None:
+        return True
+    try:
+        return bool(validator(response))
+    except Exception:
+        return False
+
+
+def prompt_key(provider: str, model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{provider}\x1f{model}\x1f{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    基于 SQLite 的 LLM 响应缓存，以 (服务商, 模型, 提示词哈希) 为键。
+    超过有效期的条目视为未命中；条目数或总大小超限时按最近访问时间淘汰 (LRU)。
+    使用 WAL 模式，多个 worker 进程可以共享同一个缓存文件。
+    """
+
+    # 每写入多少条检查一次容量，避免每次写入都统计全表
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str, max_entries: int = 0, max_bytes: int = 0, max_age_seconds: float = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # fork 出的子进程不能复用父进程的连接
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                " key TEXT PRIMARY KEY, provider TEXT NOT NULL, model TEXT NOT NULL,"
+                " response TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_responses_last_access ON llm_responses (last_access)")
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.max_age_seconds > 0 and now - created_at > self.max_age_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute("SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._expired(row[1], now):
+                    conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                    self.stats["evictions"] += 1
+                    row = None
+                if row is not None:
+                    conn.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            # 缓存出错不影响正常调用
+            self.stats["errors"] += 1
+            logging.warning(f"LLM response cache read failed: {e}")
+            return None
+        self.stats["hits" if row is not None else "misses"] += 1
+        return None if row is None else row[0]
+
+    def delete(self, key: str):
+        try:
+            with self._lock:
+                self._connection().execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            logging.warning(f"LLM response cache delete failed: {e}")
+
+    def put(self, key: str, provider: str, model: str, response: str):
+        now = time.time()
+        try:
+            with self._lock:
+                self._connection().execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, provider, model, response, size, created_at, last_access)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, provider, model, response, len(response.encode("utf-8")), now, now),
+                )
+                self.stats["writes"] += 1
+                self._writes_since_evict += 1
+                if self._writes_since_evict >= self.EVICT_EVERY:
+                    self._evict(now)
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            logging.warning(f"LLM response cache write failed: {e}")
+
+    def evict(self) -> int:
+        """按有效期、条目数与总大小淘汰条目，返回淘汰的条目数。"""
+        with self._lock:
+            return self._evict(time.time())
+
+    def _evict(self, now: float) -> int:
+        conn = self._connection()
+        self._writes_since_evict = 0
+        removed = 0
+        if self.max_age_seconds > 0:
+            removed += conn.execute(
+                "DELETE FROM llm_responses WHERE created_at < ?", (now - self.max_age_seconds,)
+            ).rowcount
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses").fetchone()
+        if (self.max_entries and count > self.max_entries) or (self.max_bytes and total > self.max_bytes):
+            # 从最久未访问的条目开始删除，直到条目数与总大小都在限制内
+            to_delete = []
+            for key, size in conn.execute("SELECT key, size FROM llm_responses ORDER BY last_access"):
+                if (not self.max_entries or count <= self.max_entries) and (not self.max_bytes or total <= self.max_bytes):
+                    break
+                to_delete.append((key,))
+                count -= 1
+                total -= size
+            conn.executemany("DELETE FROM llm_responses WHERE key = ?", to_delete)
+            removed += len(to_delete)
+        self.stats["evictions"] += removed
+        return removed
+
+    def summary(self) -> Dict[str, Any]:
+        """本进程的命中统计，以及缓存文件中的条目数与大小。"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        summary: Dict[str, Any] = dict(self.stats, hit_rate=round(self.stats["hits"] / lookups, 4) if lookups else None)
+        try:
+            with self._lock:
+                count, total = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses"
+                ).fetchone()
+            summary.update(entries=count, bytes=total)
+        except sqlite3.Error as e:
+            logging.warning(f"LLM response cache stats failed: {e}")
+        return summary
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class CachedLLMClient(LLMClient):
+    """
+    在 LLMClient 外层加一层持久化响应缓存。相同的服务商、模型和提示词直接返回
+    已缓存的响应，不再请求 API；失败的调用以及未通过 cache_only_valid() 校验的响应不会被缓存。
+    """
+
+    def __init__(self, inner: LLMClient, cache: LLMResponseCache, provider: str, model: str):
+        self.inner = inner
+        self.cache = cache
+        self.provider = provider
+        self.model = model
+        self.max_concurrency = inner.max_concurrency
+
+    @classmethod
+    def from_settings(
+        cls, inner: LLMClient, provider: Optional[str] = None, model: Optional[str] = None
+    ) -> "CachedLLMClient":
+        """provider / model 为缓存键中的模型标识，默认取 LLM_PROVIDER / LLM_MODEL_NAME。"""
+        cache = LLMResponseCache(
+            settings.LLM_CACHE_PATH,
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            max_bytes=int(settings.LLM_CACHE_MAX_MB * 1024 * 1024),
+            max_age_seconds=settings.LLM_CACHE_MAX_AGE_DAYS * 86400,
+        )
+        return cls(
+            inner, cache, provider or settings.LLM_PROVIDER.lower(),
+            model if model is not None else settings.LLM_MODEL_NAME
+        )
+
+    async def start(self):
+        await self.inner.start()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        cached = self.cache.get(key)
+        if cached is not None and not _is_valid(cached):
+            # 校验规则加入之前缓存的无效响应
+            self.cache.delete(key)
+            return None
+        return cached
+
+    async def generate(self, prompt: str, use_cache: bool = True) -> str:
+        use_cache = use_cache and _cache_enabled.get()
+        key = prompt_key(self.provider, self.model, prompt)
+        if use_cache:
+            cached = self._lookup(key)
+            if cached is not None:
+                record_cache_hit()
+                return cached
+
+        response = await self.inner.generate(prompt)
+        if use_cache and _is_valid(response):
+            self.cache.put(key, self.provider, self.model, response)
+        return response
+
+    async def generate_stream(self, prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """命中缓存时一次性返回完整响应；未命中时边转发边拼接，完整结束后写入缓存。"""
+        use_cache = use_cache and _cache_enabled.get()
+        key = prompt_key(self.provider, self.model, prompt)
+        if use_cache:
+            cached = self._lookup(key)
+            if cached is not None:
+                record_cache_hit()
+                yield cached
+                return
+
+        parts = []
+        async for chunk in self.inner.generate_stream(prompt):
+            parts.append(chunk)
+            yield chunk
+        response = "".join(parts)
+        if use_cache and _is_valid(response):
+            self.cache.put(key, self.provider, self.model, response)
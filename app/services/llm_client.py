@@ -1,53 +1,165 @@
+import asyncio
 import httpx
 import json
+import logging
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, Optional
 
 from app.core.config import settings
+from app.services.llm_metrics import record_usage_metadata
+
+def build_resume_prompt(content: str) -> str:
+    return (
+        "请从以下简历文本中，提取关键信息并以JSON格式返回。"
+        "确保返回的是一个合法的JSON对象，不要在JSON前后添加任何额外的标记，比如 ```json ... ```。"
+        "需要提取的字段包括：姓名(name), 电话(phone), 邮箱(email), "
+        "技能(skills), 工作经验(work_experience), 教育背景(education)。"
+        "\n\n简历文本如下：\n---\n"
+        f"{content}\n---"
+    )
+
+def parse_json_response(response_text: str) -> Any:
+    """解析 LLM 返回的 JSON，兼容包裹在 ```json ... ``` 中的情况。"""
+    # 处理返回文本中可能包含的 markdown 标记
+    if '```json' in response_text:
+        json_str = response_text.split('```json')[1].split('```')[0].strip()
+    else:
+        json_str = response_text
+
+    return json.loads(json_str)
+
+def is_json_object(response_text: str) -> bool:
+    """响应能否解析为 JSON 对象（简历分析结果的校验，用于决定是否缓存）。"""
+    try:
+        return isinstance(parse_json_response(response_text), dict)
+    except (ValueError, IndexError):
+        return False
 
 class LLMClient(ABC):
     """抽象 LLM 客户端基类"""
 
+    # 该服务商允许同时进行的请求数，匹配服务据此限制并发
+    max_concurrency: int = settings.LLM_MAX_CONCURRENCY
+
     @abstractmethod
+    async def generate(self, prompt: str) -> str:
+        """发送提示词并返回模型生成的文本"""
+        pass
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        流式生成，按到达顺序逐段返回文本。
+        不支持流式接口的服务商退化为一次性返回完整结果。
+        """
+        yield await self.generate(prompt)
+
     async def analyze(self, content: str) -> Dict[str, Any]:
-        """使用 LLM 分析文本内容"""
+        """使用 LLM 分析简历文本，返回结构化的画像"""
+        # 缓存层依赖本模块，在此处导入以避免循环导入
+        from app.services.llm_cache import cache_only_valid
+
+        with cache_only_valid(is_json_object):
+            response_text = await self.generate(build_resume_prompt(content))
+        return parse_json_response(response_text)
+
+    def analyze_stream(self, content: str) -> AsyncIterator[str]:
+        """流式分析简历，返回文本片段；调用方拼接后用 parse_json_response 校验。"""
+        return self.generate_stream(build_resume_prompt(content))
+
+    async def start(self):
+        """应用启动时调用，预先建立所需资源"""
+        pass
+
+    async def aclose(self):
+        """释放连接等资源；之后再次调用会重新建立"""
         pass
 
 class GeminiClient(LLMClient):
-    """Google Gemini API 客户端 (简化版用于调试)"""
+    """
+    Google Gemini API 客户端。
+    所有请求共享一个带连接池的 httpx.AsyncClient（keep-alive，可选 HTTP/2），
+    避免每次调用都重新建立 TCP/TLS 连接。
+    """
 
-    def __init__(self, api_key: str, model_name: str, base_url: str):
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str,
+        base_url: str,
+        max_concurrency: int | None = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
         self.api_key = api_key
         self.model_name = model_name
+        if max_concurrency:
+            self.max_concurrency = max_concurrency
         self.base_url = base_url.rstrip('/')
         self.api_url = f"{self.base_url}/v1/models/{self.model_name}:generateContent?key={self.api_key}"
-        print(f"GeminiClient initialized for model {self.model_name}")
+        self.stream_url = f"{self.base_url}/v1/models/{self.model_name}:streamGenerateContent?alt=sse&key={self.api_key}"
+        self._transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        self._http_loop: Optional[asyncio.AbstractEventLoop] = None
+        logging.info(f"GeminiClient initialized for model {self.model_name}")
 
-    async def analyze(self, content: str) -> Dict[str, Any]:
-        prompt = (
-            "请从以下简历文本中，提取关键信息并以JSON格式返回。"
-            "确保返回的是一个合法的JSON对象，不要在JSON前后添加任何额外的标记，比如 ```json ... ```。"
-            "需要提取的字段包括：姓名(name), 电话(phone), 邮箱(email), "
-            "技能(skills), 工作经验(work_experience), 教育背景(education)。"
-            "\n\n简历文本如下：\n---\n"
-            f"{content}\n---"
+    def _build_http_client(self) -> httpx.AsyncClient:
+        http2 = settings.LLM_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logging.warning("h2 未安装，LLM 请求回退到 HTTP/1.1 (pip install 'httpx[http2]')")
+                http2 = False
+        return httpx.AsyncClient(
+            http2=http2,
+            transport=self._transport,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.LLM_HTTP_TIMEOUT, connect=10.0),
+            headers={'Content-Type': 'application/json'},
         )
-        
-        response_text = await self.generate(prompt)
-        
-        # 处理返回文本中可能包含的 markdown 标记
-        if '```json' in response_text:
-            json_str = response_text.split('```json')[1].split('```')[0].strip()
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """
+        返回共享的连接池。连接池绑定在创建它的事件循环上，
+        worker 每个任务各自 asyncio.run，循环变化时需要重新创建。
+        """
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http.is_closed or self._http_loop is not loop:
+            if self._http is not None and not self._http.is_closed:
+                self._discard_http(self._http, self._http_loop)
+            self._http = self._build_http_client()
+            self._http_loop = loop
+        return self._http
+
+    @staticmethod
+    def _discard_http(http: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]):
+        """
+        关闭绑定在其他事件循环上的旧连接池：旧循环仍在运行时在该循环中关闭；
+        循环已结束则无法再正常关闭连接，说明调用方未在循环结束前调用 close_llm_client()。
+        """
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(http.aclose(), loop)
         else:
-            json_str = response_text
-        
-        return json.loads(json_str)
+            logging.warning("LLM 连接池所在的事件循环已结束但未关闭连接池，请在循环结束前调用 close_llm_client()")
+
+    async def start(self):
+        self._get_http()
+
+    async def aclose(self):
+        http, loop = self._http, self._http_loop
+        self._http, self._http_loop = None, None
+        if http is None or http.is_closed:
+            return
+        if loop is asyncio.get_running_loop():
+            await http.aclose()
+        else:
+            self._discard_http(http, loop)
 
     async def generate(self, prompt: str) -> str:
-        headers = {
-            'Content-Type': 'application/json',
-        }
-        
         json_data = {
             "contents": [
                 {
@@ -59,42 +171,130 @@ class GeminiClient(LLMClient):
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(self.api_url, headers=headers, json=json_data, timeout=120.0)
-                response.raise_for_status()
-                
-                raw_response_json = response.json()
-                
-                text_content = raw_response_json['candidates'][0]['content']['parts'][0]['text']
-                return text_content
+            response = await self._get_http().post(self.api_url, json=json_data)
+            response.raise_for_status()
+
+            raw_response_json = response.json()
+            record_usage_metadata(raw_response_json.get('usageMetadata'))
+
+            text_content = raw_response_json['candidates'][0]['content']['parts'][0]['text']
+            return text_content
 
         except (httpx.HTTPStatusError, KeyError, IndexError, json.JSONDecodeError) as e:
-            print(f"调用或解析 Gemini API 失败: {e}")
+            logging.error(f"调用或解析 Gemini API 失败: {e}")
             raise
         except Exception as e:
-            print(f"调用 Gemini API 时发生未知错误: {e}")
+            logging.error(f"调用 Gemini API 时发生未知错误: {e}")
+            raise
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """使用 streamGenerateContent (SSE) 接口，每收到一个片段就返回其中的文本。"""
+        json_data = {"contents": [{"parts": [{"text": prompt}]}]}
+
+        usage = None
+        try:
+            async with self._get_http().stream("POST", self.stream_url, json=json_data) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[len("data:"):].strip())
+                    # 每个片段中的 usageMetadata 是累计值，只记录最后一个
+                    usage = chunk.get('usageMetadata') or usage
+                    parts = chunk.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+                    text = "".join(part.get('text', '') for part in parts)
+                    if text:
+                        yield text
+            record_usage_metadata(usage)
+
+        except (httpx.HTTPStatusError, KeyError, IndexError, json.JSONDecodeError) as e:
+            logging.error(f"调用或解析 Gemini 流式 API 失败: {e}")
             raise
 
 class GenericLLMClient(LLMClient):
     """一个备用客户端，用于指示配置错误。"""
-    async def analyze(self, content: str) -> Dict[str, Any]:
-        print("警告: 正在使用通用的 LLM 客户端，这通常表示配置不正确。")
+    async def generate(self, prompt: str) -> str:
+        logging.warning("正在使用通用的 LLM 客户端，这通常表示配置不正确。")
         raise NotImplementedError("没有配置特定的 LLM 服务商 (例如在 .env 文件中设置 LLM_PROVIDER=google)")
 
+def _create_provider_client(
+    provider: str, *, model_name: str, api_key: Optional[str], base_url: Optional[str], max_concurrency: int
+) -> LLMClient:
+    """创建单个服务商的客户端（不含限流、缓存等包装层）。"""
+    if provider == "google":
+        if not all([api_key, model_name, base_url]):
+            raise ValueError("对于 google provider, LLM_API_KEY, LLM_MODEL_NAME, 和 LLM_API_BASE_URL 必须全部设置。")
+        return GeminiClient(
+            api_key=api_key,
+            model_name=model_name,
+            base_url=base_url,
+            max_concurrency=max_concurrency
+        )
+    if provider == "fake":
+        from app.services.fake_llm import FakeLLMClient
+        client = FakeLLMClient.from_settings()
+        client.max_concurrency = max_concurrency
+        return client
+    raise ValueError(f"不支持的 LLM 服务商: {provider}")
+
+def _create_llm_client() -> LLMClient:
+    # 包装层依赖本模块中的 LLMClient，在此处导入以避免循环导入
+    from app.services.llm_cache import CachedLLMClient
+    from app.services.llm_instrumentation import InstrumentedLLMClient
+    from app.services.llm_resilience import ResilientLLMClient
+    from app.services.llm_router import backends_cache_identity, build_router, parse_backend_specs
+
+    if settings.LLM_BACKENDS:
+        def create_backend_client(spec: Dict[str, Any]) -> LLMClient:
+            inner = _create_provider_client(
+                str(spec.get("provider", settings.LLM_PROVIDER)).lower(),
+                model_name=spec.get("model", settings.LLM_MODEL_NAME),
+                api_key=spec.get("api_key", settings.LLM_API_KEY),
+                base_url=spec.get("base_url", settings.LLM_API_BASE_URL),
+                max_concurrency=int(spec.get("max_concurrency", settings.LLM_MAX_CONCURRENCY)),
+            )
+            # 由路由负责在后端之间切换，单个后端默认不重试，避免故障后端拖慢切换
+            return ResilientLLMClient.from_settings(inner, max_attempts=int(spec.get("max_attempts", 1)))
+
+        specs = parse_backend_specs(settings.LLM_BACKENDS)
+        client = build_router(specs, create_backend_client)
+        cache_provider, cache_model = backends_cache_identity(specs)
+    else:
+        provider = settings.LLM_PROVIDER.lower()
+        if provider not in ("google", "fake"):
+            return GenericLLMClient()
+        client = ResilientLLMClient.from_settings(_create_provider_client(
+            provider,
+            model_name=settings.LLM_MODEL_NAME,
+            api_key=settings.LLM_API_KEY,
+            base_url=settings.LLM_API_BASE_URL,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        ))
+        cache_provider, cache_model = provider, settings.LLM_MODEL_NAME
+
+    # 缓存在限流之外，命中时不占用限流配额
+    if settings.LLM_CACHE_ENABLED:
+        client = CachedLLMClient.from_settings(client, provider=cache_provider, model=cache_model)
+    # 统计在最外层，缓存命中也会记录
+    return InstrumentedLLMClient(client)
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
 def get_llm_client() -> LLMClient:
     """
     LLM 客户端工厂函数。
-    根据配置返回一个 LLM 客户端实例。
+    根据配置返回进程内共享的 LLM 客户端实例，首次调用时创建。
     """
-    provider = settings.LLM_PROVIDER.lower()
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _create_llm_client()
+        return _client
 
-    if provider == "google":
-        if not all([settings.LLM_API_KEY, settings.LLM_MODEL_NAME, settings.LLM_API_BASE_URL]):
-            raise ValueError("对于 google provider, LLM_API_KEY, LLM_MODEL_NAME, 和 LLM_API_BASE_URL 必须全部设置。")
-        return GeminiClient(
-            api_key=settings.LLM_API_KEY,
-            model_name=settings.LLM_MODEL_NAME,
-            base_url=settings.LLM_API_BASE_URL
-        )
-    
-    return GenericLLMClient()
\ No newline at end of file
+async def close_llm_client():
+    """关闭共享客户端的连接池（应用关闭或 worker 任务结束时调用）。"""
+    if _client is not None:
+        await _client.aclose()
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict
+
+from app.services.llm_client import LLMClient
+from app.services.llm_metrics import begin_call, end_call, record_call
+from app.services.llm_resilience import CircuitOpenError
+
+
+class InstrumentedLLMClient(LLMClient):
+    """
+    最外层的统计包装：为每次调用记录延迟、提示词与响应大小、token 用量、重试次数和结果，
+    累计到本进程以及当前 track_llm_usage() 的统计中，并输出一行结构化日志。
+    """
+
+    def __init__(self, inner: LLMClient):
+        self.inner = inner
+        self.max_concurrency = inner.max_concurrency
+
+    async def start(self):
+        await self.inner.start()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+    @staticmethod
+    def _new_call(prompt: str, stream: bool) -> Dict[str, Any]:
+        return {
+            "stream": stream, "outcome": "ok", "error": None, "cache_hit": False, "retries": 0,
+            "prompt_chars": len(prompt), "response_chars": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "latency": 0.0,
+        }
+
+    def _finish(self, call: Dict[str, Any], started: float):
+        call["latency"] = time.perf_counter() - started
+        if call["outcome"] == "ok" and call["cache_hit"]:
+            call["outcome"] = "cache_hit"
+        record_call(call)
+        logging.info(json.dumps(
+            {"event": "llm_call", **call, "latency": round(call["latency"], 4)}, ensure_ascii=False
+        ))
+
+    @staticmethod
+    def _fail(call: Dict[str, Any], error: BaseException):
+        if isinstance(error, CircuitOpenError):
+            call["outcome"] = "circuit_open"
+        elif isinstance(error, (GeneratorExit, asyncio.CancelledError)):
+            call["outcome"] = "cancelled"
+        else:
+            call["outcome"] = "error"
+        call["error"] = type(error).__name__
+
+    async def generate(self, prompt: str) -> str:
+        call = self._new_call(prompt, stream=False)
+        token = begin_call(call)
+        started = time.perf_counter()
+        try:
+            response = await self.inner.generate(prompt)
+            call["response_chars"] = len(response)
+            return response
+        except BaseException as e:
+            self._fail(call, e)
+            raise
+        finally:
+            end_call(token)
+            self._finish(call, started)
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        call = self._new_call(prompt, stream=True)
+        token = begin_call(call)
+        started = time.perf_counter()
+        try:
+            async for chunk in self.inner.generate_stream(prompt):
+                call["response_chars"] += len(chunk)
+                yield chunk
+        except BaseException as e:
+            self._fail(call, e)
+            raise
+        finally:
+            try:
+                end_call(token)
+            except ValueError:
+                # 生成器在其他上下文中被关闭时无法还原，不影响统计
+                pass
+            self._finish(call, started)
+
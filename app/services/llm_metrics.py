@@ -0,0 +1,185 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+# 延迟直方图的桶上界 (秒)，最后一个桶收集所有更慢的调用
+LATENCY_BUCKETS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 当前正在进行的调用记录，内层包装 (重试、缓存、服务商客户端) 通过下面的 record_* 函数补充信息
+_current_call: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("llm_current_call", default=None)
+# 当前上下文中正在统计的 UsageStats，嵌套的 track_llm_usage() 会同时累计到外层
+_collectors: contextvars.ContextVar[Tuple["UsageStats", ...]] = contextvars.ContextVar("llm_usage_collectors", default=())
+
+
+def record_usage_metadata(metadata: Optional[Dict[str, Any]]):
+    """记录服务商返回的 token 用量 (Gemini 的 usageMetadata 格式)。对冲产生的重复请求会累加。"""
+    call = _current_call.get()
+    if call is None or not metadata:
+        return
+    call["prompt_tokens"] += int(metadata.get("promptTokenCount") or 0)
+    call["completion_tokens"] += int(metadata.get("candidatesTokenCount") or 0)
+    call["total_tokens"] += int(metadata.get("totalTokenCount") or 0)
+
+
+def begin_call(call: Dict[str, Any]) -> contextvars.Token:
+    """把 call 设为当前调用，内层包装通过 record_* 函数补充信息；返回值交给 end_call()。"""
+    return _current_call.set(call)
+
+
+def end_call(token: contextvars.Token):
+    _current_call.reset(token)
+
+
+def record_call(call: Dict[str, Any]):
+    """把一次已结束的调用累计到本进程以及当前所有 track_llm_usage() 的统计中。"""
+    process_usage.record(call)
+    for usage in _collectors.get():
+        usage.record(call)
+
+
+def record_retry():
+    call = _current_call.get()
+    if call is not None:
+        call["retries"] += 1
+
+
+def record_cache_hit():
+    call = _current_call.get()
+    if call is not None:
+        call["cache_hit"] = True
+
+
+class UsageStats:
+    """一组 LLM 调用的累计统计：次数、结果、重试、提示词/响应大小、token 与延迟直方图。"""
+
+    COUNTERS = (
+        "calls", "succeeded", "failed", "cache_hits", "retries",
+        "prompt_chars", "response_chars", "prompt_tokens", "completion_tokens", "total_tokens",
+    )
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.llm_seconds = 0.0
+        self.max_latency = 0.0
+        self.latency_histogram: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, call: Dict[str, Any]):
+        self.calls += 1
+        if call["outcome"] in ("ok", "cache_hit"):
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        if call["cache_hit"]:
+            self.cache_hits += 1
+        for name in ("retries", "prompt_chars", "response_chars", "prompt_tokens", "completion_tokens", "total_tokens"):
+            setattr(self, name, getattr(self, name) + call[name])
+        latency = call["latency"]
+        self.llm_seconds += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def merge(self, other: "UsageStats"):
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.llm_seconds += other.llm_seconds
+        self.max_latency = max(self.max_latency, other.max_latency)
+        self.latency_histogram = [a + b for a, b in zip(self.latency_histogram, other.latency_histogram)]
+
+    def to_record(self) -> Dict[str, Any]:
+        """持久化用的字段 (与 models.LLMUsage 的列对应)。"""
+        return {
+            **{name: getattr(self, name) for name in self.COUNTERS},
+            "llm_seconds": self.llm_seconds,
+            "max_latency": self.max_latency,
+            "latency_histogram": list(self.latency_histogram),
+            "estimated_cost": self.estimated_cost(),
+        }
+
+    @classmethod
+    def from_records(cls, records: Iterable[Any]) -> "UsageStats":
+        """合并多条持久化的汇总记录。"""
+        total = cls()
+        for record in records:
+            total.merge(cls.from_record(record))
+        return total
+
+    @classmethod
+    def from_record(cls, record: Any) -> "UsageStats":
+        """从持久化的汇总记录 (models.LLMUsage) 还原，用于跨运行合并。"""
+        usage = cls()
+        for name in cls.COUNTERS:
+            setattr(usage, name, getattr(record, name) or 0)
+        usage.llm_seconds = record.llm_seconds or 0.0
+        usage.max_latency = record.max_latency or 0.0
+        histogram = list(record.latency_histogram or [])
+        if len(histogram) == len(usage.latency_histogram):
+            usage.latency_histogram = histogram
+        return usage
+
+    def latency_percentile(self, pct: float) -> Optional[float]:
+        """按直方图估算分位数，返回所在桶的上界 (最后一个桶返回最大延迟)。"""
+        if not self.calls:
+            return None
+        target = pct / 100 * self.calls
+        seen = 0
+        for index, count in enumerate(self.latency_histogram):
+            seen += count
+            if count and seen >= target:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max_latency
+        return self.max_latency
+
+    def estimated_cost(self) -> float:
+        return (
+            self.prompt_tokens * settings.LLM_PRICE_INPUT_PER_1M
+            + self.completion_tokens * settings.LLM_PRICE_OUTPUT_PER_1M
+        ) / 1_000_000
+
+    def summary(self) -> Dict[str, Any]:
+        p50, p95 = self.latency_percentile(50), self.latency_percentile(95)
+        return {
+            **{name: getattr(self, name) for name in self.COUNTERS},
+            "llm_seconds": round(self.llm_seconds, 3),
+            "p50_latency_ms": None if p50 is None else round(p50 * 1000, 1),
+            "p95_latency_ms": None if p95 is None else round(p95 * 1000, 1),
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "latency_histogram": self.histogram_dict(),
+            "estimated_cost": round(self.estimated_cost(), 6),
+        }
+
+    def histogram_dict(self) -> Dict[str, int]:
+        labels = [f"le_{bound:g}s" for bound in LATENCY_BUCKETS] + ["gt_%gs" % LATENCY_BUCKETS[-1]]
+        return dict(zip(labels, self.latency_histogram))
+
+
+# 本进程启动以来的所有调用
+process_usage = UsageStats()
+
+
+@contextlib.contextmanager
+def track_llm_usage() -> Iterator[UsageStats]:
+    """统计 with 块内 (包括其中创建的 asyncio 任务) 的所有 LLM 调用。"""
+    usage = UsageStats()
+    token = _collectors.set(_collectors.get() + (usage,))
+    try:
+        yield usage
+    finally:
+        _collectors.reset(token)
+
+
+def usage_by_profile(records: Iterable[Any]) -> Dict[int, UsageStats]:
+    """按 user_profile_id 合并持久化的汇总记录。"""
+    totals: Dict[int, UsageStats] = {}
+    for record in records:
+        totals.setdefault(record.user_profile_id, UsageStats()).merge(UsageStats.from_record(record))
+    return totals
+
+
+def log_usage(event: str, usage: UsageStats, **fields):
+    """以单行 JSON 输出结构化日志，便于日志系统按字段检索与聚合。"""
+    logging.info(json.dumps({"event": event, **fields, **usage.summary()}, ensure_ascii=False))
@@ -0,0 +1,370 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.llm_client import LLMClient
+from app.services.llm_metrics import record_retry
+from app.services.prompt_compactor import estimate_tokens
+
+# 可重试的 HTTP 状态码：限流与服务端暂时性错误
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝。"""
+
+
+class _LoopBound:
+    """
+    asyncio 同步原语绑定在首次使用它的事件循环上；客户端是进程级单例，
+    而 worker 每个任务各自 asyncio.run，循环变化时重新创建原语。
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._loop = None
+        self._value = None
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._value = self._factory()
+            self._loop = loop
+        return self._value
+
+
+class TokenBucket:
+    """
+    令牌桶限流器：每分钟补充 rate_per_minute 个令牌，桶容量默认为一分钟的量。
+    rate_per_minute <= 0 表示不限流。
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = _LoopBound(asyncio.Lock)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        if not self.enabled:
+            return
+        # 单次请求超过桶容量时按满桶计，否则永远拿不到令牌
+        amount = min(amount, self.capacity)
+        async with self._lock.get():
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+class AIMDLimiter:
+    """
+    AIMD 并发控制：每个成功的请求让并发上限缓慢增加 (每个窗口 +1)，
+    遇到限流时上限减半；同一窗口内的多次限流只减一次。
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: Optional[int] = None, decrease_factor: float = 0.5):
+        self.maximum = maximum or initial
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(max(self.minimum, min(initial, self.maximum)))
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._condition = _LoopBound(self._new_condition)
+        self._last_decrease_at = 0.0
+
+    def _new_condition(self) -> asyncio.Condition:
+        # 上一个事件循环中未归还的名额随循环一起作废
+        self.in_flight = 0
+        return asyncio.Condition()
+
+    async def __aenter__(self):
+        condition = self._condition.get()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        condition = self._condition.get()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        # 已经在途的请求返回的限流属于同一次拥塞，不重复减小
+        if now - self._last_decrease_at < 1.0:
+            return
+        self._last_decrease_at = now
+        old = int(self.limit)
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        logging.warning(f"LLM throttled, concurrency limit {old} -> {int(self.limit)}.")
+
+
+class CircuitBreaker:
+    """
+    连续失败达到阈值后打开熔断器，recovery_seconds 内的请求直接失败；
+    之后放行一个探测请求 (half-open)，成功则关闭，失败则再次打开。
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._clock = clock
+
+    def before_call(self):
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            if self._clock() - self._opened_at < self.recovery_seconds:
+                raise CircuitOpenError("LLM 服务暂时不可用 (熔断器已打开)")
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            raise CircuitOpenError("LLM 服务暂时不可用 (熔断器正在探测)")
+        self._probe_in_flight = True
+
+    def release_probe(self):
+        """
+        探测请求未得出结果 (例如被取消) 时调用：回到打开状态，
+        保留原来的打开时间，下一个请求可以立即重新探测。
+        """
+        if self.state == self.HALF_OPEN and self._probe_in_flight:
+            self.state = self.OPEN
+        self._probe_in_flight = False
+
+    def end_probe(self):
+        """
+        请求已结束但结果不能说明服务是否恢复 (例如限流或请求本身有误)：
+        只释放半开探测的名额，不改变状态与连续失败计数。
+        """
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.failure_threshold > 0 and (self.state == self.HALF_OPEN or self.failures >= self.failure_threshold):
+            if self.state != self.OPEN:
+                logging.error(f"LLM circuit breaker opened after {self.failures} consecutive failures.")
+            self.state = self.OPEN
+            self._opened_at = self._clock()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式。"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, base: float, maximum: float, retry_after: Optional[float] = None) -> float:
+    """
+    第 attempt 次重试前的等待时间：指数退避加全抖动 (full jitter)。
+    服务端给出 Retry-After 时至少等待该时长。
+    """
+    delay = random.uniform(0, min(maximum, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, maximum))
+    return delay
+
+
+def _classify(error: Exception):
+    """返回 (是否可重试, 是否为限流, 是否计入熔断, Retry-After 秒数)。"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        retry_after = parse_retry_after(error.response.headers.get("Retry-After"))
+        if status == 429:
+            # 限流说明服务是可用的，不触发熔断
+            return True, True, False, retry_after
+        if status in RETRYABLE_STATUS_CODES:
+            return True, status == 503, True, retry_after
+        return False, False, False, None
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True, False, True, None
+    return False, False, False, None
+
+
+class ResilientLLMClient(LLMClient):
+    """
+    包装任意 LLMClient 的弹性层：令牌桶 (请求数/分钟、token 数/分钟) 限流，
+    带抖动的指数退避重试 (遵循 Retry-After)，AIMD 自适应并发，以及熔断器。
+    """
+
+    def __init__(
+        self,
+        inner: LLMClient,
+        *,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_attempts: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        min_concurrency: int = 1,
+        failure_threshold: int = 5,
+        recovery_seconds: float = 30.0,
+    ):
+        self.inner = inner
+        self.max_concurrency = inner.max_concurrency
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.limiter = AIMDLimiter(inner.max_concurrency, minimum=min_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, recovery_seconds)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats: Dict[str, Any] = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "circuit_rejections": 0}
+
+    @classmethod
+    def from_settings(cls, inner: LLMClient, **overrides) -> "ResilientLLMClient":
+        options = dict(
+            requests_per_minute=settings.LLM_RATE_LIMIT_RPM,
+            tokens_per_minute=settings.LLM_RATE_LIMIT_TPM,
+            max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+            min_concurrency=settings.LLM_MIN_CONCURRENCY,
+            failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+            recovery_seconds=settings.LLM_CIRCUIT_RECOVERY_SECONDS,
+        )
+        options.update(overrides)
+        return cls(inner, **options)
+
+    async def start(self):
+        await self.inner.start()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+    async def _before_attempt(self, prompt_tokens: int):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats["circuit_rejections"] += 1
+            raise
+        try:
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(prompt_tokens)
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+
+    def _on_success(self):
+        self.breaker.record_success()
+        self.limiter.on_success()
+
+    def _on_error(self, error: Exception, attempt: int, can_retry: bool = True) -> Optional[float]:
+        """
+        记录一次失败的尝试 (attempt 从 1 开始)。可以重试时返回需要等待的秒数，
+        否则返回 None，由调用方重新抛出异常。
+        """
+        retryable, throttled, counts_as_failure, retry_after = _classify(error)
+        if throttled:
+            self.stats["throttled"] += 1
+            self.limiter.on_throttle()
+        if counts_as_failure:
+            self.breaker.record_failure()
+        else:
+            # 限流或请求本身有误不计入熔断，也不代表服务恢复，只释放半开探测
+            self.breaker.end_probe()
+        if not can_retry or not retryable or attempt >= self.max_attempts or self.breaker.state == CircuitBreaker.OPEN:
+            self.stats["failures"] += 1
+            return None
+        delay = backoff_delay(attempt - 1, self.base_delay, self.max_delay, retry_after)
+        self.stats["retries"] += 1
+        record_retry()
+        logging.warning(f"LLM call failed ({error}), retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s.")
+        return delay
+
+    async def generate(self, prompt: str) -> str:
+        self.stats["calls"] += 1
+        prompt_tokens = estimate_tokens(prompt)
+        attempt = 0
+        while True:
+            await self._before_attempt(prompt_tokens)
+            try:
+                async with self.limiter:
+                    result = await self.inner.generate(prompt)
+            except Exception as e:
+                attempt += 1
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 被取消时没有结果，不能让半开探测一直占着
+                self.breaker.release_probe()
+                raise
+            self._on_success()
+            return result
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        流式调用同样受限流、并发与熔断控制。只有在还没有返回任何片段时才会重试，
+        已经输出给调用方的内容无法撤回。
+        """
+        self.stats["calls"] += 1
+        prompt_tokens = estimate_tokens(prompt)
+        attempt = 0
+        while True:
+            await self._before_attempt(prompt_tokens)
+            started = False
+            try:
+                async with self.limiter:
+                    async for chunk in self.inner.generate_stream(prompt):
+                        started = True
+                        yield chunk
+            except Exception as e:
+                attempt += 1
+                delay = self._on_error(e, attempt, can_retry=not started)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 被取消或调用方提前关闭了生成器
+                self.breaker.release_probe()
+                raise
+            self._on_success()
+            return
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.llm_client import LLMClient
+from app.services.llm_resilience import CircuitBreaker, CircuitOpenError
+
+# 延迟与错误率的指数滑动平均系数，越大越看重最近的调用
+EWMA_ALPHA = 0.2
+
+
+class Backend:
+    """路由中的一个后端：客户端、配置的权重，以及观测到的延迟与错误率。"""
+
+    def __init__(self, name: str, client: LLMClient, weight: float = 1.0, window: int = 200):
+        self.name = name
+        self.client = client
+        self.weight = weight
+        self.latencies: deque = deque(maxlen=window)
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        # 后端自身的熔断器打开时暂不参与路由
+        breaker = getattr(self.client, "breaker", None)
+        return breaker is None or breaker.state != CircuitBreaker.OPEN
+
+    def record(self, latency: Optional[float], ok: bool):
+        self.calls += 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latencies.append(latency)
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency += EWMA_ALPHA * (latency - self.ewma_latency)
+        else:
+            self.errors += 1
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def summary(self) -> Dict[str, Any]:
+        p95 = self.percentile(95)
+        return {
+            "name": self.name,
+            "weight": self.weight,
+            "available": self.available,
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 4),
+            "ewma_latency_ms": None if self.ewma_latency is None else round(self.ewma_latency * 1000, 1),
+            "p95_latency_ms": None if p95 is None else round(p95 * 1000, 1),
+        }
+
+
+class RoutingLLMClient(LLMClient):
+    """
+    在多个后端之间路由 LLM 调用。每次调用按 权重 / (延迟 × (1 + 错误惩罚)) 加权随机选择后端，
+    出错时依次切换到其他后端。开启对冲 (hedging) 后，如果请求超过当前后端的 p95 延迟
+    仍未返回，会向下一个后端发送一个重复请求，取先返回的结果并取消另一个。
+    """
+
+    ERROR_PENALTY = 10.0
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        *,
+        hedge: bool = False,
+        hedge_min_samples: int = 20,
+        seed: Optional[int] = None,
+    ):
+        if not backends:
+            raise ValueError("RoutingLLMClient 至少需要一个后端")
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.max_concurrency = sum(b.client.max_concurrency for b in backends)
+        self.stats: Dict[str, int] = {"calls": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0}
+        self._random = random.Random(seed)
+
+    def _score(self, backend: Backend, default_latency: float) -> float:
+        latency = backend.ewma_latency if backend.ewma_latency is not None else default_latency
+        return backend.weight / (max(latency, 1e-3) * (1.0 + self.ERROR_PENALTY * backend.error_rate))
+
+    def ranked_backends(self) -> List[Backend]:
+        """
+        返回本次调用尝试后端的顺序：可用的后端按得分加权随机排序 (无放回)，
+        熔断中的后端排在最后，作为全部失败时的兜底。
+        """
+        known = [b.ewma_latency for b in self.backends if b.ewma_latency is not None]
+        # 还没有样本的后端按已知的最快延迟估计，保证新后端也能得到流量
+        default_latency = min(known) if known else 1.0
+        available = [b for b in self.backends if b.available and b.weight > 0]
+        ordered = []
+        while available:
+            scores = [self._score(b, default_latency) for b in available]
+            chosen = self._random.choices(range(len(available)), weights=scores)[0]
+            ordered.append(available.pop(chosen))
+        ordered += [b for b in self.backends if b not in ordered]
+        return ordered
+
+    def _hedge_delay(self, backend: Backend) -> Optional[float]:
+        if not self.hedge or len(backend.latencies) < self.hedge_min_samples:
+            return None
+        return backend.percentile(95)
+
+    async def _call(self, backend: Backend, prompt: str) -> str:
+        started = time.perf_counter()
+        try:
+            result = await backend.client.generate(prompt)
+        except CircuitOpenError:
+            # 熔断拒绝没有真正请求后端，不计入统计
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            backend.record(None, ok=False)
+            raise
+        backend.record(time.perf_counter() - started, ok=True)
+        return result
+
+    async def generate(self, prompt: str) -> str:
+        self.stats["calls"] += 1
+        candidates = self.ranked_backends()
+        pending: Dict[asyncio.Task, Backend] = {}
+        errors: List[Exception] = []
+        next_index = 0
+        hedged = False
+
+        def launch():
+            nonlocal next_index
+            backend = candidates[next_index]
+            next_index += 1
+            pending[asyncio.create_task(self._call(backend, prompt))] = backend
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if not hedged and len(pending) == 1 and next_index < len(candidates):
+                    timeout = self._hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 超过 p95 仍未返回：向下一个后端发送对冲请求
+                    hedged = True
+                    self.stats["hedges"] += 1
+                    launch()
+                    continue
+
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged and backend is candidates[next_index - 1]:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    errors.append(task.exception())
+                    logging.warning(f"LLM backend '{backend.name}' failed: {task.exception()}")
+
+                if not pending and next_index < len(candidates):
+                    self.stats["failovers"] += 1
+                    launch()
+            raise errors[-1]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """流式调用不做对冲；在返回第一个片段之前出错时切换到下一个后端。"""
+        self.stats["calls"] += 1
+        last_error: Optional[Exception] = None
+        for index, backend in enumerate(self.ranked_backends()):
+            if index:
+                self.stats["failovers"] += 1
+            started = time.perf_counter()
+            first_chunk = True
+            try:
+                async for chunk in backend.client.generate_stream(prompt):
+                    first_chunk = False
+                    yield chunk
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+            except Exception as e:
+                backend.record(None, ok=False)
+                if not first_chunk:
+                    raise
+                last_error = e
+                logging.warning(f"LLM backend '{backend.name}' failed: {e}")
+                continue
+            backend.record(time.perf_counter() - started, ok=True)
+            return
+        raise last_error
+
+    async def start(self):
+        for backend in self.backends:
+            await backend.client.start()
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.client.aclose()
+
+    def summary(self) -> Dict[str, Any]:
+        return {**self.stats, "backends": [b.summary() for b in self.backends]}
+
+
+def parse_backend_specs(raw: str) -> List[Dict[str, Any]]:
+    """
+    解析 LLM_BACKENDS 配置，格式为 JSON 数组，例如:
+    [{"name": "gemini-pro", "provider": "google", "model": "gemini-1.5-pro-latest",
+      "api_key": "...", "base_url": "https://generativelanguage.googleapis.com", "weight": 3},
+     {"name": "gemini-flash", "provider": "google", "model": "gemini-1.5-flash-latest", "weight": 1}]
+    未给出的 api_key / base_url / model / max_concurrency 使用对应的 LLM_* 配置。
+    """
+    specs = json.loads(raw)
+    if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+        raise ValueError("LLM_BACKENDS 必须是 JSON 对象数组")
+    return specs
+
+
+def backends_cache_identity(specs: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """
+    路由客户端在响应缓存键中的 (provider, model)：由所有后端的服务商与模型组成，
+    后端的模型配置变化时旧的缓存不会再命中；与顺序和权重无关。
+    """
+    models = sorted({
+        f"{str(spec.get('provider', settings.LLM_PROVIDER)).lower()}:{spec.get('model', settings.LLM_MODEL_NAME)}"
+        for spec in specs
+    })
+    return "router", ",".join(models)
+
+
+def build_router(specs: List[Dict[str, Any]], create_backend_client) -> RoutingLLMClient:
+    """create_backend_client(spec) 为每个后端创建带限流与重试的客户端。"""
+    backends = [
+        Backend(
+            name=spec.get("name") or f"{spec.get('provider', settings.LLM_PROVIDER)}-{index}",
+            client=create_backend_client(spec),
+            weight=float(spec.get("weight", 1.0)),
+        )
+        for index, spec in enumerate(specs)
+    ]
+    return RoutingLLMClient(
+        backends, hedge=settings.LLM_HEDGE_ENABLED, hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES
+    )
@@ -1,53 +1,527 @@
 import json
 import asyncio
+import hashlib
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from app.crud import crud_job, crud_user_profile, crud_job_match
+from app.crud import crud_job, crud_user_profile, crud_job_match, crud_match_task, crud_llm_usage
 from app.schemas.job_match import JobMatchCreate
-from app.services.llm_client import get_llm_client
+from app.services.llm_cache import cache_only_valid
+from app.services.llm_client import LLMClient, close_llm_client, get_llm_client
+from app.services.llm_resilience import CircuitOpenError
+from app.services.llm_metrics import UsageStats, log_usage, track_llm_usage
+from app.services.job_ranker import get_job_index, profile_query_text
+from app.services import prompt_compactor
+from app.core.config import settings
+from app.db.session import SessionLocal
 import logging
 
+# 修改匹配提示词时递增，使旧的缓存结果失效
+MATCH_PROMPT_VERSION = "2"
+
+
+def profile_fingerprint(profile_data: Optional[dict]) -> str:
+    """Hash of the normalized (key-sorted, compact) profile JSON and the profile compaction budget."""
+    normalized = json.dumps(profile_data or {}, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{prompt_compactor.profile_signature()}\x1f{normalized}".encode("utf-8")).hexdigest()
+
+
+def job_fingerprint(job) -> str:
+    """Hash of the job fields that `_build_prompt` puts into the prompt and their compaction budgets."""
+    fields = [
+        MATCH_PROMPT_VERSION,
+        prompt_compactor.job_signature(),
+        job.title or "",
+        job.job_responsibilities or "",
+        job.job_requirements or "",
+        job.description or "",
+    ]
+    return hashlib.sha256("\x1f".join(fields).encode("utf-8")).hexdigest()
+
+
 class MatchingService:
-    def __init__(self, db: Session):
+    def __init__(
+        self, db: Session, max_concurrency: Optional[int] = None,
+        on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        llm_client: Optional[LLMClient] = None, run_id: Optional[str] = None,
+        offload_blocking: bool = False
+    ):
         self.db = db
+        # 在 Web 进程中运行时设为 True：同步的数据库读写与 BM25 预排序放到线程中执行，不阻塞事件循环。
+        # 会话在线程与事件循环之间交替使用（不会并发），应关闭 expire_on_commit，避免在事件循环中懒加载
+        self.offload_blocking = offload_blocking
+        # 本次运行的标识，LLM 调用统计按它归档（worker 中为匹配任务 id）
+        self.run_id = run_id or uuid.uuid4().hex
+        # 本次运行所有画像的 LLM 调用统计
+        self.llm_usage = UsageStats()
+        # 未指定时使用进程内共享的客户端
+        self.llm_client = llm_client
+        # 进度与结果事件回调 (event_name, data)，用于 SSE 等流式推送
+        self.on_event = on_event
+        # 未显式指定时使用 LLM 客户端（服务商）自身的并发上限
+        self.max_concurrency = max_concurrency
+        # 匹配缓存命中统计，命中的职位不会调用 LLM；failed 为调用失败或响应无法解析的职位数
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "failed": 0}
+        # 待写入的匹配结果，攒够一批后一次性 upsert
+        self._pending_matches: List[JobMatchCreate] = []
+        self.progress = {"done": 0, "total": 0, "failed": 0, "cached": 0}
+        self._started_at = time.monotonic()
+        # 提示词 token 估算，用于调优各部分的预算
+        self.prompt_stats = {"prompts": 0, "estimated_tokens": 0, "max_estimated_tokens": 0}
+        self._compacted_profile: Optional[Tuple[Any, str]] = None
+        # 批量写入数据库的次数、行数与耗时
+        self.write_stats = {"flushes": 0, "rows": 0, "seconds": 0.0}
 
-    def run_matching_for_profile(self, profile_id: int):
-        logging.info(f"Starting matching process for profile_id: {profile_id}")
-        
+    def run_matching_for_profile(self, profile_id: int, top_k: Optional[int] = None, batch_size: Optional[int] = None):
+        """
+        Synchronous entry point, runs the async matching engine in its own event loop.
+        The shared LLM connection pool is bound to that loop and is closed before it ends.
+        """
+        async def run():
+            try:
+                return await self.arun_matching_for_profile(profile_id, top_k=top_k, batch_size=batch_size)
+            finally:
+                await close_llm_client()
+
+        return asyncio.run(run())
+
+    async def arun_incremental_matching(self, delta: Dict[str, Any]):
+        """
+        Applies a scraper delta: matches for deactivated jobs are marked stale,
+        and only new or updated jobs are scored against every existing profile.
+        """
+        deactivated_ids = delta.get("deactivated_job_ids") or []
+        changed_ids = set(delta.get("new_job_ids") or []) | set(delta.get("updated_job_ids") or [])
+
+        if deactivated_ids:
+            stale_count = await self._blocking(crud_job_match.mark_stale, self.db, job_ids=deactivated_ids)
+            logging.info(f"Marked {stale_count} matches stale for {len(deactivated_ids)} deactivated jobs.")
+
+        if not changed_ids:
+            return self.stats
+
+        profiles = await self._blocking(crud_user_profile.get_all, self.db)
+        logging.info(f"Incremental matching of {len(changed_ids)} changed jobs against {len(profiles)} profiles.")
+        for profile in profiles:
+            await self.arun_matching_for_profile(profile.id, only_job_ids=changed_ids)
+        return self.stats
+
+    async def arun_matching_for_profile(
+        self, profile_id: int, top_k: Optional[int] = None, batch_size: Optional[int] = None,
+        only_job_ids: Optional[Iterable[int]] = None
+    ):
+        """
+        Scores active jobs against the profile: a local BM25 pre-ranking picks
+        the top_k candidates, then the LLM calls are fanned out under a bounded
+        concurrency limit and results are saved as they finish. With
+        batch_size > 1 several jobs are scored per LLM request. only_job_ids
+        restricts scoring to those jobs (pre-ranking still uses the full corpus);
+        existing matches of those jobs that fall outside the shortlist are marked stale.
+        LLM usage of the run is logged and stored per profile (see _record_llm_usage).
+        """
+        started = time.monotonic()
+        write_seconds = self.write_stats["seconds"]
+        with track_llm_usage() as usage:
+            try:
+                return await self._match_profile(profile_id, top_k, batch_size, only_job_ids)
+            finally:
+                await self._blocking(
+                    self._record_llm_usage,
+                    profile_id, usage, time.monotonic() - started, self.write_stats["seconds"] - write_seconds
+                )
+
+    async def _blocking(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs synchronous DB/CPU work, in a worker thread when offload_blocking is set."""
+        if self.offload_blocking:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+    def _record_llm_usage(self, profile_id: int, usage: UsageStats, wall_seconds: float, write_seconds: float):
+        """Logs the profile's LLM usage as one structured line and stores it for the usage API."""
+        if not usage.calls:
+            return
+        self.llm_usage.merge(usage)
+        log_usage(
+            "llm_run_usage", usage, run_id=self.run_id, profile_id=profile_id,
+            wall_seconds=round(wall_seconds, 3), db_write_seconds=round(write_seconds, 3)
+        )
+        try:
+            crud_llm_usage.create(
+                self.db, run_id=self.run_id, purpose=crud_llm_usage.PURPOSE_MATCHING, usage=usage.to_record(),
+                user_profile_id=profile_id, wall_seconds=wall_seconds
+            )
+        except Exception as e:
+            self.db.rollback()
+            logging.error(f"Failed to save LLM usage for profile {profile_id}: {e}")
+
+    def _load_candidates(
+        self, profile_id: int, top_k: Optional[int], only_job_ids: Optional[Iterable[int]]
+    ) -> Optional[Tuple[Any, List[Any], str, Dict[int, str], Dict[str, Any]]]:
+        """
+        Synchronous part of a run: loads the profile and active jobs, pre-ranks them
+        and looks up cached matches. Returns (profile, jobs, profile_fp, job_fps,
+        cached), or None when there is nothing to score.
+        """
         profile = crud_user_profile.get(self.db, id=profile_id)
         if not profile:
             logging.error(f"Profile with id {profile_id} not found.")
-            return
+            return None
 
-        jobs_data = crud_job.get_multi(self.db)
-        all_jobs = jobs_data.get("items", []) if jobs_data else []
+        all_jobs = crud_job.get_all(self.db, is_active=True)
         if not all_jobs:
             logging.warning("No jobs found in the database to match against.")
-            return
+            return None
 
         logging.info(f"Found {len(all_jobs)} jobs to match against profile {profile_id}.")
 
-        llm_client = get_llm_client()
-        
+        profile_fp = profile_fingerprint(profile.structured_profile)
+        job_fps = {job.id: job_fingerprint(job) for job in all_jobs}
+
+        top_k = settings.MATCHING_PRERANK_TOP_K if top_k is None else top_k
+        all_jobs = self._prerank_jobs(profile.structured_profile, all_jobs, job_fps, top_k)
+        if only_job_ids is not None:
+            only_job_ids = set(only_job_ids)
+            all_jobs = [job for job in all_jobs if job.id in only_job_ids]
+            # 变化后落到预排序 top_k 之外的职位不再打分，旧的匹配结果已不反映职位内容，标记为过期
+            dropped_job_ids = only_job_ids - {job.id for job in all_jobs}
+            if dropped_job_ids:
+                crud_job_match.mark_stale(self.db, job_ids=sorted(dropped_job_ids), profile_id=profile_id)
+            if not all_jobs:
+                return None
+        cached = crud_job_match.get_cached(
+            self.db, profile_fingerprint=profile_fp, job_fingerprints=[job_fps[job.id] for job in all_jobs]
+        )
+        return profile, all_jobs, profile_fp, job_fps, cached
+
+    async def _match_profile(
+        self, profile_id: int, top_k: Optional[int], batch_size: Optional[int], only_job_ids: Optional[Iterable[int]]
+    ):
+        logging.info(f"Starting matching process for profile_id: {profile_id}")
+
+        candidates = await self._blocking(self._load_candidates, profile_id, top_k, only_job_ids)
+        if candidates is None:
+            return self.stats
+        profile, all_jobs, profile_fp, job_fps, cached = candidates
+
+        self.progress = {"done": 0, "total": len(all_jobs), "failed": 0, "cached": 0}
+        self._started_at = time.monotonic()
+        self._emit_progress()
+
+        jobs_to_score, revived_job_ids = [], []
         for job in all_jobs:
-            logging.info(f"Matching profile {profile_id} with job {job.id} ('{job.title}')")
+            hit = cached.get(job_fps[job.id])
+            if hit is None:
+                jobs_to_score.append(job)
+                continue
+            self.stats["cache_hits"] += 1
+            self.progress["cached"] += 1
+            self._emit_match(job, hit.match_score, hit.match_summary, hit.improvement_suggestions, cached=True)
+            # 同一画像与职位已有该结果时无需重复保存（职位重新上线则恢复为有效）；内容相同的其他记录则复制一份
+            if hit.user_profile_id == profile_id and hit.job_id == job.id:
+                if hit.is_stale:
+                    revived_job_ids.append(job.id)
+            else:
+                self._save_match_result(
+                    profile_id, job.id, hit.match_score, hit.match_summary, hit.improvement_suggestions,
+                    profile_fp=profile_fp, job_fp=job_fps[job.id]
+                )
+                await self._flush_if_full()
+        self.stats["cache_misses"] += len(jobs_to_score)
+        if revived_job_ids:
+            await self._blocking(
+                crud_job_match.mark_stale, self.db, job_ids=revived_job_ids, is_stale=False, profile_id=profile_id
+            )
+
+        logging.info(
+            f"Match cache for profile {profile_id}: {self.stats['cache_hits']} hits, "
+            f"{self.stats['cache_misses']} misses."
+        )
+
+        if jobs_to_score:
+            llm_client = self.llm_client or get_llm_client()
+            concurrency = self.max_concurrency or llm_client.max_concurrency
+            semaphore = asyncio.Semaphore(concurrency)
+            batch_size = batch_size or settings.MATCHING_BATCH_SIZE
+
+            logging.info(
+                f"Scoring {len(jobs_to_score)} jobs for profile {profile_id} "
+                f"(concurrency={concurrency}, batch_size={batch_size})."
+            )
+
+            async def save(job, score, summary, suggestions):
+                self._emit_match(job, score, summary, suggestions)
+                try:
+                    self._save_match_result(
+                        profile_id, job.id, score, summary, suggestions,
+                        profile_fp=profile_fp, job_fp=job_fps[job.id]
+                    )
+                except Exception as e:
+                    logging.error(f"Failed to save match for job {job.id} and profile {profile_id}: {e}")
+                await self._flush_if_full()
+
+            pending = set()
+            for chunk in self._chunk_jobs(profile.structured_profile, jobs_to_score, batch_size):
+                if len(chunk) == 1:
+                    pending.add(asyncio.create_task(self._score_job(llm_client, semaphore, profile, chunk[0])))
+                else:
+                    pending.add(asyncio.create_task(self._score_batch(llm_client, semaphore, profile, chunk)))
+
+            # 结果按完成顺序处理；数据库写入只在当前协程中进行，会话不会被并发访问
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        target, response_text, error = task.result()
+                        if isinstance(error, CircuitOpenError):
+                            # 服务不可用时放弃本次运行：已完成的结果会保存，任务稍后由队列重试
+                            logging.error(f"Aborting matching for profile {profile_id}: {error}")
+                            raise error
+
+                        if isinstance(target, list):
+                            # 批量结果：保存解析成功的职位，缺失的职位拆分出来逐个重试
+                            results = {} if error is not None else self._parse_batch_response(response_text, target)
+                            if error is not None:
+                                logging.error(f"Batch of {len(target)} jobs failed for profile {profile_id}: {error}")
+                            for job in target:
+                                if job.id in results:
+                                    await save(job, *results[job.id])
+                                else:
+                                    pending.add(asyncio.create_task(self._score_job(llm_client, semaphore, profile, job)))
+                            missing = len(target) - len(results)
+                            if missing:
+                                logging.warning(f"Retrying {missing} of {len(target)} batched jobs individually.")
+                            continue
+
+                        parsed = None if error is not None else self._parse_response(response_text)
+                        if parsed is None:
+                            # 解析失败的结果不保存，否则会作为缓存命中一直沿用；下次运行重新打分
+                            if error is not None:
+                                logging.error(f"Failed to match job {target.id} for profile {profile_id}: {error}")
+                            self.stats["failed"] += 1
+                            self.progress["failed"] += 1
+                            self._emit_progress()
+                            continue
+                        await save(target, *parsed)
+            finally:
+                # 被取消（例如客户端断开）时不留下孤立的 LLM 请求
+                for task in pending:
+                    task.cancel()
+                await self._blocking(self._flush_matches)
+
+        await self._blocking(self._flush_matches)
+        if self.prompt_stats["prompts"]:
+            logging.info(
+                f"Prompt token estimates for profile {profile_id}: {self.prompt_stats['prompts']} prompts, "
+                f"~{self.prompt_stats['estimated_tokens'] // self.prompt_stats['prompts']} avg, "
+                f"~{self.prompt_stats['max_estimated_tokens']} max."
+            )
+        logging.info(f"Finished matching process for profile_id: {profile_id}")
+        return self.stats
+
+    def _emit(self, event: str, data: Dict[str, Any]):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event, data)
+        except Exception as e:
+            logging.error(f"Matching event handler failed for '{event}': {e}")
+
+    def _emit_progress(self):
+        if self.on_event is None:
+            return
+        progress = dict(self.progress)
+        finished = progress["done"] + progress["failed"]
+        remaining = progress["total"] - finished
+        elapsed = time.monotonic() - self._started_at
+        # 缓存命中几乎不耗时，ETA 只按实际调用 LLM 的职位估算
+        scored = finished - progress["cached"]
+        if remaining <= 0:
+            progress["eta_seconds"] = 0.0
+        elif scored > 0:
+            progress["eta_seconds"] = round(elapsed / scored * remaining, 1)
+        else:
+            progress["eta_seconds"] = None
+        self._emit("progress", progress)
+
+    def _emit_match(self, job, score: float, summary: str, suggestions: Optional[str], cached: bool = False):
+        self.progress["done"] += 1
+        if self.on_event is None:
+            return
+        self._emit("match", {
+            "job_id": job.id,
+            "match_score": score,
+            "match_summary": summary,
+            "improvement_suggestions": suggestions,
+            "cached": cached,
+            "job": {
+                "id": job.id,
+                "title": job.title,
+                "company": job.company,
+                "location": job.location,
+                "url": job.url,
+            },
+        })
+        self._emit_progress()
+
+    def _prerank_jobs(self, profile_data: dict, jobs: List[Any], job_fps: Dict[int, str], top_k: int) -> List[Any]:
+        """Shortlists the top_k jobs by local BM25 relevance to the profile's skills and experience."""
+        if not top_k or top_k <= 0:
+            return jobs
+        query_text = profile_query_text(profile_data)
+        if not query_text.strip():
+            logging.warning("Profile has no skills/experience text, skipping pre-ranking.")
+            return jobs
+
+        index = get_job_index(jobs, job_fps)
+        ranked = index.top_k(query_text, top_k)
+        jobs_by_id = {job.id: job for job in jobs}
+        shortlisted = [jobs_by_id[job_id] for job_id, _ in ranked]
+        logging.info(f"Pre-ranking shortlisted {len(shortlisted)} of {len(jobs)} jobs (top_k={top_k}).")
+        return shortlisted
+
+    async def _score_job(self, llm_client, semaphore: asyncio.Semaphore, profile, job) -> Tuple[Any, Optional[str], Optional[Exception]]:
+        """Calls the LLM for a single job while holding a concurrency slot."""
+        async with semaphore:
+            logging.info(f"Matching profile {profile.id} with job {job.id} ('{job.title}')")
             try:
                 prompt = self._build_prompt(profile.structured_profile, job)
-                
-                response_text = asyncio.run(llm_client.generate(prompt))
-                
-                score, summary, suggestions = self._parse_response(response_text)
-                
-                self._save_match_result(profile_id, job.id, score, summary, suggestions)
+                self._record_prompt(prompt, f"job {job.id}")
+                # 无法解析的响应不缓存，否则下次运行仍会得到同样的结果
+                with cache_only_valid(self._is_valid_response):
+                    response_text = await llm_client.generate(prompt)
+                return job, response_text, None
+            except Exception as e:
+                return job, None, e
 
+    async def _score_batch(self, llm_client, semaphore: asyncio.Semaphore, profile, jobs: List[Any]) -> Tuple[List[Any], Optional[str], Optional[Exception]]:
+        """Calls the LLM once for a batch of jobs while holding a concurrency slot."""
+        async with semaphore:
+            logging.info(f"Matching profile {profile.id} with a batch of {len(jobs)} jobs")
+            try:
+                prompt = self._build_batch_prompt(profile.structured_profile, jobs)
+                self._record_prompt(prompt, f"batch of {len(jobs)} jobs")
+                with cache_only_valid(lambda text: self._is_valid_batch_response(text, jobs)):
+                    response_text = await llm_client.generate(prompt)
+                return jobs, response_text, None
             except Exception as e:
-                logging.error(f"Failed to match job {job.id} for profile {profile_id}: {e}")
+                return jobs, None, e
 
-        logging.info(f"Finished matching process for profile_id: {profile_id}")
+    def _chunk_jobs(self, profile_data: dict, jobs: List[Any], batch_size: int) -> List[List[Any]]:
+        """
+        Groups jobs into batches of at most batch_size, also keeping each
+        batch prompt under MATCHING_BATCH_MAX_PROMPT_CHARS.
+        """
+        if batch_size <= 1:
+            return [[job] for job in jobs]
+
+        budget = settings.MATCHING_BATCH_MAX_PROMPT_CHARS - len(self._build_batch_prompt(profile_data, []))
+        chunks, current, current_size = [], [], 0
+        for job in jobs:
+            size = len(self._compact_job_json(job))
+            if current and (len(current) >= batch_size or current_size + size > budget):
+                chunks.append(current)
+                current, current_size = [], 0
+            current.append(job)
+            current_size += size
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _record_prompt(self, prompt: str, label: str):
+        tokens = prompt_compactor.estimate_tokens(prompt)
+        self.prompt_stats["prompts"] += 1
+        self.prompt_stats["estimated_tokens"] += tokens
+        self.prompt_stats["max_estimated_tokens"] = max(self.prompt_stats["max_estimated_tokens"], tokens)
+        logging.debug(f"Prompt for {label}: ~{tokens} tokens")
+
+    def _compact_profile(self, profile_data: dict) -> str:
+        """Compacts the profile once per run; every prompt of the run reuses it."""
+        if self._compacted_profile is None or self._compacted_profile[0] is not profile_data:
+            self._compacted_profile = (profile_data, prompt_compactor.compact_profile(profile_data))
+        return self._compacted_profile[1]
+
+    def _compact_job_json(self, job) -> str:
+        return json.dumps({
+            "job_id": job.id,
+            "title": job.title,
+            "responsibilities": prompt_compactor.compact_responsibilities(job.job_responsibilities),
+            "requirements": prompt_compactor.compact_requirements(job.job_requirements or job.description),
+        }, ensure_ascii=False, separators=(",", ":"))
+
+    def _build_batch_prompt(self, profile_data: dict, jobs: List[Any]) -> str:
+        """Builds one prompt that sends the profile once and scores several jobs."""
+        jobs_block = "\n".join(self._compact_job_json(job) for job in jobs)
+        profile_json = self._compact_profile(profile_data)
+
+        prompt = f"""
+        You are an expert technical recruiter and career coach. Evaluate ONE candidate against EACH of the jobs below, independently and strictly.
+
+        For each job: identify its 3-5 critical requirements, compare the candidate against them, then score using this rubric:
+        - 9-10: meets all critical requirements plus extra valuable experience.
+        - 7-8: meets most critical requirements, can learn the rest quickly.
+        - 5-6: meets some critical requirements, significant gaps.
+        - 3-4: missing most critical requirements.
+        - 1-2: meets none of the critical requirements.
+
+        All text output must be in Chinese. "summary" must state which key requirements are met and which are not. "improvement_suggestions" gives 2-3 concrete, actionable suggestions for that specific role.
+
+        **Candidate Profile (JSON):**
+        {profile_json}
+
+        **Jobs (one JSON object per line):**
+        {jobs_block}
+
+        **Your Output:** ONLY a JSON array with exactly one object per job, no other text:
+        [{{"job_id": <job_id>, "score": <score>, "summary": "<summary>", "improvement_suggestions": "<suggestions>"}}]
+        """
+        return prompt_compactor.strip_indentation(prompt)
+
+    def _is_valid_batch_response(self, response: str, jobs: List[Any]) -> bool:
+        """Whether a batch response covers every job (only such responses are cached)."""
+        return len(self._parse_batch_response(response, jobs, log_errors=False)) == len(jobs)
+
+    def _parse_batch_response(
+        self, response: str, jobs: List[Any], log_errors: bool = True
+    ) -> Dict[int, Tuple[float, str, str]]:
+        """
+        Parses and validates a batch JSON array. Returns job_id -> (score, summary,
+        suggestions) for the valid entries only; callers retry the rest.
+        """
+        expected_ids = {job.id for job in jobs}
+        try:
+            if '```json' in response:
+                response = response.split('```json')[1].split('```')[0].strip()
+            data = json.loads(response)
+        except (json.JSONDecodeError, TypeError, IndexError) as e:
+            if log_errors:
+                logging.error(f"Failed to parse batch LLM response: {response}. Error: {e}")
+            return {}
+        if not isinstance(data, list):
+            if log_errors:
+                logging.error(f"Batch LLM response is not a JSON array: {response}")
+            return {}
+
+        results = {}
+        for item in data:
+            try:
+                job_id = int(item['job_id'])
+                score = float(item['score'])
+                summary = item['summary']
+                suggestions = item.get('improvement_suggestions', '')
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+            if job_id not in expected_ids or not isinstance(summary, str) or not 0 <= score <= 10:
+                continue
+            if isinstance(suggestions, list):
+                suggestions = "\n".join(f"- {s}" for s in suggestions)
+            results[job_id] = (score, summary, suggestions)
+        return results
 
     def _build_prompt(self, profile_data: dict, job) -> str:
-        # 使用更详细的岗位职责和要求字段
-        job_responsibilities = job.job_responsibilities or "未提供"
-        job_requirements = job.job_requirements or job.description or "未提供"
+        # 使用更详细的岗位职责和要求字段，去重并按 token 预算截断
+        job_responsibilities = prompt_compactor.compact_responsibilities(job.job_responsibilities)
+        job_requirements = prompt_compactor.compact_requirements(job.job_requirements or job.description)
 
         prompt = f"""
         You are an expert technical recruiter and career coach. Your task is to perform a detailed, critical analysis of a candidate's profile against a job description. Your analysis must be realistic and strict.
@@ -86,7 +560,7 @@ class MatchingService:
 
         **2. Candidate Profile (JSON):**
         ```json
-        {json.dumps(profile_data, indent=2, ensure_ascii=False)}
+        {self._compact_profile(profile_data)}
         ```
         ---
 
@@ -99,10 +573,14 @@ class MatchingService:
         }}
         ```
         """
-        return prompt
+        return prompt_compactor.strip_indentation(prompt)
+
+    def _is_valid_response(self, response: str) -> bool:
+        """Whether a single-job response can be parsed (only such responses are cached)."""
+        return self._parse_response(response, log_errors=False) is not None
 
-    def _parse_response(self, response: str) -> (float, str, str):
-        """Parses the JSON response from the LLM."""
+    def _parse_response(self, response: str, log_errors: bool = True) -> Optional[Tuple[float, str, str]]:
+        """Parses the JSON response from the LLM. Returns None when the response is not valid."""
         try:
             # The actual response might be wrapped in markdown ```json ... ```
             if '```json' in response:
@@ -118,21 +596,62 @@ class MatchingService:
                 suggestions = "\n".join(f"- {s}" for s in suggestions)
 
             return score, summary, suggestions
-        except (json.JSONDecodeError, KeyError, TypeError) as e:
-            logging.error(f"Failed to parse LLM response: {response}. Error: {e}")
-            # Return a default/error state
-            return 0.0, "Error parsing LLM response.", ""
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, IndexError) as e:
+            if log_errors:
+                logging.error(f"Failed to parse LLM response: {response}. Error: {e}")
+            return None
 
-    def _save_match_result(self, profile_id: int, job_id: int, score: float, summary: str, suggestions: str):
-        """Saves the matching result to the database."""
+    def _save_match_result(
+        self, profile_id: int, job_id: int, score: float, summary: str, suggestions: str,
+        profile_fp: Optional[str] = None, job_fp: Optional[str] = None
+    ):
+        """Buffers the matching result; buffered results are upserted in batches (see _flush_if_full)."""
         match_create_obj = JobMatchCreate(
             user_profile_id=profile_id,
             job_id=job_id,
             match_score=score,
             match_summary=summary,
-            improvement_suggestions=suggestions
+            improvement_suggestions=suggestions,
+            profile_fingerprint=profile_fp,
+            job_fingerprint=job_fp
         )
-        crud_job_match.create(self.db, obj_in=match_create_obj)
-        logging.info(f"Successfully saved match for profile {profile_id} and job {job_id}")
+        self._pending_matches.append(match_create_obj)
+
+    async def _flush_if_full(self):
+        if len(self._pending_matches) >= settings.MATCHING_WRITE_BATCH_SIZE:
+            await self._blocking(self._flush_matches)
+
+    def _flush_matches(self):
+        """Writes all buffered results with one bulk upsert and a single commit."""
+        if not self._pending_matches:
+            return
+        matches, self._pending_matches = self._pending_matches, []
+        started = time.perf_counter()
+        try:
+            count = crud_job_match.bulk_upsert(self.db, objs_in=matches)
+            logging.info(f"Saved {count} matches in one batch.")
+            self.write_stats["rows"] += len(matches)
+        except Exception as e:
+            self.db.rollback()
+            logging.error(f"Failed to save a batch of {len(matches)} matches: {e}")
+        finally:
+            self.write_stats["flushes"] += 1
+            self.write_stats["seconds"] += time.perf_counter() - started
 
 matching_service = MatchingService
+
+
+def on_scrape_delta(delta: Dict[str, Any]):
+    """
+    Scraper delta subscriber: enqueues an incremental matching task for the
+    matching workers so the scrape task is not held up by LLM scoring.
+    """
+    db = SessionLocal()
+    try:
+        task = crud_match_task.enqueue(
+            db, task_type=crud_match_task.TASK_TYPE_INCREMENTAL, payload={"delta": delta},
+            max_attempts=settings.MATCHING_TASK_MAX_ATTEMPTS
+        )
+        logging.info(f"Enqueued incremental matching task {task.id} for {delta.get('site_name')}.")
+    finally:
+        db.close()
@@ -0,0 +1,149 @@
+import json
+import re
+from typing import Any, Optional
+
+from app.core.config import settings
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_WHITESPACE_RE = re.compile(r"[ \t\u3000]+")
+# 按中英文句末标点或换行切分句子，标点保留在句子末尾
+_SENTENCE_RE = re.compile(r"[^。！？；!?;\n]+[。！？；!?;]?")
+
+TRUNCATION_MARK = "…(已截断)"
+# 修改压缩规则时递增；与各部分的 token 预算一起计入匹配缓存的指纹，使按旧规则生成的结果失效
+COMPACTOR_VERSION = "1"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    粗略估算 token 数：中文字符及全角标点按 1 个 token 计，其余字符约 4 个字符 1 个 token。
+    用于调优提示词长度，不追求与具体模型的分词器完全一致。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def drop_empty(value: Any) -> Any:
+    """递归去掉值为 None、空字符串、空列表、空字典的字段。"""
+    if isinstance(value, dict):
+        cleaned = {k: drop_empty(v) for k, v in value.items()}
+        return {k: v for k, v in cleaned.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        cleaned = [drop_empty(v) for v in value]
+        return [v for v in cleaned if v not in (None, "", [], {})]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def _cap_strings(value: Any, max_chars: int) -> Any:
+    if isinstance(value, dict):
+        return {k: _cap_strings(v, max_chars) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_cap_strings(v, max_chars) for v in value]
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + TRUNCATION_MARK
+    return value
+
+
+def dedupe_text(text: Optional[str]) -> str:
+    """
+    规范空白并去掉重复的句子/行（招聘文本中常见的重复套话）。
+    """
+    if not text:
+        return ""
+    seen = set()
+    lines = []
+    for raw_line in text.splitlines():
+        line = _WHITESPACE_RE.sub(" ", raw_line).strip()
+        if not line:
+            continue
+        sentences = []
+        for sentence in _SENTENCE_RE.findall(line):
+            sentence = sentence.strip()
+            key = sentence.rstrip("。！？；!?;.,，、 ").lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            sentences.append(sentence)
+        if sentences:
+            lines.append("".join(sentences))
+    return "\n".join(lines)
+
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    """按 token 预算截断文本，尽量在句子边界处截断。"""
+    if budget <= 0 or estimate_tokens(text) <= budget:
+        return text
+    kept = []
+    used = estimate_tokens(TRUNCATION_MARK)
+    for sentence in _SENTENCE_RE.findall(text):
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    if not kept:
+        # 第一句就超出预算时按字符截断
+        chars = max(budget - estimate_tokens(TRUNCATION_MARK), 1)
+        return text[:chars] + TRUNCATION_MARK
+    return "".join(kept).rstrip() + TRUNCATION_MARK
+
+
+def compact_text(text: Optional[str], budget: int, default: str = "未提供") -> str:
+    """去重、规范空白并按预算截断一段职位文本。"""
+    compacted = dedupe_text(text)
+    if not compacted:
+        return default
+    return truncate_to_budget(compacted, budget)
+
+
+def compact_json(data: Any, budget: Optional[int] = None) -> str:
+    """
+    紧凑序列化 JSON（无缩进、去掉空字段）。超出预算时逐步缩短过长的字符串字段，
+    仍然超出时直接截断序列化结果。
+    """
+    data = drop_empty(data or {})
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    if not budget or estimate_tokens(text) <= budget:
+        return text
+
+    max_chars = max((len(s) for s in re.findall(r'"((?:[^"\\]|\\.)*)"', text)), default=0)
+    while max_chars > 20 and estimate_tokens(text) > budget:
+        max_chars //= 2
+        text = json.dumps(_cap_strings(data, max_chars), ensure_ascii=False, separators=(",", ":"))
+    if estimate_tokens(text) > budget:
+        text = truncate_to_budget(text, budget)
+    return text
+
+
+def strip_indentation(text: str) -> str:
+    """去掉每行的缩进和首尾空行，模板中的缩进对 LLM 没有意义却占用 token。"""
+    return "\n".join(line.strip() for line in text.strip().splitlines())
+
+
+def compact_profile(profile_data: Optional[dict]) -> str:
+    return compact_json(profile_data, settings.PROMPT_PROFILE_TOKEN_BUDGET)
+
+
+def compact_responsibilities(text: Optional[str]) -> str:
+    return compact_text(text, settings.PROMPT_JOB_RESPONSIBILITIES_TOKEN_BUDGET)
+
+
+def compact_requirements(text: Optional[str]) -> str:
+    return compact_text(text, settings.PROMPT_JOB_REQUIREMENTS_TOKEN_BUDGET)
+
+
+def profile_signature() -> str:
+    """画像部分的压缩规则与预算，预算变化后提示词不同，缓存的匹配结果不再适用。"""
+    return f"{COMPACTOR_VERSION}:{settings.PROMPT_PROFILE_TOKEN_BUDGET}"
+
+
+def job_signature() -> str:
+    """职位部分的压缩规则与预算。"""
+    return (
+        f"{COMPACTOR_VERSION}:{settings.PROMPT_JOB_RESPONSIBILITIES_TOKEN_BUDGET}:"
+        f"{settings.PROMPT_JOB_REQUIREMENTS_TOKEN_BUDGET}"
+    )
@@ -0,0 +1,47 @@
+import hashlib
+import io
+import re
+import unicodedata
+
+import docx
+import pypdf
+
+PDF_CONTENT_TYPE = "application/pdf"
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+SUPPORTED_CONTENT_TYPES = (PDF_CONTENT_TYPE, DOCX_CONTENT_TYPE)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def extract_text(file_bytes: bytes, content_type: str) -> str:
+    """从 PDF 或 DOCX 文件中提取纯文本，不支持的类型抛出 ValueError。"""
+    content = ""
+    if content_type == PDF_CONTENT_TYPE:
+        with io.BytesIO(file_bytes) as pdf_file:
+            reader = pypdf.PdfReader(pdf_file)
+            for page in reader.pages:
+                content += page.extract_text() or ""
+    elif content_type == DOCX_CONTENT_TYPE:
+        with io.BytesIO(file_bytes) as doc_file:
+            doc = docx.Document(doc_file)
+            for para in doc.paragraphs:
+                content += para.text + "\n"
+    else:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    return content
+
+
+def normalize_text(text: str) -> str:
+    """
+    归一化简历文本：NFKC (全角转半角等) 后合并所有空白。
+    同一份简历另存为不同文件格式或重新导出时，归一化后的文本通常相同。
+    """
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def file_fingerprint(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def content_fingerprint(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
@@ -0,0 +1,41 @@
+import inspect
+import logging
+from typing import Any, Callable, Dict, List
+
+# 爬虫增量结果 (delta) 的订阅者，例如增量匹配
+# delta 结构: {"site_name": str, "new_job_ids": [...], "updated_job_ids": [...], "deactivated_job_ids": [...],
+#             "reactivated_job_ids": [...]}
+# 其中的 id 均为数据库中 jobs 表的主键；重新上线的职位同时包含在 updated_job_ids 中
+_subscribers: List[Callable[[Dict[str, Any]], Any]] = []
+
+
+def subscribe(handler: Callable[[Dict[str, Any]], Any]):
+    """注册一个 delta 处理函数，可以是普通函数或协程函数。"""
+    if handler not in _subscribers:
+        _subscribers.append(handler)
+
+
+def unsubscribe(handler: Callable[[Dict[str, Any]], Any]):
+    if handler in _subscribers:
+        _subscribers.remove(handler)
+
+
+async def publish(delta: Dict[str, Any]):
+    """
+    将一次爬取的 delta 发送给所有订阅者。
+    单个订阅者出错不会影响其他订阅者，也不会让爬虫任务失败。
+    """
+    for handler in list(_subscribers):
+        try:
+            result = handler(delta)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.error(f"Scrape delta handler {getattr(handler, '__name__', handler)} failed: {e}")
+
+
+def is_empty(delta: Dict[str, Any]) -> bool:
+    return not (
+        delta.get("new_job_ids") or delta.get("updated_job_ids") or delta.get("deactivated_job_ids")
+        or delta.get("reactivated_job_ids")
+    )
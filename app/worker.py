@@ -0,0 +1,152 @@
+"""
+匹配任务 worker 入口。
+
+从数据库中的 match_tasks 队列领取任务并执行，支持多进程、失败重试，
+worker 崩溃后其租约过期，任务会被其他 worker 重新领取。
+
+用法:
+    python -m app.worker --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.crud import crud_match_task
+from app.db.session import SessionLocal
+from app.services.llm_client import close_llm_client
+from app.services.matching_service import MatchingService
+
+_stop_requested = False
+
+
+def _request_stop(signum, frame):
+    global _stop_requested
+    _stop_requested = True
+
+
+async def _run_task(db, task) -> Optional[Dict[str, Any]]:
+    """根据任务类型调用匹配服务。"""
+    payload = task.payload or {}
+    service = MatchingService(db, run_id=f"task-{task.id}")
+    if task.task_type == crud_match_task.TASK_TYPE_PROFILE:
+        stats = await service.arun_matching_for_profile(
+            payload["profile_id"], top_k=payload.get("top_k"), batch_size=payload.get("batch_size")
+        )
+    elif task.task_type == crud_match_task.TASK_TYPE_INCREMENTAL:
+        stats = await service.arun_incremental_matching(payload["delta"])
+    else:
+        raise ValueError(f"Unknown match task type: {task.task_type}")
+    # 任务结果中附带本次运行的 LLM 调用统计
+    return {**stats, "llm_usage": service.llm_usage.summary()}
+
+
+async def _keep_lease(task_id: int, worker_id: str):
+    """定期续租，防止长时间运行的任务被其他 worker 当作崩溃任务接管。"""
+    interval = max(settings.MATCHING_TASK_LEASE_SECONDS / 3, 1)
+    while True:
+        await asyncio.sleep(interval)
+        db = SessionLocal()
+        try:
+            if not crud_match_task.heartbeat(
+                db, task_id=task_id, worker_id=worker_id, lease_seconds=settings.MATCHING_TASK_LEASE_SECONDS
+            ):
+                logging.warning(f"[{worker_id}] Lost lease on match task {task_id}.")
+                return
+        finally:
+            db.close()
+
+
+async def _execute(db, task, worker_id: str):
+    heartbeat = asyncio.create_task(_keep_lease(task.id, worker_id))
+    try:
+        return await _run_task(db, task)
+    finally:
+        heartbeat.cancel()
+        # 连接池绑定在本次 asyncio.run 的事件循环上，循环结束前关闭
+        await close_llm_client()
+
+
+def process_one(worker_id: str) -> bool:
+    """
+    领取并执行一个任务，返回是否领取到了任务。
+    """
+    db = SessionLocal()
+    try:
+        task = crud_match_task.lease(db, worker_id=worker_id, lease_seconds=settings.MATCHING_TASK_LEASE_SECONDS)
+        if task is None:
+            return False
+
+        task_id = task.id
+        logging.info(f"[{worker_id}] Running match task {task_id} ({task.task_type}, attempt {task.attempts}).")
+        try:
+            result = asyncio.run(_execute(db, task, worker_id))
+            crud_match_task.complete(db, task_id=task_id, worker_id=worker_id, result=result)
+            logging.info(f"[{worker_id}] Match task {task_id} finished: {result}")
+        except Exception as e:
+            db.rollback()
+            # 重试延迟按尝试次数倍增
+            delay = settings.MATCHING_TASK_RETRY_DELAY_SECONDS * 2 ** max(task.attempts - 1, 0)
+            status = crud_match_task.fail(
+                db, task_id=task_id, worker_id=worker_id, error=str(e), retry_delay_seconds=delay
+            )
+            logging.error(f"[{worker_id}] Match task {task_id} failed ({status}): {e}")
+        return True
+    finally:
+        db.close()
+
+
+def worker_loop(index: int = 0):
+    """单个 worker 进程的主循环，收到 SIGTERM/SIGINT 后在当前任务结束时退出。"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    logging.info(f"Match worker {worker_id} started.")
+
+    while not _stop_requested:
+        try:
+            if not process_one(worker_id):
+                time.sleep(settings.MATCHING_WORKER_POLL_SECONDS)
+        except Exception as e:
+            # 数据库暂时不可用等情况，稍后重试
+            logging.error(f"[{worker_id}] Worker loop error: {e}")
+            time.sleep(settings.MATCHING_WORKER_POLL_SECONDS)
+
+    logging.info(f"Match worker {worker_id} stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FindJobs matching worker")
+    parser.add_argument("--workers", type=int, default=settings.MATCHING_WORKERS, help="worker 进程数")
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        worker_loop(0)
+        return
+
+    # 使用 spawn，避免子进程继承父进程的数据库连接
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=worker_loop, args=(i,), name=f"match-worker-{i}") for i in range(args.workers)]
+    for process in processes:
+        process.start()
+
+    def _forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, _forward)
+    signal.signal(signal.SIGINT, _forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
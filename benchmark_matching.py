@@ -0,0 +1,181 @@
+"""
+匹配流水线压测脚本。
+
+使用本地模拟 LLM (FakeLLMClient，经过与真实服务商相同的限流/重试层) 端到端运行
+MatchingService，在不同职位数与并发数下统计吞吐 (jobs/sec)、LLM 调用延迟 p50/p95
+以及数据库写入耗时。默认使用临时 SQLite 数据库，不会消耗真实的 Gemini 配额。
+
+用法:
+    python benchmark_matching.py --jobs 100 500 --concurrency 4 16 --latency-ms 800
+    python benchmark_matching.py --jobs 200 --concurrency 8 --rate-limit-rate 0.05 --burst-every 50 --burst-length 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import List
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base_class import create_all_tables
+from app.models import Job, JobMatch, UserProfile
+from app.services.fake_llm import FakeLLMClient
+from app.services.llm_client import LLMClient
+from app.services.llm_resilience import ResilientLLMClient
+from app.services.matching_service import MatchingService
+
+PROFILE = {
+    "name": "压测用户",
+    "skills": ["Python", "FastAPI", "MySQL", "Docker", "机器学习"],
+    "work_experience": [{"company": "某科技公司", "role": "后端开发工程师", "description": "负责推荐系统后端服务的设计与开发"}],
+    "education": [{"school": "某大学", "degree": "本科", "major": "计算机科学"}],
+}
+
+TITLES = ["Python 后端开发工程师", "Java 开发工程师", "算法工程师", "前端开发工程师", "数据分析师", "测试工程师"]
+
+
+class TimedLLMClient(LLMClient):
+    """记录每次 generate 调用（含重试）的耗时。"""
+
+    def __init__(self, inner: LLMClient):
+        self.inner = inner
+        self.max_concurrency = inner.max_concurrency
+        self.latencies: List[float] = []
+
+    async def generate(self, prompt: str) -> str:
+        started = time.perf_counter()
+        try:
+            return await self.inner.generate(prompt)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def seed(db, job_count: int) -> int:
+    profile = UserProfile(raw_content="压测简历", structured_profile=PROFILE)
+    db.add(profile)
+    db.add_all([
+        Job(
+            title=TITLES[i % len(TITLES)],
+            description="负责相关系统的设计、开发与维护",
+            url=f"https://bench.local/jobs/{i}",
+            source_site="benchmark",
+            source_job_id=str(i),
+            job_responsibilities="1. 负责核心业务系统的设计与开发；\n2. 参与技术方案评审；\n3. 持续优化系统性能。",
+            job_requirements=f"1. 熟悉 {['Python', 'Java', 'Go'][i % 3]} 开发；\n2. 熟悉 MySQL、Redis；\n3. 有 {i % 5 + 1} 年以上相关经验。",
+            is_active=True,
+        )
+        for i in range(job_count)
+    ])
+    db.commit()
+    return profile.id
+
+
+def run_case(SessionLocal, profile_id: int, job_count: int, concurrency: int, args) -> dict:
+    db = SessionLocal()
+    try:
+        # 清空上一轮结果，保证每一轮都真正调用 LLM 而不是命中匹配缓存
+        db.query(JobMatch).delete()
+        active_ids = [row.id for row in db.query(Job.id).order_by(Job.id).limit(job_count)]
+        db.query(Job).update({"is_active": Job.id.in_(active_ids)}, synchronize_session=False)
+        db.commit()
+
+        fake = FakeLLMClient(
+            latency_ms=args.latency_ms,
+            latency_sigma=args.latency_sigma,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            burst_every=args.burst_every,
+            burst_length=args.burst_length,
+            retry_after=args.retry_after,
+            max_concurrency=concurrency,
+            seed=args.seed,
+        )
+        resilient = ResilientLLMClient.from_settings(fake)
+        client = TimedLLMClient(resilient)
+        service = MatchingService(db, max_concurrency=concurrency, llm_client=client)
+
+        started = time.perf_counter()
+        asyncio.run(service.arun_matching_for_profile(profile_id, top_k=0, batch_size=args.batch_size))
+        elapsed = time.perf_counter() - started
+
+        return {
+            "jobs": job_count,
+            "concurrency": concurrency,
+            "seconds": elapsed,
+            "jobs_per_sec": service.progress["done"] / elapsed if elapsed else 0.0,
+            "done": service.progress["done"],
+            "failed": service.progress["failed"],
+            "llm_calls": len(client.latencies),
+            "retries": resilient.stats["retries"],
+            "p50_ms": percentile(client.latencies, 50) * 1000,
+            "p95_ms": percentile(client.latencies, 95) * 1000,
+            "db_write_ms": service.write_stats["seconds"] * 1000,
+            "db_flushes": service.write_stats["flushes"],
+        }
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FindJobs matching pipeline benchmark (fake LLM)")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[100], help="职位数量，可给多个")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8], help="LLM 并发数，可给多个")
+    parser.add_argument("--batch-size", type=int, default=1, help="每次 LLM 请求打分的职位数")
+    parser.add_argument("--latency-ms", type=float, default=800, help="模拟延迟中位数 (毫秒)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="对数正态延迟的 sigma，0 表示固定延迟")
+    parser.add_argument("--error-rate", type=float, default=0, help="返回 503 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="随机返回 429 的比例")
+    parser.add_argument("--burst-every", type=int, default=0, help="每 N 次调用出现一段连续 429")
+    parser.add_argument("--burst-length", type=int, default=0, help="每段连续 429 的长度")
+    parser.add_argument("--retry-after", type=float, default=None, help="429 响应携带的 Retry-After 秒数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db-url", default=None, help="默认使用临时 SQLite 数据库")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    tmp_dir = None
+    db_url = args.db_url
+    if db_url is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        db_url = f"sqlite:///{os.path.join(tmp_dir.name, 'benchmark.db')}"
+    engine = create_engine(db_url)
+    create_all_tables(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = SessionLocal()
+    try:
+        profile_id = seed(db, max(args.jobs))
+    finally:
+        db.close()
+
+    header = f"{'jobs':>6} {'conc':>5} {'secs':>8} {'jobs/s':>8} {'done':>6} {'failed':>6} {'calls':>6} {'retries':>7} {'p50 ms':>8} {'p95 ms':>8} {'db ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for job_count in args.jobs:
+        for concurrency in args.concurrency:
+            r = run_case(SessionLocal, profile_id, job_count, concurrency, args)
+            print(
+                f"{r['jobs']:>6} {r['concurrency']:>5} {r['seconds']:>8.2f} {r['jobs_per_sec']:>8.1f} "
+                f"{r['done']:>6} {r['failed']:>6} {r['llm_calls']:>6} {r['retries']:>7} "
+                f"{r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {r['db_write_ms']:>8.1f}"
+            )
+
+    engine.dispose()
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+详情页抓取压测脚本。
+
+用保存的详情页样本 (tests/fixtures/haier) 测试 Playwright 浏览器打开详情页并提取字段的吞吐，
+不访问真实站点：通过路由拦截返回样本页面与模拟大小的静态资源。
+分别在关闭和开启资源拦截时各跑一次，对比每页耗时与传输的字节数。
+
+用法:
+    python benchmark_scraper.py --pages 100 --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app.scraper.haier import HaierScraper
+from app.scraper.rate_limiter import DomainRateLimiter
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "haier")
+# 样本页面引用的静态资源：路径 -> (Content-Type, 模拟的字节数)
+STATIC_ASSETS = {
+    "/static/css/app.css": ("text/css", 60 * 1024),
+    "/static/js/vendor.js": ("application/javascript", 250 * 1024),
+    "/static/js/app.js": ("application/javascript", 80 * 1024),
+}
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURE_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def build_pages(count: int) -> dict:
+    """职位 ID -> 页面 HTML。"""
+    rendered = load_fixture("detail_rendered.html")
+    return {str(i): rendered for i in range(1, count + 1)}
+
+
+def new_scraper(concurrency: int) -> HaierScraper:
+    scraper = HaierScraper(db=None)
+    # 本地样本不需要礼貌限速
+    scraper.rate_limiter = DomainRateLimiter(0)
+    scraper.page_concurrency = concurrency
+    return scraper
+
+
+def asset_body(size: int) -> str:
+    # 注释填充，浏览器可以正常解析
+    return "/*" + "x" * max(0, size - 4) + "*/"
+
+
+async def run_browser(pages: dict, concurrency: int, block_resources: bool) -> dict:
+    from urllib.parse import urlsplit
+
+    from playwright.async_api import async_playwright
+
+    async def fulfill(route):
+        url = route.request.url
+        path = urlsplit(url).path
+        if "/client/job/detail" in url:
+            job_id = url.split("id=")[-1]
+            await route.fulfill(status=200, content_type="text/html", body=pages.get(job_id, ""))
+        elif path in STATIC_ASSETS:
+            content_type, size = STATIC_ASSETS[path]
+            await route.fulfill(status=200, content_type=content_type, body=asset_body(size))
+        else:
+            await route.fulfill(status=404, body="")
+
+    scraper = new_scraper(concurrency)
+    scraper.block_resources = block_resources
+    saved = {}
+
+    async def process(page, job_id):
+        saved[job_id] = await scraper._scrape_job_details(page, job_id)
+
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        original_new_context = browser.new_context
+
+        async def routed_context(**kwargs):
+            context = await original_new_context(**kwargs)
+            await context.route("**/*", fulfill)
+            return context
+
+        browser.new_context = routed_context
+        started = time.perf_counter()
+        try:
+            await scraper._run_page_workers(browser, list(pages), process)
+        finally:
+            elapsed = time.perf_counter() - started
+            await browser.close()
+    return {
+        "path": "browser+block" if block_resources else "browser",
+        "pages": len(pages),
+        "seconds": elapsed,
+        "failed": sum(1 for details in saved.values() if not details),
+        "kb_per_page": scraper.traffic.bytes_per_page() / 1024,
+        "blocked": scraper.traffic.blocked,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Haier detail page fetch benchmark (saved fixtures)")
+    parser.add_argument("--pages", type=int, default=50, help="抓取的详情页数量")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发页面数")
+    args = parser.parse_args()
+
+    pages = build_pages(args.pages)
+    results = [asyncio.run(run_browser(pages, args.concurrency, block_resources)) for block_resources in (False, True)]
+
+    header = f"{'path':>14} {'pages':>6} {'secs':>8} {'pages/s':>8} {'ms/page':>8} {'failed':>7} {'KB/page':>8} {'blocked':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['path']:>14} {r['pages']:>6} {r['seconds']:>8.2f} {r['pages'] / r['seconds']:>8.1f} "
+            f"{r['seconds'] / r['pages'] * 1000:>8.1f} {r['failed'] / r['pages']:>7.1%} "
+            f"{r['kb_per_page']:>8.1f} {r['blocked']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
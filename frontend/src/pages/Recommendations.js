@@ -1,12 +1,14 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Button, List, Card, Progress, Typography, message, Spin, Empty, Space, Radio } from 'antd';
 import axios from 'axios';
 
 const { Title, Text, Paragraph } = Typography;
 
+const API_BASE_URL = 'http://127.0.0.1:8000/api/v1';
+
 // 创建一个自定义的 axios 实例，用于后续的 API 调用
 const apiClient = axios.create({
-  baseURL: 'http://127.0.0.1:8000/api/v1',
+  baseURL: API_BASE_URL,
 });
 
 const Recommendations = () => {
@@ -14,6 +16,8 @@ const Recommendations = () => {
   const [loading, setLoading] = useState(true);
   const [matching, setMatching] = useState(false);
   const [sortOrder, setSortOrder] = useState('desc'); // 'desc' or 'asc'
+  const [progress, setProgress] = useState(null); // 流式匹配进度 { done, total, failed, cached, eta_seconds }
+  const eventSourceRef = useRef(null);
 
   // 处理排序变化的函数
   const handleSortChange = (e) => {
@@ -40,23 +44,58 @@ const Recommendations = () => {
     setLoading(false);
   };
 
-  // 触发匹配任务的函数
-  const handleTriggerMatching = async () => {
-    setMatching(true);
-    try {
-      await apiClient.post('/profiles/1/match');
-      message.success('智能匹配任务已成功触发！结果将在几分钟后更新。');
-    } catch (error) {
-      if (error.response && error.response.status === 404) {
-        message.error('触发匹配失败：找不到用户画像。请先在“个人分析”页面上传简历。');
-      } else {
-        message.error('触发匹配任务失败，请检查后端服务是否正常。');
-      }
-      console.error('Trigger matching error:', error);
+  // 将流式推送的单条匹配结果合并到列表中（同一职位只保留最新结果）
+  const mergeMatch = (match) => {
+    setRecommendations((prev) => {
+      const merged = [...prev.filter((item) => item.job_id !== match.job_id), match];
+      return merged.sort((a, b) => (
+        sortOrder === 'desc' ? b.match_score - a.match_score : a.match_score - b.match_score
+      ));
+    });
+  };
+
+  // 触发匹配任务：通过 SSE 实时接收每个职位的匹配结果和进度
+  const handleTriggerMatching = () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
     }
-    setMatching(false);
+    setMatching(true);
+    setProgress(null);
+
+    const eventSource = new EventSource(`${API_BASE_URL}/profiles/1/match/stream`);
+    eventSourceRef.current = eventSource;
+
+    const finish = () => {
+      eventSource.close();
+      eventSourceRef.current = null;
+      setMatching(false);
+    };
+
+    eventSource.addEventListener('match', (e) => mergeMatch(JSON.parse(e.data)));
+    eventSource.addEventListener('progress', (e) => setProgress(JSON.parse(e.data)));
+    eventSource.addEventListener('done', (e) => {
+      setProgress(JSON.parse(e.data));
+      message.success('智能匹配已完成！');
+      finish();
+    });
+    eventSource.addEventListener('failed', (e) => {
+      message.error(`智能匹配失败：${JSON.parse(e.data).detail}`);
+      finish();
+    });
+    eventSource.onerror = () => {
+      // 连接失败（例如找不到用户画像或后端不可用）
+      message.error('智能匹配连接中断，请确认已在“个人分析”页面上传简历且后端服务正常。');
+      finish();
+    };
   };
 
+  // 组件卸载时关闭连接
+  useEffect(() => () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
+    }
+  }, []);
+
   // 组件加载时自动获取一次数据
   useEffect(() => {
     fetchRecommendations();
@@ -67,7 +106,7 @@ const Recommendations = () => {
       <Space direction="vertical" style={{ width: '100%' }}>
         <Title level={3}>智能岗位推荐</Title>
         <Paragraph>
-          这里将基于您最新上传的简历，为您智能匹配最合适的岗位。匹配过程可能需要几分钟，请耐心等待。
+          这里将基于您最新上传的简历，为您智能匹配最合适的岗位。匹配结果会在打分完成后逐条显示。
         </Paragraph>
         <Space>
             <Button 
@@ -82,6 +121,19 @@ const Recommendations = () => {
             </Button>
         </Space>
 
+        {progress && progress.total > 0 && (
+          <Space direction="vertical" style={{ width: '100%' }}>
+            <Progress
+              percent={Math.round(((progress.done + progress.failed) / progress.total) * 100)}
+              status={matching ? 'active' : 'normal'}
+            />
+            <Text type="secondary">
+              已完成 {progress.done}/{progress.total}（缓存命中 {progress.cached}，失败 {progress.failed}）
+              {matching && progress.eta_seconds != null && `，预计剩余 ${Math.ceil(progress.eta_seconds)} 秒`}
+            </Text>
+          </Space>
+        )}
+
         <Radio.Group onChange={handleSortChange} value={sortOrder}>
           <Radio.Button value="desc">按匹配度降序</Radio.Button>
           <Radio.Button value="asc">按匹配度升序</Radio.Button>
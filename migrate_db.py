@@ -0,0 +1,11 @@
+from app.db.session import engine
+from app.db.migrations import migrate_job_matches
+
+# create_all 不会修改已有的表：升级到新版本后运行一次，为已有的表补齐新列与唯一约束
+print("Migrating existing tables...")
+
+steps = migrate_job_matches(engine)
+for step in steps:
+    print(f"  - job_matches: {step}")
+
+print("Migration complete!" if steps else "Schema is already up to date.")
@@ -0,0 +1,236 @@
+import asyncio
+
+import pytest
+
+from app.scraper import base, browser_pool
+from app.scraper.browser_pool import BrowserLease, BrowserPool
+from app.scraper.haier import HaierScraper
+
+
+class FakeRequest:
+    def __init__(self, resource_type="document", navigation=True):
+        self.resource_type = resource_type
+        self.navigation = navigation
+
+    def is_navigation_request(self):
+        return self.navigation
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.listeners = {}
+        self.closed = False
+
+    def on(self, event, handler):
+        self.listeners.setdefault(event, []).append(handler)
+
+    def navigate(self, count=1):
+        for _ in range(count):
+            for handler in self.listeners.get("request", []):
+                handler(FakeRequest())
+            for handler in self.listeners.get("request", []):
+                # 子资源请求不计入页面数
+                handler(FakeRequest("script", navigation=False))
+
+    async def new_page(self):
+        return object()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self, number):
+        self.number = number
+        self.contexts = []
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self):
+        return self.connected and not self.closed
+
+    async def new_context(self, **kwargs):
+        if not self.connected:
+            raise RuntimeError("Browser has been closed")
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.closed = True
+
+
+class Launcher:
+    def __init__(self):
+        self.browsers = []
+
+    async def __call__(self):
+        browser = FakeBrowser(len(self.browsers))
+        self.browsers.append(browser)
+        return browser
+
+
+def _pool(**kwargs):
+    launcher = Launcher()
+    return BrowserPool(launcher=launcher, **kwargs), launcher
+
+
+def test_lease_spreads_contexts_and_keeps_browsers_running():
+    pool, launcher = _pool(size=2)
+
+    async def run():
+        await pool.start()
+        lease = pool.lease()
+        contexts = [await lease.new_context() for _ in range(4)]
+        await lease.new_page()
+        await lease.close()
+        return contexts
+
+    contexts = asyncio.run(run())
+    assert len(launcher.browsers) == 2
+    # 每个浏览器分到两个上下文 (加上 new_page 创建的一个)
+    assert sorted(len(browser.contexts) for browser in launcher.browsers) == [2, 3]
+    assert all(context.closed for context in contexts)
+    assert not any(browser.closed for browser in launcher.browsers)
+
+    asyncio.run(pool.close())
+    assert all(browser.closed for browser in launcher.browsers)
+
+
+def test_browser_is_recycled_after_page_limit_once_idle():
+    pool, launcher = _pool(size=1, max_pages=3)
+
+    async def run():
+        await pool.start()
+        lease = pool.lease()
+        first = await lease.new_context()
+        second = await lease.new_context()
+        first.navigate(2)
+        second.navigate(2)
+        await pool.release(first)
+        # 仍有上下文在使用，只标记待回收
+        assert pool.stats()[0]["retiring"] and len(launcher.browsers) == 1
+        await lease.close()
+        third = await lease.new_context()
+        return third
+
+    third = asyncio.run(run())
+    assert len(launcher.browsers) == 2 and launcher.browsers[0].closed
+    assert third.browser is launcher.browsers[1]
+    assert pool.recycled == 1 and pool.stats()[0]["pages"] == 0
+
+
+def test_health_check_replaces_dead_browsers_and_retires_on_memory():
+    memory = [100.0]
+    launcher = Launcher()
+    pool = BrowserPool(size=2, max_memory_mb=1000, launcher=launcher, memory_probe=lambda: memory[0])
+
+    async def run():
+        await pool.start()
+        launcher.browsers[0].connected = False
+        await pool.check_health()
+        assert len(launcher.browsers) == 3 and pool.recycled == 1
+
+        context = await pool.lease().new_context()
+        context.navigate(5)
+        memory[0] = 1500.0
+        await pool.check_health()
+        # 内存超限：页面最多的浏览器正在使用，空闲后才重启
+        assert pool.recycled == 1 and sum(slot["retiring"] for slot in pool.stats()) == 1
+        await pool.release(context)
+        assert pool.recycled == 2
+
+    asyncio.run(run())
+
+
+def test_health_probe_does_not_block_new_contexts():
+    pool, launcher = _pool(size=1)
+    probe_started, finish_probe = asyncio.Event(), asyncio.Event()
+
+    async def run():
+        await pool.start()
+        browser = launcher.browsers[0]
+        new_context = browser.new_context
+
+        async def slow_probe(**kwargs):
+            browser.new_context = new_context
+            probe_started.set()
+            await finish_probe.wait()
+            return await new_context(**kwargs)
+
+        browser.new_context = slow_probe
+        health = asyncio.create_task(pool.check_health())
+        await probe_started.wait()
+        # 探测进行中仍可以从池中创建上下文
+        context = await asyncio.wait_for(pool.lease().new_context(), 1)
+        finish_probe.set()
+        await health
+        return context
+
+    context = asyncio.run(run())
+    assert context.browser is launcher.browsers[0]
+    assert len(launcher.browsers) == 1 and pool.recycled == 0
+
+
+def test_failed_start_releases_launched_browsers():
+    launched = []
+
+    async def launcher():
+        if launched:
+            raise RuntimeError("Executable doesn't exist")
+        browser = FakeBrowser(0)
+        launched.append(browser)
+        return browser
+
+    pool = BrowserPool(size=2, launcher=launcher)
+    with pytest.raises(RuntimeError):
+        asyncio.run(pool.start())
+    assert launched[0].closed and pool.stats() == []
+
+
+def test_scraper_borrows_from_the_pool(monkeypatch):
+    pool, launcher = _pool(size=1)
+    asyncio.run(pool.start())
+    monkeypatch.setattr(browser_pool, "_pool", pool)
+
+    async def run():
+        scraper = HaierScraper(db=None)
+        browser = await scraper._initialize_browser()
+        await browser.new_context()
+        await scraper._close_browser(browser)
+        return browser
+
+    lease = asyncio.run(run())
+    assert isinstance(lease, BrowserLease)
+    assert launcher.browsers[0].contexts[0].closed and not launcher.browsers[0].closed
+
+
+def test_scraper_without_pool_stops_the_playwright_driver(monkeypatch):
+    events = []
+
+    class FakePlaywright:
+        class chromium:
+            @staticmethod
+            async def launch(**kwargs):
+                return FakeBrowser(0)
+
+        async def stop(self):
+            events.append("stop")
+
+    class FakeManager:
+        async def start(self):
+            events.append("start")
+            return FakePlaywright()
+
+    monkeypatch.setattr(browser_pool, "_pool", None)
+    monkeypatch.setattr(base, "async_playwright", FakeManager)
+
+    async def run():
+        scraper = HaierScraper(db=None)
+        browser = await scraper._initialize_browser()
+        await scraper._close_browser(browser)
+        return browser
+
+    browser = asyncio.run(run())
+    assert browser.closed and events == ["start", "stop"]
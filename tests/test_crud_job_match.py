@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base_class import Base
+from app.db.migrations import migrate_job_matches
+from app.models import Job, UserProfile, JobMatch
+from app.crud import crud_job_match
+from app.schemas.job_match import JobMatchCreate
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    session.add(UserProfile(id=1, raw_content="resume", structured_profile={"skills": ["Python"]}))
+    session.add_all([
+        Job(id=i, title=f"Job {i}", description="...", url=f"url{i}", source_site="test")
+        for i in range(1, 4)
+    ])
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def make_match(job_id, score, suggestions=None):
+    return JobMatchCreate(
+        user_profile_id=1, job_id=job_id, match_score=score,
+        match_summary=f"score {score}", improvement_suggestions=suggestions
+    )
+
+
+def test_bulk_upsert_is_idempotent(db):
+    crud_job_match.bulk_upsert(db, objs_in=[make_match(1, 5), make_match(2, 6), make_match(3, 7)])
+    crud_job_match.bulk_upsert(db, objs_in=[make_match(1, 9, "学习 Go"), make_match(2, 6)])
+
+    matches = crud_job_match.get_by_profile_id(db, profile_id=1)
+    assert sorted(m.job_id for m in matches) == [1, 2, 3]
+    by_job = {m.job_id: m for m in matches}
+    assert by_job[1].match_score == 9
+    assert by_job[1].improvement_suggestions == "学习 Go"
+    assert db.query(JobMatch).count() == 3
+
+
+def test_bulk_upsert_revives_stale_match(db):
+    crud_job_match.bulk_upsert(db, objs_in=[make_match(1, 5)])
+    crud_job_match.mark_stale(db, job_ids=[1])
+    assert crud_job_match.get_by_profile_id(db, profile_id=1) == []
+
+    crud_job_match.bulk_upsert(db, objs_in=[make_match(1, 8)])
+    matches = crud_job_match.get_by_profile_id(db, profile_id=1)
+    assert len(matches) == 1 and matches[0].match_score == 8
+
+
+def test_create_keeps_improvement_suggestions(db):
+    match = crud_job_match.create(db, obj_in=make_match(2, 7, "考取证书"))
+    assert match.id is not None
+    assert match.improvement_suggestions == "考取证书"
+
+
+def test_outdated_table_is_rejected_until_migrated():
+    # 旧版本 create_all 创建的表：没有指纹/过期列，也没有唯一约束
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine, tables=[UserProfile.__table__, Job.__table__])
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE job_matches (id INTEGER PRIMARY KEY, user_profile_id INTEGER NOT NULL,"
+            " job_id INTEGER NOT NULL, match_score FLOAT NOT NULL, match_summary TEXT NOT NULL,"
+            " improvement_suggestions TEXT, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO job_matches (id, user_profile_id, job_id, match_score, match_summary)"
+            " VALUES (1, 1, 1, 3, 'old'), (2, 1, 1, 6, 'new'), (3, 1, 2, 4, 'only')"
+        ))
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        with pytest.raises(RuntimeError, match="migrate_db"):
+            crud_job_match.bulk_upsert(session, objs_in=[make_match(1, 5)])
+        session.rollback()
+
+        assert migrate_job_matches(engine)
+        assert migrate_job_matches(engine) == []
+        # 重复的结果只保留最新的一条
+        assert {m.job_id: m.match_summary for m in session.query(JobMatch)} == {1: "new", 2: "only"}
+
+        crud_job_match.bulk_upsert(session, objs_in=[make_match(1, 8)])
+        assert session.query(JobMatch).count() == 2
+        assert session.query(JobMatch).filter(JobMatch.job_id == 1).one().match_score == 8
+    finally:
+        session.close()
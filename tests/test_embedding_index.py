@@ -0,0 +1,124 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from app.models import Job
+from app.services import embedding_index
+from app.services.embedding_index import HashingEmbedder, JobEmbeddingStore
+
+
+def _jobs():
+    return [
+        Job(id=1, title="Python 后端开发", job_requirements="Python Django MySQL", description="研发"),
+        Job(id=2, title="Java 后端开发", job_requirements="Java Spring MySQL", description="研发"),
+        Job(id=3, title="销售经理", job_requirements="客户沟通 销售经验", description="销售"),
+    ]
+
+
+def test_hashing_embedder_returns_unit_vectors():
+    embedder = HashingEmbedder(dim=64)
+    vectors = embedder.embed(["Python 开发", "", "销售"])
+    assert vectors.shape == (3, 64) and vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[[0, 2]], axis=1), 1.0)
+    # 空文本得到零向量而不是 NaN
+    assert not np.any(vectors[1])
+
+
+def test_sync_only_embeds_new_or_changed_jobs(tmp_path):
+    store = JobEmbeddingStore(str(tmp_path), HashingEmbedder(dim=64))
+    jobs = _jobs()
+    assert store.sync(jobs) == 3
+    assert store.sync(jobs) == 0
+
+    jobs[0].job_requirements = "Python FastAPI"
+    assert store.sync(jobs) == 1
+    # 下线的职位从索引中移除
+    assert store.sync(jobs[:2]) == 0
+    assert store.job_ids == [1, 2]
+
+
+def test_search_ranks_similar_jobs_and_excludes_ids(tmp_path):
+    store = JobEmbeddingStore(str(tmp_path), HashingEmbedder(dim=256))
+    store.sync(_jobs())
+
+    ranked = store.search(store.vector_for(1), 2, exclude_ids=[1])
+    assert [job_id for job_id, _ in ranked] == [2, 3]
+    assert ranked[0][1] > ranked[1][1]
+    assert store.search_text("销售 客户", 1)[0][0] == 3
+
+
+def test_index_is_persisted_and_memory_mapped(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    JobEmbeddingStore(str(tmp_path), embedder).sync(_jobs())
+
+    reopened = JobEmbeddingStore(str(tmp_path), embedder)
+    assert isinstance(reopened.vectors, np.memmap)
+    assert reopened.job_ids == [1, 2, 3]
+    assert reopened.sync(_jobs()) == 0
+    # 维度变化时旧索引作废并重建
+    assert JobEmbeddingStore(str(tmp_path), HashingEmbedder(dim=32)).sync(_jobs()) == 3
+
+
+def test_mismatched_vectors_file_is_rejected_and_rebuilt(tmp_path):
+    embedder = HashingEmbedder(dim=64)
+    store = JobEmbeddingStore(str(tmp_path), embedder)
+    store.sync(_jobs())
+    old_files = list(tmp_path.glob("job_vectors.*.f32"))
+    store.sync(_jobs()[:2])
+    # 每次保存写入新的矩阵文件，旧文件随后删除
+    assert len(list(tmp_path.glob("job_vectors.*.f32"))) == 1 and not old_files[0].exists()
+
+    # 模拟崩溃后矩阵文件与元数据不匹配
+    next(tmp_path.glob("job_vectors.*.f32")).write_bytes(b"\0" * 64)
+    reopened = JobEmbeddingStore(str(tmp_path), embedder)
+    assert reopened.job_ids == []
+    assert reopened.sync(_jobs()) == 3
+
+
+def test_queries_do_not_rescan_jobs_once_the_index_exists(tmp_path, monkeypatch):
+    store = JobEmbeddingStore(str(tmp_path), HashingEmbedder(dim=64))
+    monkeypatch.setattr(embedding_index, "_store", store)
+    get_all = MagicMock(return_value=_jobs())
+    monkeypatch.setattr(embedding_index.crud_job, "get_all", get_all)
+
+    embedding_index.similar_jobs(MagicMock(), job_id=1, k=2)
+    embedding_index.jobs_for_profile(MagicMock(), profile_data={"skills": ["Python"]}, k=2)
+    # 只有索引为空时的第一次查询加载职位
+    assert get_all.call_count == 1
+
+    session = MagicMock()
+    monkeypatch.setattr(embedding_index, "SessionLocal", lambda: session)
+    asyncio.run(embedding_index.on_scrape_delta({"site_name": "haier"}))
+    assert get_all.call_count == 2 and session.close.called
+
+
+def test_searches_see_a_consistent_index_while_syncing(tmp_path):
+    store = JobEmbeddingStore(str(tmp_path), HashingEmbedder(dim=64))
+    jobs = _jobs()
+    store.sync(jobs)
+    held = store._snapshot
+
+    # 同步替换整个快照，已取得的旧快照保持不变
+    store.sync(jobs[1:])
+    assert store._snapshot is not held
+    assert held.job_ids == [1, 2, 3] and held.vectors.shape[0] == 3 and held.row_of[3] == 2
+    assert store.job_ids == [2, 3] and store.vectors.shape[0] == 2
+
+    errors = []
+
+    def search_repeatedly():
+        try:
+            for _ in range(200):
+                for job_id, _ in store.search(store.embedder.embed(["销售"])[0], 3, exclude_ids=[1, 3]):
+                    assert job_id in (1, 2, 3)
+        except Exception as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=search_repeatedly)
+    reader.start()
+    for i in range(20):
+        store.sync(jobs if i % 2 else jobs[:1])
+    reader.join()
+    assert errors == []
@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+
+from app.models import Job
+from app.services import llm_client
+from app.services.fake_llm import FakeLLMClient
+from app.services.matching_service import MatchingService
+
+
+def _statuses(client, calls):
+    statuses = []
+    for _ in range(calls):
+        try:
+            asyncio.run(client.generate("x"))
+            statuses.append(200)
+        except httpx.HTTPStatusError as e:
+            statuses.append(e.response.status_code)
+    return statuses
+
+
+def test_fake_responses_parse_as_match_results():
+    client = FakeLLMClient(seed=1)
+    service = MatchingService(db=None)
+    jobs = [Job(id=5, title="Python 开发"), Job(id=9, title="Java 开发")]
+
+    single = asyncio.run(client.generate(service._build_prompt({"skills": ["Python"]}, jobs[0])))
+    score, summary, _ = service._parse_response(single)
+    assert 1 <= score <= 10 and summary
+
+    batch = asyncio.run(client.generate(service._build_batch_prompt({"skills": ["Python"]}, jobs)))
+    assert set(service._parse_batch_response(batch, jobs)) == {5, 9}
+
+    assert asyncio.run(client.analyze("简历内容"))["name"] == "模拟用户"
+
+
+def test_fake_injects_429_bursts_and_errors():
+    assert _statuses(FakeLLMClient(burst_every=4, burst_length=2), 8) == [200, 200, 429, 429] * 2
+    assert set(_statuses(FakeLLMClient(error_rate=1.0), 3)) == {503}
+
+
+def test_fake_provider_is_selectable(monkeypatch):
+    monkeypatch.setattr(llm_client, "_client", None)
+    monkeypatch.setattr(llm_client.settings, "LLM_PROVIDER", "fake")
+    monkeypatch.setattr(llm_client.settings, "LLM_CACHE_ENABLED", False)
+    client = llm_client.get_llm_client()
+    assert isinstance(client.inner.inner, FakeLLMClient)
@@ -0,0 +1,39 @@
+from app.models import Job
+from app.services import job_ranker
+from app.services.job_ranker import BM25Index, get_job_index, profile_query_text, tokenize
+
+
+def test_tokenize_mixed_chinese_english():
+    tokens = tokenize("熟悉Python和C++开发")
+    assert "python" in tokens
+    assert "c++" in tokens
+    assert "熟悉" in tokens and "开发" in tokens
+
+
+def test_profile_query_text_prefers_skills_and_experience():
+    profile = {"name": "张三", "skills": ["Python"], "work_experience": [{"company": "海尔", "role": "后端开发"}]}
+    text = profile_query_text(profile)
+    assert "Python" in text and "后端开发" in text
+    assert "张三" not in text
+    # 没有技能与经验字段时使用整个画像
+    assert "Java" in profile_query_text({"summary": "Java 工程师"})
+
+
+def test_bm25_ranks_relevant_jobs_first():
+    jobs = [
+        Job(id=1, title="销售经理", description="销售"),
+        Job(id=2, title="Python 开发工程师", job_requirements="Python Django", description="研发"),
+        Job(id=3, title="Java 开发工程师", job_requirements="Java Spring", description="研发"),
+    ]
+    index = BM25Index.from_jobs(jobs)
+    ranked = index.top_k("Python 开发", 2)
+    assert [job_id for job_id, _ in ranked] == [2, 3]
+
+
+def test_job_index_is_reused_for_unchanged_corpus():
+    job_ranker._index_cache.clear()
+    jobs = [Job(id=1, title="Python 开发"), Job(id=2, title="Java 开发")]
+    fingerprints = {1: "a", 2: "b"}
+    first = get_job_index(jobs, fingerprints)
+    assert get_job_index(list(reversed(jobs)), fingerprints) is first
+    assert get_job_index(jobs, {1: "a", 2: "changed"}) is not first
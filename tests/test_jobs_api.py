@@ -111,3 +111,19 @@ def test_read_single_job(setup_database):
     assert response.status_code == 404
     assert response.json()["detail"] == "Job not found"
 
+
+
+def test_read_similar_jobs(setup_database, tmp_path, monkeypatch):
+    from app.services import embedding_index
+    store = embedding_index.JobEmbeddingStore(str(tmp_path), embedding_index.HashingEmbedder(dim=128))
+    monkeypatch.setattr(embedding_index, "_store", store)
+
+    response = client.get("/api/v1/jobs/similar?job_id=1&limit=5")
+    assert response.status_code == 200
+    data = response.json()
+    # 只返回有效职位，且不包含参照职位本身
+    assert {item["job"]["id"] for item in data} == {2, 3}
+    assert data[0]["score"] >= data[1]["score"]
+
+    response = client.get("/api/v1/jobs/similar?job_id=999")
+    assert response.status_code == 404
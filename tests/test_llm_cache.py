@@ -0,0 +1,128 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.llm_cache import CachedLLMClient, LLMResponseCache, cache_only_valid, no_cache, prompt_key
+
+
+def _cached_client(tmp_path, **cache_kwargs):
+    inner = MagicMock()
+    inner.max_concurrency = 2
+    inner.generate = AsyncMock(side_effect=lambda prompt: f"answer:{prompt}")
+    cache = LLMResponseCache(str(tmp_path / "llm_cache.sqlite3"), **cache_kwargs)
+    return CachedLLMClient(inner, cache, "google", "gemini-test"), inner
+
+
+def test_identical_prompts_hit_the_cache(tmp_path):
+    client, inner = _cached_client(tmp_path)
+
+    async def run():
+        return [await client.generate(p) for p in ("a", "b", "a", "a")]
+
+    assert asyncio.run(run()) == ["answer:a", "answer:b", "answer:a", "answer:a"]
+    assert inner.generate.call_count == 2
+    summary = client.cache.summary()
+    assert summary["hits"] == 2 and summary["misses"] == 2
+    assert summary["hit_rate"] == 0.5
+    assert summary["entries"] == 2
+
+
+def test_cache_survives_restart(tmp_path):
+    client, _ = _cached_client(tmp_path)
+    asyncio.run(client.generate("a"))
+    client.cache.close()
+
+    # 新进程（新的缓存对象）读取同一个文件
+    restarted, inner = _cached_client(tmp_path)
+    assert asyncio.run(restarted.generate("a")) == "answer:a"
+    inner.generate.assert_not_called()
+
+
+def test_cache_opt_out_per_call(tmp_path):
+    client, inner = _cached_client(tmp_path)
+
+    async def run():
+        await client.generate("a")
+        await client.generate("a", use_cache=False)
+        with no_cache():
+            await client.analyze("简历")
+        await client.generate("a")
+
+    inner.generate.side_effect = lambda prompt: '{"name": "张三"}' if "简历" in prompt else "x"
+    asyncio.run(run())
+    # 跳过缓存的两次调用都请求了 API，且 analyze 的结果没有写入缓存
+    assert inner.generate.call_count == 3
+    assert client.cache.summary()["entries"] == 1
+
+
+def test_failed_calls_are_not_cached(tmp_path):
+    client, inner = _cached_client(tmp_path)
+    inner.generate.side_effect = [RuntimeError("boom"), "ok"]
+
+    async def run():
+        try:
+            await client.generate("a")
+        except RuntimeError:
+            pass
+        return await client.generate("a")
+
+    assert asyncio.run(run()) == "ok"
+    assert inner.generate.call_count == 2
+
+
+def test_invalid_responses_are_not_served_again(tmp_path):
+    client, inner = _cached_client(tmp_path)
+    inner.generate.side_effect = ["not json", '{"name": "张三"}', "not json"]
+
+    async def run():
+        # 无法解析的简历分析结果不缓存，下次重新请求
+        first = await client.generate("简历")
+        with cache_only_valid(lambda text: text.startswith("{")):
+            second = await client.generate("简历")
+            third = await client.generate("简历")
+        return first, second, third
+
+    assert asyncio.run(run()) == ("not json", '{"name": "张三"}', '{"name": "张三"}')
+    # 第一次的无效响应在没有校验时已被缓存，校验时视为未命中并被替换
+    assert inner.generate.call_count == 2
+
+    inner.generate.side_effect = ["not json", '{"name": "李四"}']
+    inner.generate.reset_mock()
+
+    async def analyze_twice():
+        try:
+            await client.analyze("其他简历")
+        except ValueError:
+            pass
+        return await client.analyze("其他简历")
+
+    assert asyncio.run(analyze_twice()) == {"name": "李四"}
+    assert inner.generate.call_count == 2
+
+
+def test_lru_and_size_eviction(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "c.sqlite3"), max_entries=2)
+    for key in ("k1", "k2", "k3"):
+        cache.put(key, "google", "m", "v")
+    cache.get("k1")  # k1 最近被访问过，k2 最久未访问
+    assert cache.evict() == 1
+    assert cache.get("k2") is None
+    assert cache.get("k1") == "v" and cache.get("k3") == "v"
+
+    sized = LLMResponseCache(str(tmp_path / "s.sqlite3"), max_bytes=10)
+    sized.put("a", "google", "m", "12345")
+    sized.put("b", "google", "m", "1234567")
+    assert sized.evict() == 1
+    assert sized.get("a") is None
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "c.sqlite3"), max_age_seconds=60)
+    cache.put("k", "google", "m", "v")
+    cache._connection().execute("UPDATE llm_responses SET created_at = created_at - 120")
+    assert cache.get("k") is None
+    assert cache.stats["evictions"] == 1
+
+
+def test_prompt_key_depends_on_provider_and_model():
+    assert prompt_key("google", "a", "p") != prompt_key("google", "b", "p")
+    assert prompt_key("google", "a", "p") != prompt_key("fake", "a", "p")
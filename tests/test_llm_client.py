@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+
+from app.services import llm_client
+from app.services.llm_cache import CachedLLMClient
+from app.services.llm_client import GeminiClient, get_llm_client
+from app.services.llm_instrumentation import InstrumentedLLMClient
+
+
+def _gemini_handler(requests):
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        body = json.loads(request.content)
+        text = body["contents"][0]["parts"][0]["text"]
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": f"echo:{text}"}]}}]})
+    return handler
+
+
+def test_generate_reuses_pooled_http_client():
+    requests = []
+    client = GeminiClient("key", "gemini-test", "http://llm.local/", transport=httpx.MockTransport(_gemini_handler(requests)))
+
+    async def run():
+        first = await client.generate("a")
+        pool = client._http
+        results = await asyncio.gather(*(client.generate(str(i)) for i in range(5)))
+        assert client._http is pool
+        await client.aclose()
+        assert client._http is None
+        return first, results
+
+    first, results = asyncio.run(run())
+    assert first == "echo:a"
+    assert results == [f"echo:{i}" for i in range(5)]
+    assert str(requests[0].url) == "http://llm.local/v1/models/gemini-test:generateContent?key=key"
+
+
+def test_pool_is_recreated_for_a_new_event_loop():
+    client = GeminiClient("key", "m", "http://llm.local", transport=httpx.MockTransport(_gemini_handler([])))
+
+    async def pool():
+        await client.generate("x")
+        return client._http
+
+    first = asyncio.run(pool())
+    assert asyncio.run(pool()) is not first
+
+
+def test_pool_of_a_running_loop_is_closed_on_that_loop():
+    client = GeminiClient("key", "m", "http://llm.local", transport=httpx.MockTransport(_gemini_handler([])))
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(client.generate("x"), other_loop).result(5)
+        old_pool = client._http
+
+        async def use_from_this_loop():
+            await client.generate("y")
+            await client.aclose()
+            # 旧连接池在其所属的循环中关闭
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(asyncio.sleep(0), other_loop))
+
+        asyncio.run(use_from_this_loop())
+        assert old_pool.is_closed
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join()
+        other_loop.close()
+
+
+def test_analyze_parses_markdown_wrapped_json():
+    class StubClient(llm_client.LLMClient):
+        async def generate(self, prompt):
+            return '```json\n{"name": "张三"}\n```'
+
+    assert asyncio.run(StubClient().analyze("简历")) == {"name": "张三"}
+
+
+def test_get_llm_client_returns_singleton(monkeypatch):
+    monkeypatch.setattr(llm_client, "_client", None)
+    monkeypatch.setattr(llm_client.settings, "LLM_API_BASE_URL", "http://llm.local")
+    client = get_llm_client()
+    assert get_llm_client() is client
+    # Gemini 客户端外面依次包了限流重试层、响应缓存层与统计层
+    assert isinstance(client, InstrumentedLLMClient)
+    assert isinstance(client.inner, CachedLLMClient)
+    assert isinstance(client.inner.inner.inner, GeminiClient)
+
+
+def test_generic_client_is_not_implemented():
+    with pytest.raises(NotImplementedError):
+        asyncio.run(llm_client.GenericLLMClient().generate("x"))
+
+
+def test_generate_stream_parses_sse_chunks():
+    chunks = ["{\"name\": ", "\"张三\"}"]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert ":streamGenerateContent" in request.url.path and request.url.params["alt"] == "sse"
+        body = "".join(
+            f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]}, ensure_ascii=False)}\r\n\r\n"
+            for text in chunks
+        )
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    client = GeminiClient("key", "m", "http://llm.local", transport=httpx.MockTransport(handler))
+
+    async def run():
+        received = [chunk async for chunk in client.analyze_stream("简历")]
+        await client.aclose()
+        return received
+
+    received = asyncio.run(run())
+    assert received == chunks
+    assert llm_client.parse_json_response("".join(received)) == {"name": "张三"}
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.crud import crud_llm_usage
+from app.db.base_class import Base
+from app.services.fake_llm import FakeLLMClient
+from app.services.llm_cache import CachedLLMClient, LLMResponseCache
+from app.services.llm_instrumentation import InstrumentedLLMClient
+from app.services.llm_metrics import UsageStats, track_llm_usage, usage_by_profile
+from app.services.llm_resilience import ResilientLLMClient
+
+
+def _instrumented(inner):
+    return InstrumentedLLMClient(ResilientLLMClient(inner, base_delay=0.001, max_delay=0.001))
+
+
+def test_records_tokens_sizes_retries_and_outcome(caplog):
+    # 第一次调用返回 429，重试后成功
+    client = _instrumented(FakeLLMClient(burst_every=2, burst_length=1))
+    fake = client.inner.inner
+    fake.calls = 1
+
+    async def run():
+        with track_llm_usage() as outer:
+            with track_llm_usage() as inner:
+                response = await client.generate("职位描述")
+        return response, outer, inner
+
+    with caplog.at_level(logging.INFO):
+        response, outer, inner = asyncio.run(run())
+
+    summary = inner.summary()
+    assert summary["calls"] == 1 and summary["succeeded"] == 1 and summary["retries"] == 1
+    assert summary["prompt_chars"] == len("职位描述") and summary["response_chars"] == len(response)
+    assert summary["prompt_tokens"] > 0 and summary["total_tokens"] == summary["prompt_tokens"] + summary["completion_tokens"]
+    assert sum(summary["latency_histogram"].values()) == 1
+    # 嵌套统计同时累计到外层
+    assert outer.calls == 1
+
+    record = next(json.loads(r.getMessage()) for r in caplog.records if '"llm_call"' in r.getMessage())
+    assert record["outcome"] == "ok" and record["retries"] == 1
+
+
+def test_failures_and_cache_hits_are_counted(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite3"))
+    cached = InstrumentedLLMClient(CachedLLMClient(FakeLLMClient(), cache, "fake", "fake"))
+    failing = _instrumented(FakeLLMClient(error_rate=1.0))
+    failing.inner.max_attempts = 1
+
+    async def run():
+        with track_llm_usage() as usage:
+            await cached.generate("a")
+            await cached.generate("a")
+            with pytest.raises(httpx.HTTPStatusError):
+                await failing.generate("b")
+        return usage
+
+    usage = asyncio.run(run())
+    assert (usage.calls, usage.succeeded, usage.failed, usage.cache_hits) == (3, 2, 1, 1)
+
+
+def test_stream_usage_is_recorded():
+    client = _instrumented(FakeLLMClient())
+
+    async def run():
+        with track_llm_usage() as usage:
+            text = "".join([chunk async for chunk in client.generate_stream("简历文本如下")])
+        return text, usage
+
+    text, usage = asyncio.run(run())
+    assert usage.calls == 1 and usage.response_chars == len(text) and usage.completion_tokens > 0
+
+
+def test_persisted_runs_merge_by_profile():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    usage = UsageStats()
+    usage.record({
+        "outcome": "ok", "cache_hit": False, "retries": 0, "prompt_chars": 10, "response_chars": 5,
+        "prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120, "latency": 0.3,
+    })
+    for run_id in ("task-1", "task-2"):
+        crud_llm_usage.create(db, run_id=run_id, purpose=crud_llm_usage.PURPOSE_MATCHING, usage=usage.to_record(), user_profile_id=7)
+    crud_llm_usage.create(db, run_id="task-3", purpose=crud_llm_usage.PURPOSE_MATCHING, usage=usage.to_record(), user_profile_id=8)
+
+    total = UsageStats.from_records(crud_llm_usage.iter_runs(db, user_profile_id=7))
+    assert total.calls == 2 and total.total_tokens == 240
+    assert total.latency_percentile(95) == 0.5
+    assert set(usage_by_profile(crud_llm_usage.iter_runs(db, profiles_only=True))) == {7, 8}
+    assert [r.run_id for r in crud_llm_usage.get_runs(db, user_profile_id=7)] == ["task-2", "task-1"]
+
+
+def test_usage_endpoint_reports_recorded_runs(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.db.session import get_db
+    from app.main import app
+    from app.services import llm_client
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    db = session_factory()
+    usage = UsageStats()
+    usage.record({
+        "outcome": "error", "cache_hit": False, "retries": 2, "prompt_chars": 10, "response_chars": 0,
+        "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "latency": 1.5,
+    })
+    crud_llm_usage.create(db, run_id="task-1", purpose=crud_llm_usage.PURPOSE_MATCHING, usage=usage.to_record(), user_profile_id=3)
+
+    def override_get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.setattr(llm_client, "_client", InstrumentedLLMClient(FakeLLMClient()))
+    client = TestClient(app)
+
+    report = client.get("/api/v1/llm/usage").json()
+    assert report["recorded"]["failed"] == 1 and report["recorded"]["retries"] == 2
+    assert report["by_profile"][0]["user_profile_id"] == 3
+    assert report["cache"] is None and report["router"] is None
+
+    runs = client.get("/api/v1/llm/usage/runs", params={"profile_id": 3}).json()
+    assert [run["run_id"] for run in runs] == ["task-1"]
+    assert client.get("/api/v1/profiles/3/llm-usage").json()["calls"] == 1
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.services.llm_client import GeminiClient
+from app.services.llm_resilience import (
+    AIMDLimiter, CircuitBreaker, CircuitOpenError, ResilientLLMClient, TokenBucket,
+    backoff_delay, parse_retry_after,
+)
+
+
+@pytest.fixture
+def fake_gemini():
+    """本地的假 Gemini 服务：按脚本依次返回状态码，脚本用完后返回 200。"""
+    state = {"script": [], "requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            state["requests"] += 1
+            status, headers = state["script"].pop(0) if state["script"] else (200, {})
+            if status == 200:
+                text = body["contents"][0]["parts"][0]["text"]
+                payload = json.dumps({"candidates": [{"content": {"parts": [{"text": f"ok:{text}"}]}}]}).encode()
+            else:
+                payload = b'{"error": {}}'
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def _client(fake_gemini, **kwargs):
+    inner = GeminiClient("key", "gemini-test", fake_gemini["url"], max_concurrency=4)
+    kwargs.setdefault("base_delay", 0.01)
+    return ResilientLLMClient(inner, **kwargs)
+
+
+async def _generate(client, prompt):
+    try:
+        return await client.generate(prompt)
+    finally:
+        await client.aclose()
+
+
+def test_retries_throttling_and_server_errors(fake_gemini):
+    fake_gemini["script"] = [(429, {"Retry-After": "0"}), (503, {})]
+    client = _client(fake_gemini)
+
+    assert asyncio.run(_generate(client, "hi")) == "ok:hi"
+    assert fake_gemini["requests"] == 3
+    assert client.stats["retries"] == 2
+    assert client.stats["throttled"] == 2
+    # 限流后并发上限减半
+    assert client.limiter.limit < 4
+
+
+def test_client_errors_are_not_retried(fake_gemini):
+    fake_gemini["script"] = [(400, {})]
+    client = _client(fake_gemini)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_generate(client, "hi"))
+    assert fake_gemini["requests"] == 1
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_breaker_fails_fast_while_provider_is_down(fake_gemini):
+    fake_gemini["script"] = [(500, {})] * 3
+    client = _client(fake_gemini, max_attempts=5, failure_threshold=3, recovery_seconds=60)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_generate(client, "hi"))
+    assert fake_gemini["requests"] == 3
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(_generate(client, "again"))
+    assert fake_gemini["requests"] == 3
+    assert client.stats["circuit_rejections"] == 1
+
+
+def test_circuit_breaker_half_open_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=10, clock=lambda: now[0])
+    breaker.record_failure()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    now[0] = 11
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 探测期间只放行一个请求
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 22
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_errors_do_not_reset_consecutive_failures():
+    request = httpx.Request("POST", "http://llm.local")
+
+    def error(status):
+        return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+    client = ResilientLLMClient(GeminiClient("key", "m", "http://llm.local"), max_attempts=1, failure_threshold=2)
+    for status in (500, 400, 500):
+        client._on_error(error(status), attempt=1)
+    # 中间的 4xx 不会清零连续失败计数
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+def test_cancelled_half_open_probe_releases_the_breaker():
+    from app.services.llm_client import LLMClient
+
+    class HangingClient(LLMClient):
+        async def generate(self, prompt):
+            await asyncio.sleep(10)
+
+    client = ResilientLLMClient(HangingClient(), failure_threshold=1, recovery_seconds=0)
+    client.breaker.record_failure()
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    async def run():
+        probe = asyncio.create_task(client.generate("p"))
+        await asyncio.sleep(0.01)
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(run())
+    # 被取消的探测不会让熔断器一直停在半开状态，下一个请求可以重新探测
+    assert client.breaker.state == CircuitBreaker.OPEN
+    client.breaker.before_call()
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_backoff_honours_retry_after_and_cap():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("soon") is None
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, 1.0, 5.0) <= 5.0
+    assert backoff_delay(0, 1.0, 60.0, retry_after=7) >= 7
+    assert backoff_delay(0, 1.0, 5.0, retry_after=100) <= 5.0
+
+
+def test_token_bucket_spaces_out_requests():
+    bucket = TokenBucket(rate_per_minute=1200, capacity=1)
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 第一个令牌立即可用，之后每 50ms 补充一个
+    assert asyncio.run(run()) >= 0.09
+    assert not TokenBucket(0).enabled
+
+
+def test_aimd_limiter_caps_in_flight_requests():
+    limiter = AIMDLimiter(initial=4, minimum=1)
+    limiter.on_throttle()
+    assert int(limiter.limit) == 2
+    peak = [0]
+
+    async def call():
+        async with limiter:
+            peak[0] = max(peak[0], limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(run())
+    assert peak[0] == 2
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.limit == 4
+
+
+def test_stream_retries_only_before_first_chunk():
+    from app.services.llm_client import LLMClient
+
+    class FlakyStream(LLMClient):
+        def __init__(self, fail_after_first_chunk):
+            self.calls = 0
+            self.fail_after_first_chunk = fail_after_first_chunk
+
+        async def generate(self, prompt):
+            raise NotImplementedError
+
+        async def generate_stream(self, prompt):
+            self.calls += 1
+            request = httpx.Request("POST", "http://llm.local")
+            if self.calls == 1 and not self.fail_after_first_chunk:
+                raise httpx.HTTPStatusError("busy", request=request, response=httpx.Response(503, request=request))
+            yield "a"
+            if self.fail_after_first_chunk:
+                raise httpx.ReadError("connection reset", request=request)
+            yield "b"
+
+    async def collect(client):
+        return [chunk async for chunk in client.generate_stream("p")]
+
+    inner = FlakyStream(fail_after_first_chunk=False)
+    assert asyncio.run(collect(ResilientLLMClient(inner, base_delay=0.01))) == ["a", "b"]
+    assert inner.calls == 2
+
+    # 已经输出片段后出错不会重试，否则调用方会收到重复内容
+    inner = FlakyStream(fail_after_first_chunk=True)
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(collect(ResilientLLMClient(inner, base_delay=0.01)))
+    assert inner.calls == 1
@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.services import llm_client
+from app.services.fake_llm import FakeLLMClient
+from app.services.llm_resilience import CircuitBreaker, ResilientLLMClient
+from app.services.llm_router import Backend, RoutingLLMClient
+
+
+def _resilient(inner, **kwargs):
+    return ResilientLLMClient(inner, max_attempts=1, base_delay=0.01, **kwargs)
+
+
+def test_router_fails_over_to_healthy_backend():
+    broken = FakeLLMClient(error_rate=1.0, seed=1)
+    healthy = FakeLLMClient(seed=2)
+    router = RoutingLLMClient(
+        [Backend("broken", _resilient(broken), weight=1000), Backend("healthy", _resilient(healthy))], seed=0
+    )
+
+    assert asyncio.run(router.generate("hi"))
+    assert broken.calls == 1 and healthy.calls == 1
+    assert router.stats["failovers"] == 1
+    assert router.backends[0].errors == 1
+
+
+def test_router_raises_when_all_backends_fail():
+    router = RoutingLLMClient([Backend("a", _resilient(FakeLLMClient(error_rate=1.0)))])
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(router.generate("hi"))
+
+
+def test_unavailable_backend_is_ranked_last():
+    tripped = _resilient(FakeLLMClient(), failure_threshold=1)
+    tripped.breaker.record_failure()
+    assert tripped.breaker.state == CircuitBreaker.OPEN
+
+    router = RoutingLLMClient([Backend("tripped", tripped, weight=1000), Backend("ok", _resilient(FakeLLMClient()))])
+    assert [b.name for b in router.ranked_backends()] == ["ok", "tripped"]
+
+
+def test_hedged_request_uses_faster_backend():
+    slow = Backend("slow", _resilient(FakeLLMClient(latency_ms=500, latency_sigma=0)), weight=1000)
+    fast = Backend("fast", _resilient(FakeLLMClient(latency_ms=0)), weight=0.001)
+    # 历史样本显示 slow 的 p95 只有 20ms，本次调用超过后应向 fast 发送对冲请求
+    for _ in range(20):
+        slow.record(0.02, ok=True)
+    router = RoutingLLMClient([slow, fast], hedge=True, hedge_min_samples=20, seed=0)
+
+    async def run():
+        started = asyncio.get_running_loop().time()
+        await router.generate("hi")
+        return asyncio.get_running_loop().time() - started
+
+    assert asyncio.run(run()) < 0.4
+    assert router.stats["hedges"] == 1 and router.stats["hedge_wins"] == 1
+
+
+def test_stream_fails_over_before_first_chunk():
+    broken = FakeLLMClient(error_rate=1.0)
+    router = RoutingLLMClient(
+        [Backend("broken", _resilient(broken), weight=1000), Backend("ok", _resilient(FakeLLMClient()))], seed=0
+    )
+
+    async def collect():
+        return "".join([chunk async for chunk in router.generate_stream("hi")])
+
+    assert asyncio.run(collect()) == FakeLLMClient().respond("hi")
+    assert router.stats["failovers"] == 1
+
+
+def test_factory_builds_router_from_backends_setting(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BACKENDS", '[{"name": "a", "provider": "fake", "weight": 2}, {"name": "b", "provider": "fake"}]')
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", False)
+
+    client = llm_client._create_llm_client().inner
+    assert isinstance(client, RoutingLLMClient)
+    assert [(b.name, b.weight) for b in client.backends] == [("a", 2.0), ("b", 1.0)]
+    assert all(b.client.max_attempts == 1 for b in client.backends)
+
+
+def test_cache_key_is_built_from_the_backends(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "LLM_BACKENDS", '[{"provider": "fake", "model": "m2"}, {"provider": "fake", "model": "m1"}]')
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_CACHE_PATH", str(tmp_path / "cache.db"))
+
+    cached = llm_client._create_llm_client().inner
+    # 缓存键使用路由的各个后端模型，而不是未被使用的 LLM_PROVIDER / LLM_MODEL_NAME
+    assert (cached.provider, cached.model) == ("router", "fake:m1,fake:m2")
+    assert isinstance(cached.inner, RoutingLLMClient)
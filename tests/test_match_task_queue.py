@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import worker
+from app.crud import crud_match_task
+from app.db.base_class import Base
+from app.models import MatchTask
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def test_lease_is_exclusive_until_expired(session_factory):
+    db = session_factory()
+    task = crud_match_task.enqueue(db, task_type="profile", payload={"profile_id": 1})
+
+    leased = crud_match_task.lease(db, worker_id="w1", lease_seconds=60)
+    assert leased.id == task.id and leased.status == "running" and leased.attempts == 1
+    assert crud_match_task.lease(session_factory(), worker_id="w2", lease_seconds=60) is None
+
+    # 模拟 w1 崩溃：租约过期后任务被 w2 接管
+    db.query(MatchTask).update({"leased_until": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    taken_over = crud_match_task.lease(session_factory(), worker_id="w2", lease_seconds=60)
+    assert taken_over.id == task.id and taken_over.lease_owner == "w2" and taken_over.attempts == 2
+
+    # 原 worker 已失去租约，不能再完成任务
+    assert crud_match_task.complete(db, task_id=task.id, worker_id="w1") is False
+    assert crud_match_task.complete(db, task_id=task.id, worker_id="w2", result={"cache_hits": 1}) is True
+
+
+def test_failed_task_is_retried_then_marked_failed(session_factory):
+    db = session_factory()
+    task = crud_match_task.enqueue(db, task_type="profile", payload={"profile_id": 1}, max_attempts=2)
+
+    crud_match_task.lease(db, worker_id="w1", lease_seconds=60)
+    assert crud_match_task.fail(db, task_id=task.id, worker_id="w1", error="boom", retry_delay_seconds=0) == "pending"
+
+    crud_match_task.lease(db, worker_id="w1", lease_seconds=60)
+    assert crud_match_task.fail(db, task_id=task.id, worker_id="w1", error="boom", retry_delay_seconds=0) == "failed"
+    assert crud_match_task.lease(db, worker_id="w1", lease_seconds=60) is None
+    assert crud_match_task.get(db, id=task.id).last_error == "boom"
+
+
+def test_retry_waits_for_backoff(session_factory):
+    db = session_factory()
+    task = crud_match_task.enqueue(db, task_type="profile", payload={"profile_id": 1})
+    crud_match_task.lease(db, worker_id="w1", lease_seconds=60)
+    crud_match_task.fail(db, task_id=task.id, worker_id="w1", error="boom", retry_delay_seconds=600)
+    assert crud_match_task.lease(db, worker_id="w1", lease_seconds=60) is None
+
+
+def test_worker_process_one_runs_and_completes_task(session_factory):
+    db = session_factory()
+    task = crud_match_task.enqueue(db, task_type="profile", payload={"profile_id": 5, "top_k": 20})
+
+    with patch.object(worker, "SessionLocal", session_factory), \
+            patch.object(worker, "MatchingService") as service_cls:
+        service_cls.return_value.arun_matching_for_profile = AsyncMock(return_value={"cache_hits": 0, "cache_misses": 3})
+        service_cls.return_value.llm_usage.summary.return_value = {"calls": 3}
+        assert worker.process_one("w1") is True
+        assert worker.process_one("w1") is False
+
+    service_cls.return_value.arun_matching_for_profile.assert_awaited_once_with(5, top_k=20, batch_size=None)
+    done = crud_match_task.get(session_factory(), id=task.id)
+    assert done.status == "success"
+    assert done.result == {"cache_hits": 0, "cache_misses": 3, "llm_usage": {"calls": 3}}
+    assert service_cls.call_args.kwargs["run_id"] == f"task-{task.id}"
+
+
+def test_worker_process_one_requeues_failed_task(session_factory):
+    db = session_factory()
+    task = crud_match_task.enqueue(db, task_type="incremental", payload={"delta": {}})
+
+    with patch.object(worker, "SessionLocal", session_factory), \
+            patch.object(worker, "MatchingService") as service_cls:
+        service_cls.return_value.arun_incremental_matching = AsyncMock(side_effect=RuntimeError("db down"))
+        assert worker.process_one("w1") is True
+
+    failed = crud_match_task.get(session_factory(), id=task.id)
+    assert failed.status == "pending"
+    assert failed.last_error == "db down"
+    assert failed.available_at > datetime.utcnow()
+
+
+def test_expired_lease_on_last_attempt_is_failed_not_released(session_factory):
+    db = session_factory()
+    task = crud_match_task.enqueue(db, task_type="profile", payload={"profile_id": 1}, max_attempts=2)
+
+    for _ in range(2):
+        # 每次执行都让 worker 崩溃：租约过期后没有调用 fail
+        assert crud_match_task.lease(db, worker_id="w1", lease_seconds=60).id == task.id
+        db.query(MatchTask).update({"leased_until": datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+
+    assert crud_match_task.lease(session_factory(), worker_id="w2", lease_seconds=60) is None
+    failed = crud_match_task.get(session_factory(), id=task.id)
+    assert failed.status == "failed" and failed.attempts == 2 and failed.leased_until is None
+    assert "Lease expired" in failed.last_error
@@ -0,0 +1,52 @@
+from unittest.mock import MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.db.session import get_db
+from app.models import UserProfile
+
+
+class FakeMatchingService:
+    def __init__(self, db, on_event=None, offload_blocking=False):
+        assert offload_blocking
+        self.on_event = on_event
+        self.progress = {"done": 1, "total": 1, "failed": 0, "cached": 0}
+
+    async def arun_matching_for_profile(self, profile_id, top_k=None):
+        self.on_event("progress", {"done": 0, "total": 1, "failed": 0, "cached": 0, "eta_seconds": None})
+        self.on_event("match", {"job_id": 7, "match_score": 8.0, "match_summary": "匹配"})
+        return {"cache_hits": 0, "cache_misses": 1}
+
+
+@patch('app.api.v1.endpoints.matching.SessionLocal')
+@patch('app.api.v1.endpoints.matching.MatchingService', FakeMatchingService)
+@patch('app.crud.crud_user_profile.get')
+def test_stream_matching_sends_sse_events(crud_profile_get_mock, session_local_mock):
+    crud_profile_get_mock.return_value = UserProfile(id=1, structured_profile={})
+    app.dependency_overrides[get_db] = lambda: MagicMock()
+    try:
+        client = TestClient(app)
+        with client.stream("GET", "/api/v1/profiles/1/match/stream") as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            body = "".join(response.iter_text())
+    finally:
+        app.dependency_overrides = {}
+
+    events = [block.split("\n")[0] for block in body.strip().split("\n\n")]
+    assert events == ["event: progress", "event: match", "event: done"]
+    assert '"match_summary": "匹配"' in body
+    session_local_mock.return_value.close.assert_called_once()
+    session_local_mock.assert_called_once_with(expire_on_commit=False)
+
+
+@patch('app.crud.crud_user_profile.get')
+def test_stream_matching_unknown_profile(crud_profile_get_mock):
+    crud_profile_get_mock.return_value = None
+    app.dependency_overrides[get_db] = lambda: MagicMock()
+    try:
+        response = TestClient(app).get("/api/v1/profiles/99/match/stream")
+    finally:
+        app.dependency_overrides = {}
+    assert response.status_code == 404
@@ -1,8 +1,15 @@
+import asyncio
+import json
+import time
 import pytest
-from unittest.mock import MagicMock, patch
-from app.services.matching_service import MatchingService
-from app.models import UserProfile, Job
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.services.matching_service import MatchingService, job_fingerprint, profile_fingerprint
+from app.models import UserProfile, Job, JobMatch
 from app.schemas.job_match import JobMatchCreate
+from app.core.config import settings
+
+def saved_matches(bulk_upsert_mock):
+    return [m for c in bulk_upsert_mock.call_args_list for m in c[1]['objs_in']]
 
 @pytest.fixture
 def db_session_mock():
@@ -12,15 +19,15 @@ def db_session_mock():
 def matching_service(db_session_mock):
     return MatchingService(db_session_mock)
 
-@patch('app.crud.crud_job_match.create')
+@patch('app.crud.crud_job_match.bulk_upsert')
 @patch('app.services.matching_service.get_llm_client')
-@patch('app.crud.crud_job.get_multi')
+@patch('app.crud.crud_job.get_all')
 @patch('app.crud.crud_user_profile.get')
 def test_run_matching_for_profile(
     crud_profile_get_mock,
-    crud_job_get_multi_mock,
+    crud_job_get_all_mock,
     llm_client_mock,
-    crud_job_match_create_mock,
+    bulk_upsert_mock,
     matching_service,
     db_session_mock
 ):
@@ -33,9 +40,11 @@ def test_run_matching_for_profile(
     ]
     
     crud_profile_get_mock.return_value = mock_profile
-    crud_job_get_multi_mock.return_value = {"items": mock_jobs, "total": len(mock_jobs)} # crud_job.get_multi 返回一个字典
+    crud_job_get_all_mock.return_value = mock_jobs
     
     mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 2
+    mock_llm_instance.generate = AsyncMock()
     llm_client_mock.return_value = mock_llm_instance
     
     # 模拟LLM的返回值
@@ -46,22 +55,469 @@ def test_run_matching_for_profile(
     mock_llm_instance.generate.side_effect = llm_responses
 
     # Act
-    matching_service.run_matching_for_profile(profile_id)
+    matching_service.run_matching_for_profile(profile_id, top_k=0)
 
     # Assert
     crud_profile_get_mock.assert_called_once_with(db_session_mock, id=profile_id)
-    crud_job_get_multi_mock.assert_called_once_with(db_session_mock)
+    crud_job_get_all_mock.assert_called_once_with(db_session_mock, is_active=True)
     
     # 验证LLM被调用了两次 (每个job一次)
     assert mock_llm_instance.generate.call_count == 2
     
-    # 验证保存方法被调用了两次
-    assert crud_job_match_create_mock.call_count == 2
+    # 验证两个结果在同一批中写入
+    assert bulk_upsert_mock.call_count == 1
+    assert len(saved_matches(bulk_upsert_mock)) == 2
 
-    # 验证第一次保存的数据是否正确
-    first_call_args = crud_job_match_create_mock.call_args_list[0][1]['obj_in']
+    # 验证第一次保存的数据是否正确（结果按完成顺序保存，这里按 job_id 查找）
+    saved = {m.job_id: m for m in saved_matches(bulk_upsert_mock)}
+    first_call_args = saved[101]
     assert isinstance(first_call_args, JobMatchCreate)
     assert first_call_args.user_profile_id == profile_id
     assert first_call_args.job_id == 101
     assert first_call_args.match_score == 9
     assert first_call_args.match_summary == "Excellent match."
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_run_matching_respects_concurrency_limit(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    mock_jobs = [Job(id=i, title=f'Job {i}', description='...') for i in range(12)]
+    crud_profile_get_mock.return_value = UserProfile(id=1, structured_profile={'skills': ['Python']})
+    crud_job_get_all_mock.return_value = mock_jobs
+
+    in_flight = 0
+    peak = 0
+
+    async def slow_generate(prompt):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return '{"score": 5, "summary": "ok"}'
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 3
+    mock_llm_instance.generate = slow_generate
+    llm_client_mock.return_value = mock_llm_instance
+
+    started = time.monotonic()
+    MatchingService(db_session_mock).run_matching_for_profile(1, top_k=0)
+    elapsed = time.monotonic() - started
+
+    assert peak == 3
+    assert len(saved_matches(bulk_upsert_mock)) == 12
+    # 12 个职位 / 并发 3 => 约 4 轮 LLM 延迟，而不是 12 轮
+    assert elapsed < 12 * 0.05
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.crud.crud_job_match.get_cached')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_run_matching_reuses_cached_matches(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    get_cached_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    profile = UserProfile(id=1, structured_profile={'skills': ['Python']})
+    unchanged_job = Job(id=101, title='Python Developer', description='...')
+    changed_job = Job(id=102, title='Frontend Engineer', description='...')
+    crud_profile_get_mock.return_value = profile
+    crud_job_get_all_mock.return_value = [unchanged_job, changed_job]
+
+    cached_match = JobMatch(user_profile_id=1, job_id=101, match_score=8, match_summary="cached")
+    get_cached_mock.return_value = {job_fingerprint(unchanged_job): cached_match}
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 2
+    mock_llm_instance.generate = AsyncMock(return_value='{"score": 4, "summary": "fresh"}')
+    llm_client_mock.return_value = mock_llm_instance
+
+    stats = MatchingService(db_session_mock).run_matching_for_profile(1, top_k=0)
+
+    # 只有内容发生变化的职位才会调用 LLM
+    assert mock_llm_instance.generate.call_count == 1
+    assert stats == {"cache_hits": 1, "cache_misses": 1, "failed": 0}
+    assert get_cached_mock.call_args[1]['profile_fingerprint'] == profile_fingerprint(profile.structured_profile)
+
+    saved = saved_matches(bulk_upsert_mock)[0]
+    assert saved.job_id == 102
+    assert saved.job_fingerprint == job_fingerprint(changed_job)
+
+
+def test_fingerprints_ignore_key_order_and_track_prompt_fields():
+    assert profile_fingerprint({'a': 1, 'b': [1, 2]}) == profile_fingerprint({'b': [1, 2], 'a': 1})
+    job = Job(id=1, title='Dev', job_requirements='Python')
+    before = job_fingerprint(job)
+    job.location = '青岛'
+    assert job_fingerprint(job) == before
+    job.job_requirements = 'Python, Go'
+    assert job_fingerprint(job) != before
+
+
+def test_fingerprints_change_with_prompt_budgets():
+    job = Job(id=1, title='Dev', job_requirements='Python')
+    profile = {'skills': ['Python']}
+    job_before, profile_before = job_fingerprint(job), profile_fingerprint(profile)
+    # 预算变化后提示词被截断的方式不同，缓存的匹配结果不再命中
+    with patch.object(settings, 'PROMPT_JOB_REQUIREMENTS_TOKEN_BUDGET', 100):
+        assert job_fingerprint(job) != job_before
+        assert profile_fingerprint(profile) == profile_before
+    with patch.object(settings, 'PROMPT_PROFILE_TOKEN_BUDGET', 100):
+        assert profile_fingerprint(profile) != profile_before
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_run_matching_prerank_shortlists_top_k(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    crud_profile_get_mock.return_value = UserProfile(
+        id=1, structured_profile={'name': '张三', 'skills': ['Python', 'FastAPI', '数据分析']}
+    )
+    crud_job_get_all_mock.return_value = [
+        Job(id=1, title='Python 后端开发', job_requirements='熟悉 Python、FastAPI', description='研发'),
+        Job(id=2, title='数据分析师', job_requirements='数据分析，SQL', description='数据'),
+        Job(id=3, title='销售经理', job_requirements='客户开发', description='销售'),
+        Job(id=4, title='前端工程师', job_requirements='React', description='研发'),
+    ]
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 2
+    mock_llm_instance.generate = AsyncMock(return_value='{"score": 6, "summary": "ok"}')
+    llm_client_mock.return_value = mock_llm_instance
+
+    MatchingService(db_session_mock).run_matching_for_profile(1, top_k=2)
+
+    scored_job_ids = {m.job_id for m in saved_matches(bulk_upsert_mock)}
+    assert scored_job_ids == {1, 2}
+    assert mock_llm_instance.generate.call_count == 2
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_run_matching_batch_mode_retries_missing_jobs_individually(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    crud_profile_get_mock.return_value = UserProfile(id=1, structured_profile={'skills': ['Python']})
+    crud_job_get_all_mock.return_value = [Job(id=i, title=f'Job {i}', description='...') for i in range(1, 6)]
+
+    prompts = []
+
+    async def fake_generate(prompt):
+        prompts.append(prompt)
+        if 'JSON array' in prompt:
+            ids = [int(line.split('"job_id":')[1].split(',')[0]) for line in prompt.splitlines() if '"job_id":' in line and 'title' in line]
+            # 模拟部分失败：批次中的最后一个职位缺失
+            return json.dumps([{"job_id": i, "score": 7, "summary": "批量"} for i in ids[:-1]])
+        return '{"score": 5, "summary": "单独"}'
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 2
+    mock_llm_instance.generate = fake_generate
+    llm_client_mock.return_value = mock_llm_instance
+
+    MatchingService(db_session_mock).run_matching_for_profile(1, top_k=0, batch_size=3)
+
+    saved = {m.job_id: m for m in saved_matches(bulk_upsert_mock)}
+    assert set(saved) == {1, 2, 3, 4, 5}
+    # 两个批次 (3 + 2)，每个批次缺失的一个职位各重试一次
+    assert len(prompts) == 4
+    assert saved[3].match_summary == "单独"
+    assert saved[5].match_summary == "单独"
+    assert saved[1].match_summary == "批量"
+
+
+def test_parse_batch_response_validates_entries(matching_service):
+    jobs = [Job(id=1, title='A'), Job(id=2, title='B'), Job(id=3, title='C')]
+    response = json.dumps([
+        {"job_id": 1, "score": 8, "summary": "好", "improvement_suggestions": ["学习 Go", "考证"]},
+        {"job_id": 2, "score": 42, "summary": "超出范围"},
+        {"job_id": 99, "score": 5, "summary": "未知职位"},
+        {"score": 5, "summary": "缺少 job_id"},
+    ])
+    results = matching_service._parse_batch_response(response, jobs)
+    assert set(results) == {1}
+    assert results[1][2] == "- 学习 Go\n- 考证"
+    assert matching_service._parse_batch_response("not json", jobs) == {}
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.crud.crud_job_match.mark_stale')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_incremental_matching_scores_only_changed_jobs(
+    crud_profile_get_mock,
+    crud_profile_get_all_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    mark_stale_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    profiles = [
+        UserProfile(id=1, structured_profile={'skills': ['Python']}),
+        UserProfile(id=2, structured_profile={'skills': ['Java']}),
+    ]
+    crud_profile_get_all_mock.return_value = profiles
+    crud_profile_get_mock.side_effect = lambda db, id: next(p for p in profiles if p.id == id)
+    crud_job_get_all_mock.return_value = [Job(id=i, title=f'Job {i}', description='...') for i in range(1, 31)]
+    mark_stale_mock.return_value = 2
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 4
+    mock_llm_instance.generate = AsyncMock(return_value='{"score": 6, "summary": "ok"}')
+    llm_client_mock.return_value = mock_llm_instance
+
+    delta = {"site_name": "haier", "new_job_ids": [3], "updated_job_ids": [7], "deactivated_job_ids": [40, 41]}
+    with patch.object(settings, 'MATCHING_PRERANK_TOP_K', 0):
+        asyncio.run(MatchingService(db_session_mock).arun_incremental_matching(delta))
+
+    mark_stale_mock.assert_called_once_with(db_session_mock, job_ids=[40, 41])
+    # 2 个变化的职位 × 2 个画像
+    assert mock_llm_instance.generate.call_count == 4
+    saved_pairs = {(m.user_profile_id, m.job_id) for m in saved_matches(bulk_upsert_mock)}
+    assert saved_pairs == {(1, 3), (1, 7), (2, 3), (2, 7)}
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.crud.crud_job_match.mark_stale')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_incremental_matching_marks_changed_jobs_outside_shortlist_stale(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    mark_stale_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    crud_profile_get_mock.return_value = UserProfile(id=1, structured_profile={'skills': ['Python', 'FastAPI']})
+    crud_job_get_all_mock.return_value = [
+        Job(id=1, title='Python 后端开发', job_requirements='熟悉 Python、FastAPI', description='研发'),
+        Job(id=2, title='销售经理', job_requirements='客户开发', description='销售'),
+        Job(id=3, title='前端工程师', job_requirements='React', description='研发'),
+    ]
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 2
+    mock_llm_instance.generate = AsyncMock(return_value='{"score": 6, "summary": "ok"}')
+    llm_client_mock.return_value = mock_llm_instance
+
+    asyncio.run(MatchingService(db_session_mock).arun_matching_for_profile(1, top_k=1, only_job_ids=[1, 2]))
+
+    # 职位 2 更新后不在 top_k 内，不重新打分，但旧结果被标记为过期
+    assert {m.job_id for m in saved_matches(bulk_upsert_mock)} == {1}
+    mark_stale_mock.assert_called_once_with(db_session_mock, job_ids=[2], profile_id=1)
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_run_matching_flushes_results_in_batches(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    crud_profile_get_mock.return_value = UserProfile(id=1, structured_profile={'skills': ['Python']})
+    crud_job_get_all_mock.return_value = [Job(id=i, title=f'Job {i}', description='...') for i in range(1, 8)]
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 4
+    mock_llm_instance.generate = AsyncMock(return_value='{"score": 6, "summary": "ok", "improvement_suggestions": "学习 Go"}')
+    llm_client_mock.return_value = mock_llm_instance
+
+    with patch.object(settings, 'MATCHING_WRITE_BATCH_SIZE', 3):
+        MatchingService(db_session_mock).run_matching_for_profile(1, top_k=0)
+
+    # 7 条结果，每批 3 条 => 3 + 3 + 1
+    assert [len(c[1]['objs_in']) for c in bulk_upsert_mock.call_args_list] == [3, 3, 1]
+    assert all(m.improvement_suggestions == "学习 Go" for m in saved_matches(bulk_upsert_mock))
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.crud.crud_job_match.get_cached')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_run_matching_emits_match_and_progress_events(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    get_cached_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    jobs = [Job(id=i, title=f'Job {i}', description='...') for i in range(1, 4)]
+    crud_profile_get_mock.return_value = UserProfile(id=1, structured_profile={'skills': ['Python']})
+    crud_job_get_all_mock.return_value = jobs
+    get_cached_mock.return_value = {
+        job_fingerprint(jobs[0]): JobMatch(user_profile_id=1, job_id=1, match_score=8, match_summary="cached")
+    }
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 2
+    mock_llm_instance.generate = AsyncMock(side_effect=['{"score": 6, "summary": "ok"}', Exception("boom")])
+    llm_client_mock.return_value = mock_llm_instance
+
+    events = []
+    service = MatchingService(db_session_mock, on_event=lambda event, data: events.append((event, data)))
+    service.run_matching_for_profile(1, top_k=0)
+
+    matches = [data for event, data in events if event == "match"]
+    assert {m["job_id"] for m in matches} == {1, 2}
+    assert [m["cached"] for m in matches if m["job_id"] == 1] == [True]
+
+    progress = [data for event, data in events if event == "progress"]
+    assert progress[0] == {"done": 0, "total": 3, "failed": 0, "cached": 0, "eta_seconds": None}
+    assert progress[-1]["done"] == 2
+    assert progress[-1]["failed"] == 1
+    assert progress[-1]["eta_seconds"] == 0.0
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.crud.crud_job_match.get_cached')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_unparseable_response_is_not_saved(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    get_cached_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    jobs = [Job(id=i, title=f'Job {i}', description='...') for i in range(1, 3)]
+    crud_profile_get_mock.return_value = UserProfile(id=1, structured_profile={'skills': ['Python']})
+    crud_job_get_all_mock.return_value = jobs
+    get_cached_mock.return_value = {}
+
+    responses = {1: '{"score": 7, "summary": "ok"}', 2: 'Sorry, I cannot help with that.'}
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 1
+
+    async def generate(prompt):
+        return responses[1] if 'Job 1' in prompt else responses[2]
+
+    mock_llm_instance.generate = generate
+    llm_client_mock.return_value = mock_llm_instance
+
+    events = []
+    service = MatchingService(db_session_mock, on_event=lambda event, data: events.append((event, data)))
+    stats = service.run_matching_for_profile(1, top_k=0)
+
+    # 解析失败的职位不写入缓存，下次运行会重新打分
+    assert [m.job_id for m in saved_matches(bulk_upsert_mock)] == [1]
+    assert stats["failed"] == 1
+    assert [data for event, data in events if event == "progress"][-1]["failed"] == 1
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_run_matching_aborts_when_circuit_is_open(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    from app.services.llm_resilience import CircuitOpenError
+
+    crud_profile_get_mock.return_value = UserProfile(id=1, structured_profile={'skills': ['Python']})
+    crud_job_get_all_mock.return_value = [Job(id=i, title=f'Job {i}', description='...') for i in range(1, 4)]
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 1
+    async def generate(prompt):
+        if 'Job 2' in prompt:
+            await asyncio.sleep(0.05)
+            raise CircuitOpenError("down")
+        return '{"score": 7, "summary": "ok"}'
+    mock_llm_instance.generate = AsyncMock(side_effect=generate)
+    llm_client_mock.return_value = mock_llm_instance
+
+    # 熔断时整个运行失败（由任务队列稍后重试），已完成的结果仍会写入
+    with pytest.raises(CircuitOpenError):
+        MatchingService(db_session_mock).run_matching_for_profile(1, top_k=0)
+    saved_job_ids = {m.job_id for m in saved_matches(bulk_upsert_mock)}
+    assert 1 in saved_job_ids and 2 not in saved_job_ids
+
+
+@patch('app.crud.crud_job_match.bulk_upsert')
+@patch('app.crud.crud_job_match.get_cached')
+@patch('app.services.matching_service.get_llm_client')
+@patch('app.crud.crud_job.get_all')
+@patch('app.crud.crud_user_profile.get')
+def test_offload_blocking_runs_db_work_off_the_event_loop(
+    crud_profile_get_mock,
+    crud_job_get_all_mock,
+    llm_client_mock,
+    get_cached_mock,
+    bulk_upsert_mock,
+    db_session_mock
+):
+    import threading
+
+    threads = {}
+
+    def record(name, value):
+        def side_effect(*args, **kwargs):
+            threads[name] = threading.get_ident()
+            return value
+        return side_effect
+
+    crud_profile_get_mock.side_effect = record("profile", UserProfile(id=1, structured_profile={'skills': ['Python']}))
+    crud_job_get_all_mock.side_effect = record("jobs", [Job(id=1, title='Python Developer', description='...')])
+    get_cached_mock.return_value = {}
+    bulk_upsert_mock.side_effect = record("write", 1)
+
+    mock_llm_instance = MagicMock()
+    mock_llm_instance.max_concurrency = 1
+
+    async def generate(prompt):
+        threads["llm"] = threading.get_ident()
+        return '{"score": 6, "summary": "ok"}'
+
+    mock_llm_instance.generate = generate
+    llm_client_mock.return_value = mock_llm_instance
+
+    MatchingService(db_session_mock, offload_blocking=True).run_matching_for_profile(1, top_k=0)
+
+    # LLM 调用在事件循环所在线程，数据库读写在其他线程
+    loop_thread = threading.get_ident()
+    assert threads["llm"] == loop_thread
+    assert loop_thread not in (threads["profile"], threads["jobs"], threads["write"])
@@ -1,4 +1,5 @@
 import io
+import json
 from fastapi.testclient import TestClient
 from unittest.mock import AsyncMock
 import pytest
@@ -57,15 +58,18 @@ def mock_llm_client():
 def override_get_db(mocker):
     # This is a simplified in-memory SQLite setup for testing
     from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
     from app.db.base_class import Base
 
-    engine = create_engine("sqlite:///:memory:")
+    # 所有请求共享同一个内存数据库连接，并允许在线程池中访问
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
     Base.metadata.create_all(bind=engine)
-    TestingSessionLocal = Session(autocommit=False, autoflush=False, bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     def _override():
+        db = TestingSessionLocal()
         try:
-            db = TestingSessionLocal
             yield db
         finally:
             db.close()
@@ -117,3 +121,83 @@ def test_upload_unsupported_file_type(
 
     # Cleanup overrides
     app.dependency_overrides = {}
+
+
+def _docx_bytes(*paragraphs):
+    import docx
+    document = docx.Document()
+    for text in paragraphs:
+        document.add_paragraph(text)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+
+def test_reupload_returns_existing_profile_without_llm_call(
+    mock_llm_client,
+    override_get_db
+):
+    app.dependency_overrides[get_llm_client] = lambda: mock_llm_client
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+
+    resume = _docx_bytes("张三", "熟悉 Python 与 FastAPI")
+    first = client.post("/api/v1/profile/upload", files={"file": ("cv.docx", io.BytesIO(resume), DOCX_TYPE)})
+    second = client.post("/api/v1/profile/upload", files={"file": ("cv.docx", io.BytesIO(resume), DOCX_TYPE)})
+    # 文件不同但归一化后的文本相同（全角字符、多余空白）
+    reexported = _docx_bytes("张三  ", "熟悉　Ｐｙｔｈｏｎ 与 FastAPI")
+    third = client.post("/api/v1/profile/upload", files={"file": ("cv2.docx", io.BytesIO(reexported), DOCX_TYPE)})
+
+    assert [r.status_code for r in (first, second, third)] == [200, 200, 200]
+    assert len({r.json()["id"] for r in (first, second, third)}) == 1
+    mock_llm_client.analyze.assert_called_once()
+
+    # refresh=true 时重新分析
+    refreshed = client.post(
+        "/api/v1/profile/upload?refresh=true", files={"file": ("cv.docx", io.BytesIO(resume), DOCX_TYPE)}
+    )
+    assert refreshed.status_code == 200
+    assert refreshed.json()["id"] != first.json()["id"]
+    assert mock_llm_client.analyze.call_count == 2
+
+    app.dependency_overrides = {}
+
+
+def _sse_events(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_upload_resume_stream_sends_chunks_then_profile(override_get_db, mocker):
+    from app.services.fake_llm import FakeLLMClient
+    fake_llm = FakeLLMClient(seed=1)
+    app.dependency_overrides[get_llm_client] = lambda: fake_llm
+    app.dependency_overrides[get_db] = override_get_db
+    mocker.patch("app.api.v1.endpoints.profile.SessionLocal", side_effect=lambda: next(override_get_db()))
+    client = TestClient(app)
+
+    resume = _docx_bytes("李四", "熟悉 Go 与 Kubernetes")
+    response = client.post("/api/v1/profile/upload/stream", files={"file": ("cv.docx", io.BytesIO(resume), DOCX_TYPE)})
+    assert response.status_code == 200
+    events = _sse_events(response.text)
+    kinds = [event for event, _ in events]
+    assert kinds[-1] == "profile" and kinds.count("chunk") > 1
+    assert "".join(data["text"] for event, data in events if event == "chunk")
+    profile = events[-1][1]
+    assert profile["reused"] is False and profile["structured_profile"]["name"] == "模拟用户"
+
+    # 再次上传同一文件直接返回已有画像
+    again = _sse_events(client.post(
+        "/api/v1/profile/upload/stream", files={"file": ("cv.docx", io.BytesIO(resume), DOCX_TYPE)}
+    ).text)
+    assert again == [("profile", {**profile, "reused": True})]
+    assert fake_llm.calls == 1
+
+    app.dependency_overrides = {}
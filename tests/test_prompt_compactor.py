@@ -0,0 +1,49 @@
+import json
+
+from app.services import prompt_compactor
+from app.services.prompt_compactor import (
+    TRUNCATION_MARK, compact_json, compact_text, dedupe_text, estimate_tokens, strip_indentation,
+)
+
+
+def test_estimate_tokens_counts_chinese_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("数据分析") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_compact_json_drops_empty_fields_and_whitespace():
+    profile = {"name": "张三", "phone": "", "skills": ["Python", ""], "awards": [], "education": {"school": None}}
+    assert compact_json(profile) == '{"name":"张三","skills":["Python"]}'
+
+
+def test_compact_json_respects_budget_and_stays_valid():
+    profile = {"skills": ["Python"], "work_experience": [{"description": "负责后端开发。" * 200}]}
+    text = compact_json(profile, budget=200)
+    assert estimate_tokens(text) <= 200
+    data = json.loads(text)
+    assert data["skills"] == ["Python"]
+    assert data["work_experience"][0]["description"].endswith(TRUNCATION_MARK)
+
+
+def test_dedupe_text_removes_repeated_boilerplate():
+    text = "负责后端开发。  欢迎加入海尔！\n\n负责后端开发。\n熟悉 Python；欢迎加入海尔！"
+    assert dedupe_text(text) == "负责后端开发。欢迎加入海尔！\n熟悉 Python；"
+
+
+def test_compact_text_truncates_at_sentence_boundary():
+    text = "".join(f"第{i}条职责要求内容。" for i in range(100))
+    compacted = compact_text(text, budget=50)
+    assert estimate_tokens(compacted) <= 50
+    assert compacted.endswith("。" + TRUNCATION_MARK)
+    assert compact_text(None, budget=50) == "未提供"
+
+
+def test_strip_indentation():
+    assert strip_indentation("\n    a\n      b\n    ") == "a\nb"
+
+
+def test_section_budgets_come_from_settings(monkeypatch):
+    monkeypatch.setattr(prompt_compactor.settings, "PROMPT_JOB_REQUIREMENTS_TOKEN_BUDGET", 20)
+    compacted = prompt_compactor.compact_requirements("熟悉分布式系统设计。" * 20)
+    assert estimate_tokens(compacted) <= 20
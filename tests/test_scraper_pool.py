@@ -0,0 +1,550 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base_class import Base
+from app.models import Job
+from app.scraper.haier import CONTACT_XPATH, DETAIL_FIELD_XPATHS, HaierScraper, listing_fingerprint
+from app.scraper.rate_limiter import DomainRateLimiter
+from app.scraper.resources import ResourcePolicy, TrafficMeter
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages = []
+        self.listeners = []
+        self.routes = []
+
+    def on(self, event, handler):
+        self.listeners.append((event, handler))
+
+    async def route(self, pattern, handler):
+        self.routes.append((pattern, handler))
+
+    async def new_page(self):
+        page = FakePage(self)
+        self.pages.append(page)
+        return page
+
+    async def close(self):
+        self.browser.closed_contexts += 1
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+        self.closed_contexts = 0
+
+    async def new_context(self, **kwargs):
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+
+def test_rate_limiter_spaces_requests_per_domain():
+    now = [100.0]
+    limiter = DomainRateLimiter(2, jitter=0, clock=lambda: now[0])
+    delays = [limiter.reserve("https://maker.haier.net/a") for _ in range(3)]
+    assert delays == [0.0, 0.5, 1.0]
+    # 其他域名不受影响
+    assert limiter.reserve("https://example.com/") == 0.0
+    assert DomainRateLimiter(0).reserve("https://maker.haier.net/") == 0.0
+
+
+def test_page_workers_reuse_pages_and_survive_failures():
+    scraper = HaierScraper(db=None)
+    browser = FakeBrowser()
+    seen = []
+
+    async def handle(page, item):
+        seen.append((item, page))
+        await asyncio.sleep(0)
+        if item == 3:
+            await page.close()
+            raise RuntimeError("page crashed")
+
+    asyncio.run(scraper._run_page_workers(browser, range(10), handle, concurrency=3))
+
+    assert sorted(item for item, _ in seen) == list(range(10))
+    # 只创建 3 个上下文，结束后全部关闭；崩溃的页面被重新创建
+    assert len(browser.contexts) == 3 and browser.closed_contexts == 3
+    assert sum(len(c.pages) for c in browser.contexts) == 4
+    assert len({id(page) for _, page in seen}) < 10
+
+
+def test_failing_page_worker_cancels_and_closes_the_others():
+    scraper = HaierScraper(db=None)
+    browser = FakeBrowser()
+    created = []
+
+    async def new_context(**kwargs):
+        context = FakeContext(browser)
+        browser.contexts.append(context)
+        created.append(context)
+        if len(created) == 2:
+            async def broken_new_page():
+                raise RuntimeError("Target page, context or browser has been closed")
+            context.new_page = broken_new_page
+        return context
+
+    browser.new_context = new_context
+
+    async def handle(page, item):
+        await asyncio.sleep(10)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(asyncio.wait_for(scraper._run_page_workers(browser, range(10), handle, concurrency=3), 5))
+    # 其余工作协程被取消，所有上下文都已关闭
+    assert len(created) == 3 and browser.closed_contexts == 3
+
+
+class FakeListingPage:
+    """模拟列表接口：服务端每页最多返回 max_page_size 条，fail_pages 中的页前若干次请求失败。"""
+
+    def __init__(self, total, max_page_size=50, fail_pages=None):
+        self.total = total
+        self.max_page_size = max_page_size
+        self.fail_pages = dict(fail_pages or {})
+        self.requests = []
+        self.goto_kwargs = None
+
+    def on(self, event, handler):
+        pass
+
+    async def route(self, pattern, handler):
+        pass
+
+    async def goto(self, url, **kwargs):
+        self.goto_kwargs = kwargs
+
+    async def close(self):
+        pass
+
+    async def evaluate(self, script, url):
+        query = dict(part.split("=") for part in url.split("?")[1].split("&"))
+        page_no, page_size = int(query["page"]), min(int(query["pagesize"]), self.max_page_size)
+        self.requests.append((page_no, page_size))
+        if self.fail_pages.get(page_no, 0) > 0:
+            self.fail_pages[page_no] -= 1
+            raise RuntimeError("HTTP 502")
+        start = (page_no - 1) * page_size
+        items = [{"id": str(i), "job_name": f"job {i}"} for i in range(start, min(start + page_size, self.total))]
+        return {"data": {"count": self.total, "list": items}}
+
+
+class FakeListingBrowser:
+    def __init__(self, page):
+        self.page = page
+
+    async def new_page(self):
+        return self.page
+
+
+def _snapshot_scraper():
+    scraper = HaierScraper(db=None)
+    scraper.rate_limiter = DomainRateLimiter(0)
+    scraper.SNAPSHOT_RETRY_DELAY = 0
+    scraper.snapshot_page_size = 100
+    scraper.snapshot_max_attempts = 3
+    return scraper
+
+
+def test_snapshot_uses_server_page_size_and_retries_failed_pages():
+    page = FakeListingPage(total=420, fail_pages={3: 2})
+    snapshot, complete = asyncio.run(_snapshot_scraper()._get_online_snapshot(FakeListingBrowser(page)))
+
+    assert complete and len(snapshot) == 420
+    # 服务端把每页限制为 50 条，第 3 页失败两次后成功
+    assert {size for _, size in page.requests} == {50}
+    assert sorted({no for no, _ in page.requests}) == list(range(1, 10))
+    assert [no for no, _ in page.requests].count(3) == 3
+
+
+def test_incomplete_snapshot_is_flagged():
+    page = FakeListingPage(total=420, fail_pages={5: 10})
+    snapshot, complete = asyncio.run(_snapshot_scraper()._get_online_snapshot(FakeListingBrowser(page)))
+
+    assert not complete and len(snapshot) == 370
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def test_scrape_does_not_deactivate_on_incomplete_snapshot(monkeypatch, db):
+    snapshot = {"1": {"id": "1", "job_name": "job 1", "update_time": "2024-01-01"}}
+    for job_id in ("1", "2"):
+        db.add(Job(
+            title=f"job {job_id}", description="-", url=f"https://maker.haier.net/client/job/detail?id={job_id}",
+            source_site="haier", source_job_id=job_id, published_at="2024-01-01", is_active=True,
+            listing_fingerprint=listing_fingerprint(snapshot["1"]) if job_id == "1" else None
+        ))
+    db.commit()
+
+    scraper = HaierScraper(db=db)
+
+    async def fake_browser():
+        return None
+
+    async def fake_close(browser):
+        pass
+
+    async def fake_snapshot(browser, complete):
+        return snapshot, complete
+
+    monkeypatch.setattr(scraper, "_initialize_browser", fake_browser)
+    monkeypatch.setattr(scraper, "_close_browser", fake_close)
+
+    monkeypatch.setattr(scraper, "_get_online_snapshot", lambda browser: fake_snapshot(browser, False))
+    asyncio.run(scraper.scrape())
+    assert db.query(Job).filter(Job.is_active.is_(False)).count() == 0
+
+    monkeypatch.setattr(scraper, "_get_online_snapshot", lambda browser: fake_snapshot(browser, True))
+    asyncio.run(scraper.scrape())
+    assert [job.source_job_id for job in db.query(Job).filter(Job.is_active.is_(False))] == ["2"]
+
+
+async def _sequential_page_workers(browser, items, handler, concurrency=None):
+    """代替浏览器页面池：依次处理，page 为 None (详情提取也被替换)。"""
+    for item in items:
+        await handler(None, item)
+
+
+def test_upserts_are_written_in_committed_batches(db):
+    db.add(Job(
+        title="old", description="-", url="https://maker.haier.net/client/job/detail?id=1",
+        source_site="haier", source_job_id="1", published_at="2024-01-01", is_active=False
+    ))
+    db.commit()
+
+    scraper = HaierScraper(db=db)
+    scraper.write_batch_size = 2
+    scraper._db_jobs_map = {
+        row.source_job_id: row for row in db.query(Job.id, Job.source_job_id, Job.detail_fingerprint)
+    }
+    details = {"job_responsibilities": "职责", "job_requirements": "要求", "detailed_location": "青岛"}
+    for job_id in ("1", "2", "3"):
+        scraper._upsert_job({"id": job_id, "job_name": f"job {job_id}", "func_desc": "描述"}, details)
+
+    # 前两条已经写入并提交，第三条还在待写入的批次中
+    assert db.query(Job).count() == 2
+    scraper._flush_jobs()
+
+    jobs = {job.source_job_id: job for job in db.query(Job)}
+    assert set(jobs) == {"1", "2", "3"}
+    assert jobs["1"].title == "job 1" and jobs["1"].is_active and jobs["1"].job_requirements == "要求"
+    assert jobs["3"].company == "海尔集团" and jobs["3"].url.endswith("id=3")
+
+
+def test_save_jobs_inserts_only_new_urls(db):
+    db.add(Job(title="a", description="-", url="https://example.com/a", source_site="example"))
+    db.commit()
+
+    scraper = HaierScraper(db=db)
+    jobs = [
+        Job(title=name, description="-", url=f"https://example.com/{name}", source_site="example")
+        for name in ("a", "b", "b", "c")
+    ]
+    asyncio.run(scraper._save_jobs(jobs))
+    assert sorted(url for (url,) in db.query(Job.url)) == [f"https://example.com/{n}" for n in "abc"]
+
+
+def test_unchanged_content_is_not_rewritten_or_notified(monkeypatch, db):
+    item = {"id": "1", "job_name": "job 1", "func_desc": "描述", "update_time": "2024-01-01"}
+    details = {"job_responsibilities": "职责", "job_requirements": "要求", "detailed_location": "青岛", "contact_info": None}
+    fetched = []
+
+    async def fake_browser():
+        return None
+
+    async def fake_close(browser):
+        pass
+
+    async def fake_details(page, job_id):
+        fetched.append(job_id)
+        return current_details
+
+    def run(snapshot):
+        scraper = HaierScraper(db=db)
+        monkeypatch.setattr(scraper, "_initialize_browser", fake_browser)
+        monkeypatch.setattr(scraper, "_close_browser", fake_close)
+        monkeypatch.setattr(scraper, "_scrape_job_details", fake_details)
+        monkeypatch.setattr(scraper, "_run_page_workers", _sequential_page_workers)
+
+        async def fake_snapshot(browser):
+            return snapshot, True
+
+        monkeypatch.setattr(scraper, "_get_online_snapshot", fake_snapshot)
+        fetched.clear()
+        asyncio.run(scraper.scrape())
+        return scraper.last_delta
+
+    current_details = details
+    assert len(run({"1": item})["new_job_ids"]) == 1
+
+    # 列表完全不变：不获取详情
+    assert run({"1": item})["updated_job_ids"] == [] and fetched == []
+
+    # 只有更新时间变化：重新获取详情，但内容未变，不通知下游
+    bumped = {**item, "update_time": "2024-02-01"}
+    assert run({"1": bumped})["updated_job_ids"] == [] and fetched == ["1"]
+    assert db.query(Job).one().published_at == "2024-02-01"
+    assert run({"1": bumped})["updated_job_ids"] == [] and fetched == []
+
+    # 详情内容变化：写入并通知
+    current_details = {**details, "job_requirements": "新要求"}
+    delta = run({"1": {**bumped, "update_time": "2024-03-01"}})
+    assert len(delta["updated_job_ids"]) == 1
+    db.expire_all()
+    assert db.query(Job).one().job_requirements == "新要求"
+
+
+def test_relisted_inactive_jobs_are_reported_as_reactivated(monkeypatch, db):
+    item = {"id": "1", "job_name": "job 1", "func_desc": "描述", "update_time": "2024-01-01"}
+    details = {"job_responsibilities": "职责", "job_requirements": "要求", "detailed_location": "青岛", "contact_info": None}
+
+    async def fake_details(page, job_id):
+        return current_details
+
+    def run(snapshot):
+        scraper = HaierScraper(db=db)
+
+        async def fake_browser():
+            return None
+
+        async def fake_close(browser):
+            pass
+
+        async def fake_snapshot(browser):
+            return snapshot, True
+
+        monkeypatch.setattr(scraper, "_initialize_browser", fake_browser)
+        monkeypatch.setattr(scraper, "_close_browser", fake_close)
+        monkeypatch.setattr(scraper, "_scrape_job_details", fake_details)
+        monkeypatch.setattr(scraper, "_run_page_workers", _sequential_page_workers)
+        monkeypatch.setattr(scraper, "_get_online_snapshot", fake_snapshot)
+        asyncio.run(scraper.scrape())
+        db.expire_all()
+        return scraper.last_delta
+
+    other = {**item, "id": "2", "job_name": "job 2"}
+    current_details = details
+    job_pk = run({"1": item, "2": other})["new_job_ids"][0]
+    assert run({"2": other})["deactivated_job_ids"] == [job_pk]
+
+    # 下线后重新出现，列表更新时间变化但详情内容不变
+    delta = run({"1": {**item, "update_time": "2024-02-01"}, "2": other})
+    assert delta["reactivated_job_ids"] == [job_pk] and delta["updated_job_ids"] == [job_pk]
+    assert db.get(Job, job_pk).is_active
+
+    # 详情获取失败时按列表数据重新上线，不覆盖已有内容
+    assert run({"2": other})["deactivated_job_ids"] == [job_pk]
+    current_details = {}
+    delta = run({"1": {**item, "update_time": "2024-03-01"}, "2": other})
+    assert delta["reactivated_job_ids"] == [job_pk]
+    job = db.get(Job, job_pk)
+    assert job.is_active and job.job_requirements == "要求"
+
+
+def test_partial_details_and_legacy_rows_are_not_treated_as_changes(monkeypatch, db):
+    item = {"id": "1", "job_name": "job 1", "func_desc": "描述", "update_time": "2024-01-01"}
+    details = {"job_responsibilities": "职责", "job_requirements": "要求", "detailed_location": "青岛", "contact_info": None}
+    # 加入指纹之前写入的职位，没有列表与内容指纹
+    db.add(Job(
+        title="job 1", description="描述", url="https://maker.haier.net/client/job/detail?id=1", company="海尔集团",
+        source_site="haier", source_job_id="1", published_at="2024-01-01", is_active=True,
+        job_responsibilities="职责", job_requirements="要求", detailed_location="青岛",
+    ))
+    db.commit()
+
+    async def fake_details(page, job_id):
+        return current_details
+
+    def run(snapshot):
+        scraper = HaierScraper(db=db)
+
+        async def fake_browser():
+            return None
+
+        async def fake_close(browser):
+            pass
+
+        async def fake_snapshot(browser):
+            return snapshot, True
+
+        monkeypatch.setattr(scraper, "_initialize_browser", fake_browser)
+        monkeypatch.setattr(scraper, "_close_browser", fake_close)
+        monkeypatch.setattr(scraper, "_scrape_job_details", fake_details)
+        monkeypatch.setattr(scraper, "_run_page_workers", _sequential_page_workers)
+        monkeypatch.setattr(scraper, "_get_online_snapshot", fake_snapshot)
+        asyncio.run(scraper.scrape())
+        db.expire_all()
+        return scraper.last_delta
+
+    # 只提取到部分字段：不覆盖已有内容，不记录列表指纹
+    current_details = {"job_responsibilities": "职责"}
+    assert run({"1": item})["updated_job_ids"] == []
+    job = db.query(Job).one()
+    assert job.job_requirements == "要求" and job.listing_fingerprint is None
+
+    # 下次爬取重新获取完整详情；内容与升级前相同，不记为变化
+    current_details = details
+    assert run({"1": item})["updated_job_ids"] == []
+    assert db.query(Job).one().listing_fingerprint is not None
+
+
+def test_resource_policy_allow_lists_take_precedence():
+    policy = ResourcePolicy(
+        blocked_types={"image", "font", "stylesheet"}, allowed_types={"font"},
+        blocked_domains={"hm.baidu.com", "cnzz.com"}, allowed_domains={"static.haier.net"},
+    )
+    assert policy.should_block("image", "https://maker.haier.net/logo.png")
+    assert not policy.should_block("font", "https://maker.haier.net/icons.woff2")
+    assert not policy.should_block("script", "https://maker.haier.net/static/js/app.js")
+    # 禁止的域名包括子域名，与资源类型无关
+    assert policy.should_block("script", "https://hm.baidu.com/hm.js")
+    assert policy.should_block("xhr", "https://s4.cnzz.com/z.js")
+    # 允许的域名总是放行
+    assert not policy.should_block("image", "https://img.static.haier.net/banner.jpg")
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type, sizes=None):
+        self.url = url
+        self.resource_type = resource_type
+        self._sizes = sizes
+
+    async def sizes(self):
+        if self._sizes is None:
+            raise RuntimeError("Target page, context or browser has been closed")
+        return self._sizes
+
+
+class FakeRoute:
+    def __init__(self, request):
+        self.request = request
+        self.action = None
+
+    async def abort(self):
+        self.action = "abort"
+
+    async def fallback(self):
+        self.action = "fallback"
+
+
+def test_page_workers_route_requests_through_the_policy():
+    scraper = HaierScraper(db=None)
+    scraper.resource_policy = ResourcePolicy(blocked_types={"image"}, blocked_domains={"hm.baidu.com"})
+    browser = FakeBrowser()
+
+    async def handle(page, item):
+        pass
+
+    async def run():
+        await scraper._run_page_workers(browser, range(2), handle, concurrency=2)
+        routes = [FakeRoute(FakeRequest(url, kind)) for url, kind in (
+            ("https://maker.haier.net/a.png", "image"),
+            ("https://hm.baidu.com/hm.js", "script"),
+            ("https://maker.haier.net/client/job/detail?id=1", "document"),
+        )]
+        _, handler = browser.contexts[0].routes[0]
+        for route in routes:
+            await handler(route)
+        return routes
+
+    routes = asyncio.run(run())
+    assert all(len(context.routes) == 1 for context in browser.contexts)
+    assert [route.action for route in routes] == ["abort", "abort", "fallback"]
+    assert scraper.traffic.blocked == 2
+
+
+def test_resources_are_not_intercepted_unless_enabled(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "SCRAPER_BLOCK_RESOURCES", False)
+    scraper = HaierScraper(db=None)
+    browser = FakeBrowser()
+
+    async def handle(page, item):
+        pass
+
+    asyncio.run(scraper._run_page_workers(browser, range(1), handle))
+    context = browser.contexts[0]
+    # 流量统计始终开启
+    assert context.routes == [] and [event for event, _ in context.listeners] == ["requestfinished"]
+
+
+def test_traffic_meter_counts_bytes_per_page():
+    meter = TrafficMeter()
+    meter.pages = 2
+
+    async def run():
+        await meter._on_request_finished(FakeRequest("u", "document", {"responseHeadersSize": 200, "responseBodySize": 3000}))
+        await meter._on_request_finished(FakeRequest("u", "script", {"responseHeadersSize": -1, "responseBodySize": 1800}))
+        await meter._on_request_finished(FakeRequest("u", "script"))
+
+    asyncio.run(run())
+    assert meter.requests == 2 and meter.bytes == 5000
+    assert meter.summary()["bytes_per_page"] == 2500
+
+
+class FakeDetailPage:
+    def __init__(self):
+        self.calls = []
+
+    async def goto(self, url, **kwargs):
+        self.calls.append(("goto", kwargs))
+
+    async def wait_for_selector(self, selector, **kwargs):
+        self.calls.append(("wait_for_selector", selector))
+
+    async def wait_for_timeout(self, timeout):
+        self.calls.append(("wait_for_timeout", timeout))
+
+    def locator(self, xpath):
+        class Locator:
+            async def text_content(self, timeout=None):
+                return None if xpath == CONTACT_XPATH else f" {xpath[:10]} "
+
+        return Locator()
+
+
+def test_job_details_wait_for_fields_instead_of_network_idle():
+    scraper = _snapshot_scraper()
+    page = FakeDetailPage()
+    details = asyncio.run(scraper._scrape_job_details(page, "42"))
+
+    assert page.calls[0] == ("goto", {"wait_until": "domcontentloaded", "timeout": 30000})
+    assert page.calls[1] == ("wait_for_selector", DETAIL_FIELD_XPATHS["job_responsibilities"])
+    assert all(call[0] != "wait_for_timeout" for call in page.calls)
+    assert set(details) >= set(DETAIL_FIELD_XPATHS)
+    assert scraper.traffic.pages == 1
+
+
+def test_snapshot_page_does_not_wait_for_network_idle():
+    page = FakeListingPage(total=10)
+    asyncio.run(_snapshot_scraper()._get_online_snapshot(FakeListingBrowser(page)))
+    assert page.goto_kwargs == {"wait_until": "domcontentloaded"}